@@ -0,0 +1,117 @@
+"""Read the manifest of files for cic_batch, and keep a ledger of the results
+so that a re-run can skip the entries that have already completed."""
+
+import csv
+import json
+import os
+from datetime import datetime
+
+# keys that must be in each entry of the manifest
+REQUIRED_KEYS = ["input", "analysis"]
+# keys that may be in an entry of the manifest
+OPTIONAL_KEYS = ["output", "var", "group", "axis"]
+
+class ManifestError(Exception):
+    pass
+
+
+def _check_entry(entry, n, path):
+    """Check an entry in the manifest, and fill in the optional keys"""
+    for k in REQUIRED_KEYS:
+        if not entry.get(k):
+            raise ManifestError(
+                f"Entry {n} in manifest: {path} has no key: {k}"
+            )
+    checked = {k : entry[k] for k in REQUIRED_KEYS}
+    for k in OPTIONAL_KEYS:
+        checked[k] = entry.get(k) or None
+    # split the comma separated lists of variables and groups, as the
+    # command line does
+    for k in ["var", "group"]:
+        if isinstance(checked[k], str):
+            checked[k] = checked[k].split(",")
+    if checked["axis"] is not None:
+        checked["axis"] = int(checked["axis"])
+    return checked
+
+
+def read_manifest(path):
+    """Read a manifest of files to analyse and compress.  The manifest is
+    either a JSON file, containing a list of entries, or a CSV file with a
+    header line.  Each entry has the keys:
+        input    : the netCDF file to compress (and analyse)
+        analysis : the analysis file.  If it does not exist it is created by
+                   analysing the input of the first entry that names it
+        output   : (optional) the compressed file.  If not given, the entry
+                   is only analysed
+        var      : (optional) comma separated variables to analyse
+        group    : (optional) comma separated groups to analyse
+        axis     : (optional) axis to analyse
+
+    Args:
+        path (str) : the manifest file
+
+    Returns:
+        list<dict>: the entries in the manifest
+    """
+    try:
+        with open(path, "r") as fh:
+            if path.endswith(".json"):
+                entries = json.load(fh)
+            else:
+                entries = list(csv.DictReader(fh))
+    except FileNotFoundError:
+        raise ManifestError(f"Manifest file cannot be found: {path}")
+    except Exception as e:
+        raise ManifestError(f"Manifest file cannot be parsed: {path}, "
+                            f"reason: {e}")
+    if not isinstance(entries, list):
+        raise ManifestError(f"Manifest file is not a list of entries: {path}")
+    return [_check_entry(e, n, path) for n, e in enumerate(entries)]
+
+
+class Ledger:
+    """A record of the results of each stage (analyse or compress) for each
+    file.  The ledger is a file of JSON lines that is appended to as each
+    stage completes, so it survives the batch being interrupted."""
+
+    def __init__(self, path):
+        """
+        Args:
+            path (str) : the ledger file, created if it does not exist
+        Side effects:
+            self.completed (set) : the (stage, key) of the completed stages
+        """
+        self.path = path
+        self.completed = set()
+        if os.path.exists(path):
+            with open(path, "r") as fh:
+                for line in fh:
+                    try:
+                        rec = json.loads(line)
+                    except json.JSONDecodeError:
+                        # a partially written last line
+                        continue
+                    if rec.get("status") == "ok":
+                        self.completed.add((rec["stage"], rec["key"]))
+        self.fh = open(path, "a")
+
+    def done(self, stage, key):
+        """Check whether the stage has already completed for the key (a file
+        path), and the file still exists"""
+        return (stage, key) in self.completed and os.path.exists(key)
+
+    def record(self, stage, key, status, **info):
+        """Record the result of a stage in the ledger"""
+        rec = {"stage" : stage,
+               "key" : key,
+               "status" : status,
+               "date" : datetime.now().isoformat()}
+        rec.update(info)
+        self.fh.write(json.dumps(rec) + "\n")
+        self.fh.flush()
+        if status == "ok":
+            self.completed.add((stage, key))
+
+    def close(self):
+        self.fh.close()
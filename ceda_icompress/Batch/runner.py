@@ -0,0 +1,214 @@
+"""Run the analyse and compress stages for the entries in a manifest.  The
+stages are scheduled on an asyncio event loop, and the work is done in a pool
+of processes, so that the cost of starting Python and importing the modules
+is only paid once per worker, rather than once per file."""
+
+import asyncio
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from ceda_icompress.Batch.workqueue import WorkQueue
+
+class BatchError(Exception):
+    pass
+
+
+def _init_worker(workers):
+    """Share the CPUs between the kernel threads of the workers"""
+    from ceda_icompress.Kernels.registry import share_kernel_threads
+    share_kernel_threads(workers)
+
+
+def _run_captured(fn, *args):
+    """Run fn, capturing anything it prints (e.g. the debug info).  The errors
+    raised by the library are converted into a BatchError containing the
+    reason."""
+    from ceda_icompress.Core.errors import CICError
+    buf = io.StringIO()
+    try:
+        with redirect_stdout(buf):
+            fn(*args)
+    except CICError as e:
+        raise BatchError(str(e))
+    except SystemExit:
+        raise BatchError(buf.getvalue().strip() or "exited")
+
+
+def _analyse(input, analysis, var, group, axis):
+    """Worker for the analyse stage: analyse the input and write the analysis
+    file.  The file is written to a temporary name and then renamed, so a
+    partially written analysis file is never left behind."""
+    # import here so that the modules are imported in the worker
+    from ceda_icompress.api import analyse_dataset
+    from ceda_icompress.IO.analysisfile import write_analysis
+
+    def run():
+        analysis_dict = analyse_dataset(input, var, group, axis=axis).analysis
+        format = "npz" if analysis.endswith(".npz") else "json"
+        tmp = analysis + ".part"
+        write_analysis(analysis_dict, tmp, format)
+        os.replace(tmp, analysis)
+    _run_captured(run)
+
+
+def _compress(input, output, analysis, params):
+    """Worker for the compress stage: compress the input to the output, via a
+    temporary file."""
+    from ceda_icompress.api import compress_dataset
+
+    def run():
+        tmp = output + ".part"
+        # the manifest pairs the files with the analysis, so force the
+        # compression even if the analysis was made on a different file
+        compress_dataset(input, tmp, analysis, params, force=True)
+        os.replace(tmp, output)
+    _run_captured(run)
+
+
+class BatchRunner:
+    """Schedule the analyse and compress stages of the entries in a manifest,
+    with a limit on the number of each stage running at once."""
+
+    def __init__(self, entries, ledger, params, analyse_workers=1,
+                 compress_workers=1, retries=0, axis=0, debug=False):
+        """
+        Args:
+            entries (list<dict>) : the entries from read_manifest
+            ledger (Ledger)      : the ledger of results, or a WorkQueue to
+                                   share the stages with other workers
+            params (dict)        : parameters for compress_dataset
+            analyse_workers (int): maximum number of concurrent analyses
+            compress_workers(int): maximum number of concurrent compressions
+            retries (int)        : number of times to retry a failed stage
+            axis (int)           : default axis to analyse
+            debug (bool)         : provide debug info
+        """
+        self.entries = entries
+        self.ledger = ledger
+        self.shared = isinstance(ledger, WorkQueue)
+        self.params = params
+        self.analyse_workers = analyse_workers
+        self.compress_workers = compress_workers
+        self.retries = retries
+        self.axis = axis
+        self.debug = debug
+        self.counts = {"ok" : 0, "skipped" : 0, "failed" : 0}
+
+    def _report(self, stage, key, status, msg=""):
+        self.counts[status] += 1
+        if self.debug or status == "failed":
+            print(f"{stage:<9}: {status:<7} {key} {msg}")
+
+    async def _heartbeat(self, stage, key):
+        """Touch the claim on a stage while it is running"""
+        while True:
+            await asyncio.sleep(self.ledger.heartbeat)
+            self.ledger.touch(stage, key)
+
+    async def _run_stage(self, stage, key, input, sem, fn, *args):
+        """Run a stage in the process pool, retrying if it fails, and record
+        the result in the ledger.  Returns whether the stage succeeded.  A
+        shared stage is only claimed once this worker has a free slot for it,
+        so that the stages it cannot run yet are left to other workers."""
+        if self.ledger.done(stage, key):
+            self._report(stage, key, "skipped")
+            return True
+        if not self.shared:
+            async with sem:
+                return await self._run_attempts(stage, key, input, fn, *args)
+        while True:
+            async with sem:
+                if self.ledger.done(stage, key):
+                    # completed by another worker
+                    self._report(stage, key, "skipped", "(another worker)")
+                    return True
+                if self.ledger.claim(stage, key):
+                    heartbeat = asyncio.create_task(
+                        self._heartbeat(stage, key)
+                    )
+                    try:
+                        return await self._run_attempts(stage, key, input,
+                                                        fn, *args)
+                    finally:
+                        heartbeat.cancel()
+                        self.ledger.release(stage, key)
+            # claimed by another worker - give up the slot while waiting
+            await asyncio.sleep(self.ledger.poll)
+
+    async def _run_attempts(self, stage, key, input, fn, *args):
+        loop = asyncio.get_running_loop()
+        for attempt in range(0, self.retries+1):
+            st = time.time()
+            try:
+                await loop.run_in_executor(self.pool, fn, *args)
+            except Exception as e:
+                error = str(e)
+            else:
+                elapsed = time.time() - st
+                self.ledger.record(stage, key, "ok", time=elapsed,
+                                   attempts=attempt+1,
+                                   bytes_in=os.path.getsize(input),
+                                   bytes_out=os.path.getsize(key))
+                self._report(stage, key, "ok", f"({elapsed:.2f}s)")
+                return True
+            # back off before trying again
+            if attempt < self.retries:
+                await asyncio.sleep(0.1 * 2**attempt)
+        self.ledger.record(stage, key, "failed", error=error,
+                           attempts=self.retries+1)
+        self._report(stage, key, "failed", f"({error})")
+        return False
+
+    async def _analyse(self, entry):
+        analysis = entry["analysis"]
+        # an analysis file that already exists, and was not made by the
+        # batch, has been supplied by the user
+        if (os.path.exists(analysis) and
+                not self.ledger.done("analyse", analysis)):
+            return True
+        axis = entry["axis"] if entry["axis"] is not None else self.axis
+        return await self._run_stage(
+            "analyse", analysis, entry["input"], self.analyse_sem, _analyse,
+            entry["input"], analysis, entry["var"], entry["group"], axis
+        )
+
+    async def _compress(self, entry, analysis_task):
+        output = entry["output"]
+        if not await analysis_task:
+            self.ledger.record("compress", output, "failed",
+                               error="analysis failed")
+            self._report("compress", output, "failed", "(analysis failed)")
+            return False
+        return await self._run_stage(
+            "compress", output, entry["input"], self.compress_sem, _compress,
+            entry["input"], output, entry["analysis"], self.params
+        )
+
+    async def run(self):
+        """Run all the entries in the manifest.
+
+        Returns:
+            dict: the number of stages that were ok, skipped or failed
+        """
+        self.analyse_sem = asyncio.Semaphore(self.analyse_workers)
+        self.compress_sem = asyncio.Semaphore(self.compress_workers)
+        workers = self.analyse_workers + self.compress_workers
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(workers,)
+        ) as self.pool:
+            # each analysis is only done once, however many entries use it
+            analyses = {}
+            compressions = []
+            for entry in self.entries:
+                a = entry["analysis"]
+                if a not in analyses:
+                    analyses[a] = asyncio.create_task(self._analyse(entry))
+                if entry["output"]:
+                    compressions.append(asyncio.create_task(
+                        self._compress(entry, analyses[a])
+                    ))
+            await asyncio.gather(*analyses.values(), *compressions)
+        return self.counts
@@ -0,0 +1,202 @@
+"""Share the stages of a batch between workers on many nodes, using a
+directory on a shared (POSIX) filesystem.  No server or message broker is
+needed.
+
+A worker claims a stage by atomically creating a claim file (with O_EXCL).
+While the stage runs, the worker touches the claim file regularly.  A claim
+file that has not been touched for longer than the stale timeout belongs to a
+dead worker, and is broken so that another worker can claim the stage.  When
+a stage finishes, its result (and metrics) are written to a result file, and
+the claim is removed.
+
+The queue directory contains:
+    claims/   : a claim file for each stage currently running
+    results/  : a result file for each stage that has finished"""
+
+import hashlib
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime
+
+# default time, in seconds, after which a claim that has not been touched is
+# considered to belong to a dead worker
+DEFAULT_STALE_TIMEOUT = 600
+# default time, in seconds, between touching the claim files
+DEFAULT_HEARTBEAT = 30
+# default time, in seconds, between checking whether a stage claimed by
+# another worker has finished
+DEFAULT_POLL = 5
+
+class WorkQueueError(Exception):
+    pass
+
+
+class WorkQueue:
+    """A queue of stages shared between workers on a shared filesystem.  It
+    has the same done / record interface as Ledger, so it can replace it."""
+
+    def __init__(self, path, stale_timeout=DEFAULT_STALE_TIMEOUT,
+                 heartbeat=DEFAULT_HEARTBEAT, poll=DEFAULT_POLL):
+        """
+        Args:
+            path (str)          : the queue directory, created if it does not
+                                  exist
+            stale_timeout (int) : seconds after which a claim is stale
+            heartbeat (int)     : seconds between touching claim files
+            poll (int)          : seconds between checking claimed stages
+        """
+        self.path = path
+        self.stale_timeout = stale_timeout
+        self.heartbeat = heartbeat
+        self.poll = poll
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        try:
+            os.makedirs(os.path.join(path, "claims"), exist_ok=True)
+            os.makedirs(os.path.join(path, "results"), exist_ok=True)
+        except OSError as e:
+            raise WorkQueueError(f"Could not create queue directory: {path}, "
+                                 f"reason: {e}")
+
+    def _name(self, stage, key):
+        """Name of the files for a stage, from a hash of the stage and key"""
+        return hashlib.sha1(f"{stage}:{key}".encode()).hexdigest()
+
+    def _claim_path(self, stage, key):
+        return os.path.join(self.path, "claims", self._name(stage, key))
+
+    def _result_path(self, stage, key):
+        return os.path.join(self.path, "results", self._name(stage, key))
+
+    def result(self, stage, key):
+        """Get the result of a stage, or None if it has not finished"""
+        try:
+            with open(self._result_path(stage, key), "r") as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def done(self, stage, key):
+        """Check whether the stage has completed successfully"""
+        res = self.result(stage, key)
+        return res is not None and res["status"] == "ok"
+
+    def _break_stale(self, claim):
+        """Remove a claim if it is stale.  The claim is first renamed to a
+        unique name, so that only one worker can break it.  If the renamed
+        claim turns out to be a new claim (another worker broke the stale
+        claim and made a new one in between), it is restored."""
+        try:
+            st = os.stat(claim)
+        except FileNotFoundError:
+            return
+        if time.time() - st.st_mtime < self.stale_timeout:
+            return
+        broken = f"{claim}.stale.{uuid.uuid4().hex}"
+        try:
+            os.rename(claim, broken)
+        except FileNotFoundError:
+            return
+        if os.stat(broken).st_ino != st.st_ino:
+            # not the stale claim - put it back, unless it has been replaced
+            try:
+                os.link(broken, claim)
+            except FileExistsError:
+                pass
+        os.remove(broken)
+
+    def claim(self, stage, key):
+        """Try to claim a stage for this worker.  A stage that has failed can
+        be claimed again, so that it is retried when the batch is run again,
+        as with the ledger.
+
+        Returns:
+            bool: whether this worker now owns the stage
+        """
+        claim = self._claim_path(stage, key)
+        self._break_stale(claim)
+        try:
+            fd = os.open(claim, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w") as fh:
+            json.dump({"stage" : stage,
+                       "key" : key,
+                       "worker" : self.worker,
+                       "date" : datetime.now().isoformat()}, fh)
+        # the stage may have completed between checking and claiming it
+        if self.done(stage, key):
+            self.release(stage, key)
+            return False
+        return True
+
+    def touch(self, stage, key):
+        """Show that the worker owning the stage is still alive"""
+        try:
+            os.utime(self._claim_path(stage, key))
+        except FileNotFoundError:
+            pass
+
+    def release(self, stage, key):
+        """Remove the claim on a stage"""
+        try:
+            os.remove(self._claim_path(stage, key))
+        except FileNotFoundError:
+            pass
+
+    def record(self, stage, key, status, **info):
+        """Record the result of a stage and release the claim on it.  The
+        result is written to a temporary file and renamed, so it is never
+        read partially written."""
+        rec = {"stage" : stage,
+               "key" : key,
+               "status" : status,
+               "worker" : self.worker,
+               "date" : datetime.now().isoformat()}
+        rec.update(info)
+        path = self._result_path(stage, key)
+        tmp = f"{path}.{uuid.uuid4().hex}"
+        with open(tmp, "w") as fh:
+            json.dump(rec, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+        self.release(stage, key)
+
+    def results(self):
+        """Iterate over the results of all the finished stages"""
+        rdir = os.path.join(self.path, "results")
+        for name in os.listdir(rdir):
+            try:
+                with open(os.path.join(rdir, name), "r") as fh:
+                    yield json.load(fh)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+
+    def summary(self):
+        """Aggregate the results and metrics of all the finished stages, from
+        all the workers.
+
+        Returns:
+            dict: for each stage, the number of stages ok and failed, the
+                  total time taken and the total bytes read and written
+        """
+        summary = {}
+        for rec in self.results():
+            s = summary.setdefault(rec["stage"], {
+                "ok" : 0, "failed" : 0, "time" : 0.0,
+                "bytes_in" : 0, "bytes_out" : 0, "workers" : set()
+            })
+            s[rec["status"]] = s.get(rec["status"], 0) + 1
+            s["time"] += rec.get("time", 0.0)
+            s["bytes_in"] += rec.get("bytes_in", 0)
+            s["bytes_out"] += rec.get("bytes_out", 0)
+            s["workers"].add(rec["worker"])
+        for s in summary.values():
+            s["workers"] = len(s["workers"])
+        return summary
+
+    def close(self):
+        pass
@@ -4,6 +4,7 @@ from ceda_icompress.BitManipulation.bitmasks import (
     get_sigexp_bitmask, get_man_bitmask, get_bitgroom_bitmask
 )
 from ceda_icompress.BitManipulation.bitmanip import BitManipulation
+from ceda_icompress.Kernels.registry import get_kernel
 
 class BitGroom(BitManipulation):
     """Reduce the information content in an array by quantising each element in
@@ -40,6 +41,7 @@ class BitGroom(BitManipulation):
         # the groom mask is the alternating 0s and 1s AND-ed with the logical not
         # of the above mask
         self.groom_mask = get_bitgroom_bitmask(A.dtype) & ~self.mask
+        self.keep_mask = self.mask
         self.method = "bitgroom"
 
     def process(self, A):
@@ -54,13 +56,12 @@ class BitGroom(BitManipulation):
             numpy array: the quantised array
         """
         # get a view of the array as the uint
-        Av = A.view(dtype=self.t_uint)
+        Av = np.ma.getdata(A).view(dtype=self.t_uint)
 
         # for bitgroom, we logical AND the same mask as bitshave (set all to zero)
         # then we logical OR with the groom mask
-        Ar = np.ma.bitwise_and(Av, self.mask)
-        Ar = np.ma.bitwise_or(Ar, self.groom_mask)
+        Ar = get_kernel("bitmanipulate")(Av, self.mask, self.groom_mask)
 
-        # convert back to the original type
-        Ar = Ar.view(dtype=A.dtype)
-        return Ar
\ No newline at end of file
+        # convert back to the original type, with the mask of A
+        return np.ma.masked_array(Ar.view(dtype=A.dtype),
+                                  mask=np.ma.getmask(A))
\ No newline at end of file
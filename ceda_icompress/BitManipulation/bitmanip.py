@@ -12,6 +12,11 @@ class BitManipulation:
     def __init__(self, A, NSB, analysis, ci):
         """Side effects:
             self.t_uint (str) : the type of array A
+        Derived classes also set:
+            self.mask (int)      : the mask used by process
+            self.keep_mask (int) : the bits that are retained from the
+                                   original values by process
+            self.method (str)    : the name of the method
         """
 
         # NSB = number of signficant bits, -1 to derive NSB from bitinfo
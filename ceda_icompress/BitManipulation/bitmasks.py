@@ -1,7 +1,9 @@
-# bit masks for float16, float32 and float64
+# bit masks for float16, float32 and float64, and the integer types
 import numpy as np
 
 import sys
+from ceda_icompress.InfoMeasures.whichUint import whichUint
+from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
 
 def get_sig_bitmask(t=np.float32):
     """Get the bitmask for the sign bit for different datatypes.
@@ -183,3 +185,31 @@ def get_bitgroom_bitmask(t=np.float32):
         # system is a big endian
         mask = mask.byteswap()
     return mask
+
+
+def get_int_bitmask(t=np.int32, NSB=64):
+    """Get the bitmask for the magnitude of an integer that is truncated after
+    the NSB.  The magnitude bits are found from the layout of the integer
+    given by getsigmanexp: all of the bits of an unsigned integer, and all but
+    the sign bit of a signed integer.  Unlike the masks for the floating point
+    types, the mask is applied to the magnitude of the values, rather than
+    their bits, and so is in the native byte order.
+
+    Args:
+        t (numpy dtype): type of array to get magnitude bitmask for
+        NSB (int)) : number of significant bits to retain in the magnitude
+
+    Returns:
+        uint8|uint16|uint32|uint64: the bitmask for the magnitude
+    """
+    t = np.dtype(t)
+    if t.kind not in ["i", "u"]:
+        raise TypeError("Unsupported type for get_int_bitmask : {}".format(t))
+    t_uint = whichUint(t.newbyteorder("="))
+    _, man, _ = getsigmanexp(t)
+    n_bits = man[1] - man[0]
+    NSB = max(0, min(NSB, n_bits))
+    mask = t_uint(0)
+    for x in range(n_bits-NSB, n_bits):
+        mask |= t_uint(1) << t_uint(x)
+    return mask
@@ -4,6 +4,7 @@ from ceda_icompress.BitManipulation.bitmasks import (
     get_sigexp_bitmask, get_man_bitmask
 )
 from ceda_icompress.BitManipulation.bitmanip import BitManipulation
+from ceda_icompress.Kernels.registry import get_kernel
 
 class BitSet(BitManipulation):
     """Reduce the information content in an array by rounding up (quantising)
@@ -34,6 +35,7 @@ class BitSet(BitManipulation):
         # for bitset, the mask is the bitwise logical not of the mask for
         # the bit shave
         self.mask = ~(bit_mask | man_mask)
+        self.keep_mask = bit_mask | man_mask
         self.method = "bitset"
 
     def process(self, A):
@@ -45,9 +47,11 @@ class BitSet(BitManipulation):
             numpy array: the quantised array
         """
         # get a view of the array as the uint
-        Av = A.view(dtype=self.t_uint)
-        # do the bitwise and between the mask and the uint array
-        Ar = np.ma.bitwise_or(Av, self.mask)
-        # convert back to the original type
-        Ar = Ar.view(dtype=A.dtype)
-        return Ar
\ No newline at end of file
+        Av = np.ma.getdata(A).view(dtype=self.t_uint)
+        # do the bitwise or between the mask and the uint array
+        Ar = get_kernel("bitmanipulate")(
+            Av, np.iinfo(self.t_uint).max, self.mask
+        )
+        # convert back to the original type, with the mask of A
+        return np.ma.masked_array(Ar.view(dtype=A.dtype),
+                                  mask=np.ma.getmask(A))
\ No newline at end of file
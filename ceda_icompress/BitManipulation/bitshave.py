@@ -4,6 +4,7 @@ from ceda_icompress.BitManipulation.bitmasks import (
     get_sigexp_bitmask, get_man_bitmask
 )
 from ceda_icompress.BitManipulation.bitmanip import BitManipulation
+from ceda_icompress.Kernels.registry import get_kernel
 
 class BitShave(BitManipulation):
     """Reduce the information content in an array by rounding down 
@@ -32,6 +33,7 @@ class BitShave(BitManipulation):
         # get the bit mask for the mantissa
         man_mask = get_man_bitmask(A.dtype, self.NSB)
         self.mask = bit_mask | man_mask
+        self.keep_mask = self.mask
         self.method = "bitshave"
 
     def process(self, A):
@@ -43,9 +45,9 @@ class BitShave(BitManipulation):
             numpy array: the quantised array
         """
         # get a view of the array as the uint
-        Av = A.view(dtype=self.t_uint)
+        Av = np.ma.getdata(A).view(dtype=self.t_uint)
         # do the bitwise and between the mask and the uint array
-        Ar = np.ma.bitwise_and(Av, self.mask)
-        # convert back to the original type
-        Ar = Ar.view(dtype=A.dtype)
-        return Ar
\ No newline at end of file
+        Ar = get_kernel("bitmanipulate")(Av, self.mask, 0)
+        # convert back to the original type, with the mask of A
+        return np.ma.masked_array(Ar.view(dtype=A.dtype),
+                                  mask=np.ma.getmask(A))
\ No newline at end of file
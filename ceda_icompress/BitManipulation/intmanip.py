@@ -0,0 +1,129 @@
+import numpy as np
+
+from ceda_icompress.BitManipulation.bitmasks import get_int_bitmask
+from ceda_icompress.BitManipulation.bitmanip import BitManipulation
+from ceda_icompress.InfoMeasures.whichUint import whichUint
+from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
+
+class IntShave(BitManipulation):
+    """Reduce the information content in an array of integers by rounding
+    (quantising) each element towards zero.  The quantisation is acheived by
+    setting the bits of the magnitude of each element to zero after the NSB
+    bit.  (NSB = number of significant bits)
+
+    The integers are treated as a sign and a magnitude, as the floating point
+    types are, so that negative values are quantised in the same way as
+    positive values, rather than being rounded towards minus infinity, as
+    zeroing the bits of a two's complement integer would do."""
+
+    def __init__(self, A, NSB=None, analysis=None, ci=None):
+        """Initialise the IntShave by deriving the bitmask from the inputs
+        Args:
+            A (numpy array)  : the array that is to be processed
+            NSB (int)        : override the number of bits, if the user has
+                               requested
+            analysis (dict)  : result of cic_analyse
+            ci (float)       : confidence interval, e.g. 0.99
+        Side effects:
+            self.mask (int)      : the mask of the magnitude
+            self.keep_mask (int) : the mask of the magnitude, and the sign bit
+        """
+        # check that the type is compatible, an 8, 16, 32 or 64 bit integer
+        dtype = np.dtype(A.dtype)
+        if dtype.kind not in ["i", "u"]:
+            raise TypeError("Unsupported type for intshave : {}".format(
+                                A.dtype
+                            ))
+        # the values are processed in the native byte order
+        self.t_native = dtype.newbyteorder("=")
+        self.t_uint = whichUint(self.t_native)
+        self.get_NSB(NSB, analysis, ci)
+        # the number of bits in the magnitude
+        sig, man, _ = getsigmanexp(dtype)
+        self.n_bits = man[1] - man[0]
+        self.drop = self.n_bits - max(0, min(self.NSB, self.n_bits))
+        self.mask = get_int_bitmask(dtype, self.NSB)
+        # the bits retained, as positioned in the bit information.  This is
+        # also the mask of the magnitude, as the magnitude of the most
+        # negative number is in the place of the sign bit
+        self.keep_mask = self.mask
+        if dtype.kind == "i":
+            self.keep_mask |= self.t_uint(1) << self.t_uint(self.n_bits)
+        self.method = "intshave"
+
+    def magnitude(self, A):
+        """Split the integers into a sign and a magnitude
+        Args:
+            A (numpy array): array of integers, not masked
+        Returns:
+            numpy array, numpy array: whether each element is negative, and
+                                      its magnitude, as an unsigned integer
+        """
+        A = A.astype(self.t_native, copy=False)
+        Av = A.view(dtype=self.t_uint)
+        if self.t_native.kind == "u":
+            return np.zeros(A.shape, dtype=bool), Av
+        neg = A < 0
+        # the magnitude of the most negative number fits in the unsigned type
+        mag = np.where(neg, ~Av + self.t_uint(1), Av).astype(self.t_uint)
+        return neg, mag
+
+    def signed(self, neg, mag, A):
+        """Join the sign and magnitude back into the type of A, keeping the
+        mask of A"""
+        Bv = np.where(neg, ~mag + self.t_uint(1), mag).astype(self.t_uint)
+        B = Bv.view(dtype=self.t_native).astype(A.dtype, copy=False)
+        if np.ma.isMaskedArray(A):
+            B = np.ma.masked_array(B, mask=np.ma.getmask(A),
+                                   fill_value=A.fill_value)
+        return B
+
+    def quantise(self, neg, mag):
+        """Quantise the magnitude"""
+        return np.bitwise_and(mag, self.keep_mask)
+
+    def process(self, A):
+        """
+        Args:
+            A (numpy array): array to quantise by rounding bits.
+                            array should be an integer type
+        Returns:
+            numpy array: the quantised array
+        """
+        if self.drop == 0:
+            return A
+        neg, mag = self.magnitude(np.ma.getdata(A))
+        return self.signed(neg, self.quantise(neg, mag), A)
+
+
+class IntRound(IntShave):
+    """Reduce the information content in an array of integers by rounding
+    (quantising) each element to the nearest value with zeros after the NSB
+    bit of its magnitude.  Ties are rounded to the value whose last retained
+    bit is zero (round half to even), so that the rounding is not biased.
+    Values that would round beyond the range of the type are rounded towards
+    zero instead."""
+
+    def __init__(self, A, NSB=None, analysis=None, ci=None):
+        """Initialise the IntRound, see IntShave"""
+        super().__init__(A, NSB, analysis, ci)
+        # the largest magnitude of a positive and negative value
+        info = np.iinfo(self.t_native)
+        self.max_pos = self.t_uint(info.max)
+        self.max_neg = self.t_uint(-int(info.min))
+        self.method = "intround"
+
+    def quantise(self, neg, mag):
+        """Round the magnitude to the nearest, with ties to even"""
+        one = self.t_uint(1)
+        drop = self.t_uint(self.drop)
+        # half of the last retained bit, less one unless the last retained bit
+        # is set, so that ties round to even
+        half = (one << (drop - one)) - one
+        odd = np.bitwise_and(np.right_shift(mag, drop), one)
+        rounded = np.bitwise_and(mag + half + odd, self.keep_mask)
+        # rounding up can overflow the magnitude, or the type
+        limit = np.where(neg, self.max_neg, self.max_pos)
+        over = (rounded < mag) | (rounded > limit)
+        shaved = np.bitwise_and(mag, self.keep_mask)
+        return np.where(over, shaved, rounded).astype(self.t_uint)
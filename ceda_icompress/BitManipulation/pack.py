@@ -0,0 +1,162 @@
+import numpy as np
+
+from ceda_icompress.BitManipulation.bitmasks import (
+    get_sigexp_bitmask, get_man_bitmask
+)
+from ceda_icompress.BitManipulation.bitmanip import BitManipulation
+from ceda_icompress.Conversion.narrowing import SIGNED_TYPES
+
+# attributes of a packed variable that are in the packed type, see the CF
+# conventions
+PACKED_ATTS = ["valid_min", "valid_max", "valid_range"]
+
+class Pack(BitManipulation):
+    """Reduce the size of an array by packing it into a smaller integer type,
+    with a scale_factor and add_offset, as in the CF conventions.  The
+    quantisation step is derived from the number of significant bits (NSB):
+    the step is that of the largest value in the array after setting the
+    bits after the NSB bit to zero.  The smallest integer type with enough
+    values to quantise the range of the array at that step is used.  As the
+    values are rounded to the nearest step, rather than towards zero, the
+    error is half of that of bitshave.
+
+    Unlike the other methods, process returns an array of a different type,
+    and set_range must be called first, with the range of the whole
+    variable."""
+
+    def __init__(self, A, NSB=None, analysis=None, ci=None):
+        """Initialise the Pack by deriving the number of significant bits
+        from the inputs
+        Args:
+            A (numpy array)  : the array that is to be processed
+            NSB (int)        : override the number of bits, if the user has
+                               requested
+            analysis (dict)  : result of cic_analyse
+            ci (float)       : confidence interval, e.g. 0.99
+        Side effects:
+            self.mask (int)      : the bitshave mask of the same precision,
+                                   used to describe the precision retained
+            self.packed_type     : the integer type, set by set_range
+        """
+        super().__init__(A, NSB, analysis, ci)
+        self.get_NSB(NSB, analysis, ci)
+        self.dtype = np.dtype(A.dtype)
+        bit_mask = get_sigexp_bitmask(A.dtype)
+        man_mask = get_man_bitmask(A.dtype, self.NSB)
+        self.mask = bit_mask | man_mask
+        self.keep_mask = self.mask
+        self.packed_type = None
+        self.scale_factor = None
+        self.add_offset = None
+        self.fill_value = None
+        self.method = "pack"
+
+    def set_range(self, vmin, vmax):
+        """Choose the packed type, scale_factor and add_offset for the range
+        of the variable.  The smallest value of the packed type is reserved
+        for the _FillValue.
+        Args:
+            vmin, vmax (float) : the range of the (finite, unmasked) values,
+                                 or None if there are none
+        Side effects:
+            self.packed_type (numpy dtype) : the integer type
+            self.scale_factor, self.add_offset (float) : in the type of the
+                                 array, to unpack the values
+            self.fill_value (int)          : the _FillValue of packed type
+        """
+        if vmin is None:
+            vmin = vmax = 0.0
+        vmin = float(vmin)
+        vmax = float(vmax)
+        # the quantisation step of the largest value, if bit shaved, which is
+        # a power of two and so exactly representable as the scale_factor
+        largest = max(abs(vmin), abs(vmax))
+        if largest > 0:
+            step = 2.0 ** (np.floor(np.log2(largest)) - self.NSB)
+        else:
+            step = 1.0
+        # the offset is the middle of the range, on a multiple of the step,
+        # so that it is also exactly representable
+        offset = np.rint((vmin + vmax) / 2 / step) * step
+        lo = np.rint((vmin - offset) / step)
+        hi = np.rint((vmax - offset) / step)
+        # the smallest type with enough values, less one for the _FillValue
+        for t in SIGNED_TYPES:
+            info = np.iinfo(t)
+            if lo > info.min and hi <= info.max:
+                break
+        else:
+            # not enough values in the largest type, so use a larger step
+            step = (vmax - vmin) / (int(info.max) - int(info.min) - 1)
+            offset = (vmin + vmax) / 2
+        self.set_packing(t, step, offset)
+
+    def set_packing(self, packed_type, scale_factor, add_offset):
+        """Set the packed type, scale_factor and add_offset directly, e.g.
+        from the attributes of a variable that has already been packed.
+        Args:
+            packed_type (numpy dtype)         : the signed integer type
+            scale_factor, add_offset (float) : to unpack the values
+        Side effects:
+            see set_range
+        """
+        self.packed_type = np.dtype(packed_type)
+        info = np.iinfo(self.packed_type)
+        self.fill_value = self.packed_type.type(info.min)
+        self.imin = int(info.min) + 1
+        self.imax = int(info.max)
+        self.scale_factor = self.dtype.type(scale_factor)
+        self.add_offset = self.dtype.type(add_offset)
+
+    def attributes(self, atts):
+        """Get the attributes of the packed variable, from those of the
+        original variable.
+        Args:
+            atts (dict) : the attributes of the original variable
+        Returns:
+            dict: the attributes to set on the packed variable, the
+                  _FillValue is not included as it is set when the variable is
+                  created
+        """
+        atts = dict(atts)
+        atts.pop("_FillValue", None)
+        if "missing_value" in atts:
+            atts["missing_value"] = self.fill_value
+        for a in PACKED_ATTS:
+            if a in atts:
+                atts[a] = self.pack_values(np.atleast_1d(atts[a]))
+                if atts[a].size == 1:
+                    atts[a] = atts[a][0]
+        atts["scale_factor"] = self.scale_factor
+        atts["add_offset"] = self.add_offset
+        return atts
+
+    def pack_values(self, A):
+        """Pack the values in A, which are all finite, clipping them to the
+        range of the packed type"""
+        P = np.rint(
+            (np.asarray(A, dtype=np.float64) - float(self.add_offset)) /
+            float(self.scale_factor)
+        )
+        return np.clip(P, self.imin, self.imax).astype(self.packed_type)
+
+    def process(self, A):
+        """
+        Args:
+            A (numpy array): array to pack.
+                            array should be float16, float32 or float64
+        Returns:
+            numpy masked array: the packed array, masked where A is masked,
+                            NaN or infinite
+        """
+        if self.packed_type is None:
+            raise ValueError("Pack.set_range has not been called")
+        data = np.ma.getdata(A)
+        mask = np.ma.getmaskarray(A) | ~np.isfinite(data)
+        P = self.pack_values(np.where(mask, self.add_offset, data))
+        return np.ma.masked_array(P, mask=mask, fill_value=self.fill_value)
+
+    def unpack(self, P):
+        """Unpack the packed array P, as the netCDF library does"""
+        B = np.ma.getdata(P) * self.scale_factor + self.add_offset
+        return np.ma.masked_array(B, mask=np.ma.getmaskarray(P))
@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+"""A single cic command, with the other commands as subcommands, e.g.
+cic analyse, cic compress.  The module of a subcommand is only imported when
+the subcommand is run, and the modules only import numpy and netCDF4 when
+they do some work, so that cic --help and cic display start quickly."""
+import click
+import importlib
+
+# the subcommands: the module and click command that implement them, and a
+# short help, so that cic --help does not import the modules
+SUBCOMMANDS = {
+    "analyse"  : ("ceda_icompress.CLI.cic_analyse", "analyse",
+                  "Analyse the netCDF file to determine compression "
+                  "settings."),
+    "display"  : ("ceda_icompress.CLI.cic_display", "display",
+                  "Display the analysis output of cic_analyse.py"),
+    "compress" : ("ceda_icompress.CLI.cic_compress", "compress",
+                  "Apply the compression to a netCDF using the analysis "
+                  "derived earlier"),
+    "explore"  : ("ceda_icompress.CLI.cic_explore", "explore",
+                  "Explore the compressed size and error of every bit "
+                  "manipulation method"),
+    "batch"    : ("ceda_icompress.CLI.cic_batch", "batch",
+                  "Analyse and compress the netCDF files listed in a "
+                  "manifest"),
+    "server"   : ("ceda_icompress.CLI.cic_server", "server",
+                  "Run a server that compresses netCDF files on request"),
+    "submit"   : ("ceda_icompress.CLI.cic_submit", "submit_job",
+                  "Submit a netCDF file to a running cic_server"),
+}
+
+class LazyGroup(click.Group):
+    """A click group that imports the module of a subcommand when it is
+    run"""
+
+    def list_commands(self, ctx):
+        return list(SUBCOMMANDS)
+
+    def get_command(self, ctx, name):
+        if name not in SUBCOMMANDS:
+            return None
+        module, command, short_help = SUBCOMMANDS[name]
+        return getattr(importlib.import_module(module), command)
+
+    def format_commands(self, formatter_ctx, formatter):
+        rows = [(name, SUBCOMMANDS[name][2]) for name in SUBCOMMANDS]
+        with formatter.section("Commands"):
+            formatter.write_dl(rows)
+
+
+@click.group(
+    cls=LazyGroup,
+    help="Lossy compression of netCDF files, using the bit information to "
+         "choose how many bits to keep"
+)
+def cic():
+    pass
+
+def main():
+    cic()
+
+if __name__ == "__main__":
+    main()
@@ -1,107 +1,9 @@
 #! /usr/bin/env python
 import click
-from netCDF4 import Dataset
 import sys
-from datetime import datetime
-import json
-import time
-import numpy as np
-import os.path
-from ceda_icompress.InfoMeasures.bitcount import bitcount
-from ceda_icompress.InfoMeasures.bitinformation import bitinformation
-from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
-from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
-
-def load_dataset(file):
-    try:
-        ds = Dataset(file)
-    except FileNotFoundError as e:
-        print(e)
-        sys.exit(0)
-    except OSError as e:
-        print(e)
-        sys.exit(0)
-    return ds
-
-def get_groups(dataset, group):
-    if group is not None:
-        try:
-            grps = [dataset.groups[g] for g in group]
-        except KeyError as e:
-            print(f"Group(s) not found: {group}")
-            sys.exit(0)
-    else:
-        # get the groups
-        grps = [dataset.groups[g] for g in dataset.groups]
-        # append the dataset (which is derived from a group)
-        grps.append(dataset)
-    return grps
-
-def get_vars(grp, var):
-    if var is not None:
-        try:
-            vars = [grp.variables[v] for v in var]
-        except KeyError as e:
-            print(f"Variable(s) not found: {var} in group: {grp.name}")
-            sys.exit(0)
-    else:
-        vars = [grp.variables[v] for v in grp.variables]
-    return vars
-
-def analyse_var(var, tstart, tend, level, axis, debug=False):
-    """Analyse the variable to get the bitcount and the bitinformation"""
-    # return dictionary
-    var_dict = {}
-    # form the index / slice
-    s = []
-
-    for d in var.dimensions:
-        if d == "time" or d == "t":
-            s.append(slice(tstart,tend))
-        elif "lev" in d and level is not None:
-            ls = level
-            le = ls + 1
-            s.append(slice(ls,le))
-        else:
-            s.append(slice(None))
-    if len(s) == 0:
-        s = 0
-    elif len(s) == 1:
-        s = s[0]
-    
-    data = var[s]
-
-    if debug:
-        print(f"Analysing variable {var.name}, with shape: {data.shape}")
-
-    # right shift on 64 bit numbers & python types not supported by numpy
-    if data.dtype in [np.uint64, np.int64, np.float64, '<f8', '>f8', float, int]:
-        print(f"    variable {var.name} is 64 bit and compression is not "
-               "currently supported")
-        return var_dict # empty var dict
-
-    # get the bit information
-    st = time.time()
-    bi = bitinformation(data, axis)
-    ed = time.time()
-    if debug:
-        print("    Bit information time taken: ", ed-st)
-    # get the sign, exponent and mantissa bits
-    sig, man, exp = getsigmanexp(data.dtype)
-    var_dict["time_start"] = tstart
-    var_dict["time_end"] = tend
-    var_dict["level"] = level
-    var_dict["axis"] = axis
-    var_dict["elements"] = int(data.count())
-    var_dict["type"] = data.dtype.name
-    var_dict["itemsize"] = data.dtype.itemsize          # bits
-    var_dict["byteorder"] = data.dtype.byteorder
-    var_dict["signbit"] = sig
-    var_dict["manbit"] = man
-    var_dict["expbit"] = exp
-    var_dict["bitinfo"] = bi.tolist()
-    return var_dict
-
+from ceda_icompress.IO.analysisfile import (write_analysis, FORMATS,
+    AnalysisFileError)
+from ceda_icompress.Core.errors import CICError
 
 @click.command(
     help="Analyse the netCDF file to determine compression settings."
@@ -118,51 +20,64 @@ def analyse_var(var, tstart, tend, level, axis, debug=False):
               help="Level number to analyse")
 @click.option("-x", "--axis", default=0, type=int,
               help="Axis number to analyse")
+@click.option("-b", "--batch", default=None, type=str,
+              help="Comma separated dimensions to also calculate the bit "
+                   "information for each index of, e.g. lev")
+@click.option("-T", "--threads", default=None, type=int,
+              help="Number of threads to run the analysis on (default: the "
+                   "number of CPUs)")
 @click.option("-o", "--output", default=None, type=str,
               help="Output file name")
+@click.option("-f", "--format", default=None, type=click.Choice(FORMATS),
+              help="Format of output file (default: npz if the output file "
+                   "name ends in .npz, json otherwise)")
 @click.option("-D", "--debug", default=False, is_flag=True,
               help="Provide debug info")
 @click.argument("file", type=str)
-def analyse(file, var, group, tstart, tend, level, axis, output, debug):
+def analyse(file, var, group, tstart, tend, level, axis, batch, threads,
+            output, format, debug):
+    # import here, so that --help does not import numpy and netCDF4
+    from ceda_icompress.api import analyse_dataset
+    from ceda_icompress.Kernels.registry import set_kernel_threads
     # open the output file - do this before the processing so an error in 
     # created before the (long) processing time if the exceptions are caught
     if output:
         try:
             fh = open(output, "w")
+            fh.close()
         except FileExistsError:
             print(f"Output file already exists: {output}")
             sys.exit(0)
         except FileNotFoundError:
             print(f"Could not write output file: {output}")
             sys.exit(0)
+        if format is None:
+            format = "npz" if output.endswith(".npz") else "json"
 
-    # Load the netCDF4 file from the file argument
-    ds = load_dataset(file)
     if group is not None:
         group = group.split(",")
     if var is not None:
         var = var.split(",")
-    grps = get_groups(ds, group)
+    if batch is not None:
+        batch = batch.split(",")
+    try:
+        if threads is not None:
+            set_kernel_threads(threads)
+        result = analyse_dataset(
+            file, var, group, tstart, tend, level, axis, debug, batch
+        )
+    except CICError as e:
+        print(e)
+        sys.exit(0)
+    analysis_dict = result.analysis
 
-    analysis_dict = {"Analysis" : "BitInformation",
-                     "date" : datetime.now().isoformat(),
-                     "file" : os.path.abspath(file),
-                     "groups" : {},
-                     "version" : CIC_FILE_FORMAT_VERSION,
-                    }
-    for g in grps:
-        grp_dict = {"vars" : {}}
-        vars = get_vars(g, var)
-        for v in vars:
-            var_dict = analyse_var(v, tstart, tend, level, axis, debug)
-            if var_dict != {}:
-                grp_dict["vars"][v.name] = var_dict
-        analysis_dict["groups"][g.name] = grp_dict
-    
     # write to file
     if output:
-        json.dump(analysis_dict, fh)
-        fh.close()
+        try:
+            write_analysis(analysis_dict, output, format)
+        except AnalysisFileError as e:
+            print(e)
+            sys.exit(0)
         if debug:
             print(f"Output analysis file written: {output}")
     else:
@@ -0,0 +1,108 @@
+#! /usr/bin/env python
+import click
+import sys
+import os
+from ceda_icompress.Batch.manifest import read_manifest, Ledger, ManifestError
+from ceda_icompress.Batch.workqueue import (WorkQueue, WorkQueueError,
+    DEFAULT_STALE_TIMEOUT)
+
+@click.command(
+    help="Analyse and compress the netCDF files listed in a manifest"
+)
+@click.option("-l", "--ledger", default=None, type=str,
+              help="Ledger file of results, completed entries are skipped "
+                   "on a re-run (default: MANIFEST.ledger)")
+@click.option("-q", "--queue", default=None, type=str,
+              help="Directory on a shared filesystem, used to share the "
+                   "manifest between cic_batch running on many nodes")
+@click.option("-s", "--stale", default=DEFAULT_STALE_TIMEOUT, type=int,
+              help="Time (in seconds) after which a claim on a file in the "
+                   "queue belongs to a dead worker, and is requeued")
+@click.option("-A", "--analyse_workers", default=1, type=int,
+              help="Number of analyses to run at once")
+@click.option("-C", "--compress_workers", default=os.cpu_count(), type=int,
+              help="Number of compressions to run at once")
+@click.option("-r", "--retries", default=1, type=int,
+              help="Number of times to retry a failed analysis or compression")
+@click.option("-x", "--axis", default=0, type=int,
+              help="Axis number to analyse, if not given in the manifest")
+@click.option("-d", "--deflate", default=1, type=int,
+              help="Deflate (compression) level to use when writing file")
+@click.option("-c", "--ci", default=0.99, type=float,
+              help="The confidence interval - how much information to "
+                   "retain. default = 0.99 (99%)")
+@click.option("-I", "--conv_int", is_flag=True, default=False,
+              help="Convert 64 bit integers to 32 bit integers")
+@click.option("-F", "--conv_float", is_flag=True, default=False,
+              help="Convert 64 bit floats to 32 bit floats")
+@click.option("-N", "--narrow", is_flag=True, default=False,
+              help="Convert variables that are not bit manipulated to the "
+                   "smallest type that represents them exactly")
+@click.option("-m", "--method", default="bitshave", type=str,
+              help="Method to use for bit manipulation: bitshave | bitgroom | "
+                   "bitset | bitmask | pack")
+@click.option("--int_method", default="intround", type=str,
+              help="Method to use for bit manipulation of integer variables: "
+                   "intround | intshave")
+@click.option("--chunk_copy/--no_chunk_copy", default=True,
+              help="Copy the compressed chunks of variables that are not "
+                   "altered directly, if their filters match (needs h5py)")
+@click.option("-S", "--slab", default=256, type=int,
+              help="Maximum size of data (in MB) to process per iteration")
+@click.option("-D", "--debug", default=False, is_flag=True,
+              help="Provide debug info")
+@click.argument("manifest", type=str)
+def batch(manifest, ledger, queue, stale, analyse_workers, compress_workers,
+          retries, axis, deflate, ci, conv_int, conv_float, narrow, method,
+          int_method, chunk_copy, slab, debug):
+    # import here, so that --help does not import asyncio
+    import asyncio
+    from ceda_icompress.Batch.runner import BatchRunner
+    try:
+        entries = read_manifest(manifest)
+    except ManifestError as e:
+        print(e)
+        sys.exit(0)
+    # the queue replaces the ledger when sharing between nodes
+    if queue is not None:
+        try:
+            ledger = WorkQueue(queue, stale_timeout=stale)
+        except WorkQueueError as e:
+            print(e)
+            sys.exit(0)
+    else:
+        if ledger is None:
+            ledger = manifest + ".ledger"
+        ledger = Ledger(ledger)
+
+    params = {"conf_int"   : ci,
+              "deflate"    : deflate,
+              "method"     : method,
+              "int_method" : int_method,
+              "conv_int"   : conv_int,
+              "conv_float" : conv_float,
+              "narrow"     : narrow,
+              "chunk_copy" : chunk_copy,
+              "verify"     : False,
+              "debug"      : False,
+              "slab_bytes" : slab * 1024 * 1024}
+    runner = BatchRunner(
+        entries, ledger, params, analyse_workers, compress_workers, retries,
+        axis, debug
+    )
+    counts = asyncio.run(runner.run())
+    ledger.close()
+    print(f"Completed: {counts['ok']}, skipped: {counts['skipped']}, "
+          f"failed: {counts['failed']}")
+    # summarise the results of all the workers sharing the queue
+    if queue is not None:
+        for stage, s in ledger.summary().items():
+            print(f"{stage:<9}: ok: {s['ok']}, failed: {s['failed']}, "
+                  f"workers: {s['workers']}, time: {s['time']:.2f}s, "
+                  f"bytes in: {s['bytes_in']}, bytes out: {s['bytes_out']}")
+
+def main():
+    batch()
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,31 @@
 #! /usr/bin/env python
 import click
 import sys
-import json
 from ceda_icompress.InfoMeasures.display import (displayBitCount,
     displayBitCountVertical, displayBitInformation, displayBitPosition,
     displayColorBar, displayBitCountLegend, displayBitInfoLegend)
-from ceda_icompress.InfoMeasures.keepbits import free_entropy, keepbits
-import numpy as np
-from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+from ceda_icompress.IO.analysisfile import (load_analysis, export_json,
+    AnalysisFileError)
 
-def display_variable(var_name, variable, info, keep, ci, reverse):
+def display_curve(bi, man, elements):
+    """Display the number of bits to keep for a range of confidence
+    intervals, for the bitshave (and bitgroom, bitset) and bitmask methods"""
+    from ceda_icompress.InfoMeasures.keepbits import (keepbits_curve,
+        bitmask_curve, DEFAULT_CURVE_CIS)
+    kb = keepbits_curve(bi, man, elements, DEFAULT_CURVE_CIS)
+    mb = bitmask_curve(bi, man, elements, DEFAULT_CURVE_CIS)
+    print("---------- Keep bits curve ----------")
+    print(f"    {'ci':>9}  {'keep bits':>9}  {'bitmask bits':>12}")
+    for c, k, m in zip(DEFAULT_CURVE_CIS, kb, mb):
+        print(f"    {c:>9}  {k:>9}  {m:>12}")
+
+
+def display_variable(var_name, variable, info, keep, ci, reverse, curve):
     try:
         typ = variable['type']
-        bi = np.array(variable['bitinfo'])
+        # the bit information is a list in a JSON analysis file, and numpy
+        # is only imported if the number of bits to keep are calculated
+        bi = variable['bitinfo']
         siz = variable['itemsize']
         sig = variable['signbit']
         man = variable['manbit']
@@ -22,11 +35,13 @@ def display_variable(var_name, variable, info, keep, ci, reverse):
         print(f"    var name: {var_name}")
         print(f"        type: {typ}")
         if keep:
-            kb = keepbits(bi, man, elements, ci)
+            from ceda_icompress.InfoMeasures.keepbits import keepbits
+            import numpy as np
+            kb = keepbits(np.array(bi), man, elements, ci)
 
         if info:
             print("---------- Bit Information ----------")
-            L = bi.size
+            L = len(bi)
             displayBitPosition(L, 4, sig, man, exp, reverse)
             displayBitInformation(bi, sig, man, exp, reverse)
             displayColorBar()
@@ -35,11 +50,15 @@ def display_variable(var_name, variable, info, keep, ci, reverse):
         if keep:
             print(f"       keep bits: {kb}")
 
+        if curve:
+            import numpy as np
+            display_curve(np.array(bi), man, elements)
+
     except KeyError as e:
         print(f"Incomplete information in analysis file {e}")
 
 
-def display_group(group, var, info, keep, ci, reverse):
+def display_group(group, var, info, keep, ci, reverse, curve):
     """Display a single group"""
     # get the variables from the group
     try:
@@ -59,7 +78,7 @@ def display_group(group, var, info, keep, ci, reverse):
         try:
             if var is None or v == var:
                 display_variable(
-                    v, variables[v], info, keep, ci, reverse
+                    v, variables[v], info, keep, ci, reverse, curve
                 )
                 displayed = True
         except KeyError as e:
@@ -69,6 +88,101 @@ def display_group(group, var, info, keep, ci, reverse):
     if not displayed:
         print(f"Variable {var} not found in analysis file")
 
+# the columns of the summary, before the keep bits at each confidence interval
+SUMMARY_COLUMNS = ["file", "group", "var", "type", "elements"]
+# and after
+SUMMARY_INFO_COLUMNS = ["info_sign", "info_exponent", "info_mantissa", "error"]
+
+def parse_cis(cis):
+    """Parse a comma separated list of confidence intervals"""
+    try:
+        values = [float(c) for c in cis.split(",") if c.strip()]
+    except ValueError:
+        raise click.BadParameter(f"Could not parse confidence intervals: {cis}")
+    for c in values:
+        if not 0.0 < c < 1.0:
+            raise click.BadParameter(
+                f"Confidence interval {c} is not between 0 and 1"
+            )
+    return values
+
+
+def _summary_text(rows, cis, fh):
+    """Write the summary as a table, with a header line for each file"""
+    last_file = None
+    for row in rows:
+        if row["file"] != last_file:
+            last_file = row["file"]
+            fh.write(f"file name: {last_file}\n")
+            if "var" in row:
+                kb = "".join(f"{'kb '+str(c):>11}" for c in cis)
+                fh.write(f"    {'group':<12}{'var':<16}{'type':<9}"
+                         f"{'elements':>12}{kb}"
+                         f"{'sign':>7}{'exponent':>10}{'mantissa':>10}\n")
+        if "var" not in row:
+            fh.write(f"    {row['error']}\n")
+            continue
+        fh.write(f"    {row['group']:<12}{row['var']:<16}")
+        if "error" in row:
+            fh.write(f"{row['error']}\n")
+            continue
+        kb = "".join(f"{row[f'keepbits_{c}']:>11}" for c in cis)
+        fh.write(f"{row['type']:<9}{row['elements']:>12}{kb}"
+                 f"{row['info_sign']:>7.3f}{row['info_exponent']:>10.3f}"
+                 f"{row['info_mantissa']:>10.3f}\n")
+
+
+def _summary_csv(rows, cis, fh):
+    """Write the summary as CSV, with a row for each variable"""
+    import csv
+    columns = (SUMMARY_COLUMNS + [f"keepbits_{c}" for c in cis]
+               + SUMMARY_INFO_COLUMNS)
+    writer = csv.DictWriter(fh, fieldnames=columns)
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+
+
+def _summary_json(rows, cis, fh):
+    """Write the summary as a JSON array, an element at a time so that the
+    whole summary is not held in memory"""
+    import json
+    fh.write("[")
+    sep = "\n"
+    for row in rows:
+        fh.write(sep + json.dumps(row))
+        sep = ",\n"
+    fh.write("\n]\n")
+
+
+def display_summary(paths, var, group, cis, format, output, workers):
+    """Display a summary of the analysis files, with a row for each variable.
+
+    Args:
+        paths (list<str>) : analysis files, directories or glob patterns
+        var (str)         : only summarise this variable (default: all)
+        group (str)       : only summarise this group (default: all)
+        cis (list<float>) : the confidence intervals for the keep bits
+        format (str)      : text, csv or json
+        output (str)      : the file to write to (default: stdout)
+        workers (int)     : the number of processes to load the files with
+
+    Side effects:
+        Writes the summary to output
+    """
+    # import here, so that --help does not import numpy
+    from ceda_icompress.InfoMeasures.summary import (analysis_files,
+        summarise_files)
+    writers = {"text" : _summary_text, "csv" : _summary_csv,
+               "json" : _summary_json}
+    rows = summarise_files(analysis_files(paths), cis, var, group, workers)
+    if output is None:
+        writers[format](rows, cis, sys.stdout)
+        return
+    with open(output, "w", newline="" if format == "csv" else None) as fh:
+        writers[format](rows, cis, fh)
+
+
 @click.command(
     help="Display the analysis output of cic_analyse.py"
 )
@@ -82,35 +196,59 @@ def display_group(group, var, info, keep, ci, reverse):
               help="Display number of bits to keep")
 @click.option("-c", "--ci", default=0.99,
               help="Confidence interval for keep bits (default=0.99)")
+@click.option("-C", "--curve", is_flag=True, default=False,
+              help="Display number of bits to keep for a range of "
+                   "confidence intervals")
 @click.option("-r", "--reverse", is_flag=True, default=False,
               help="Reverse bit positions in display")
-@click.argument("analysis_file", type=str)
-def display(analysis_file, var, group, info, keepbits, ci, reverse):
-    # Load the analysis file
-    try:
-        fh = open(analysis_file, "r")
-    except FileNotFoundError:
-        print(f"Analysis file cannot be found: {analysis_file}")
+@click.option("-e", "--export", default=None, type=str,
+              help="Export the analysis file to a JSON file, rather than "
+                   "displaying it")
+@click.option("-S", "--summary", is_flag=True, default=False,
+              help="Display a table summarising every variable in one or "
+                   "more analysis files, directories or glob patterns")
+@click.option("--cis", default="0.99,0.999,0.9999", type=str,
+              help="Comma separated confidence intervals for the keep bits "
+                   "in the summary (default=0.99,0.999,0.9999)")
+@click.option("-F", "--format", default="text",
+              type=click.Choice(["text", "csv", "json"]),
+              help="Format of the summary (default=text)")
+@click.option("-o", "--output", default=None, type=str,
+              help="File to write the summary to (default=stdout)")
+@click.option("-w", "--workers", default=1, type=int,
+              help="Number of processes to load the analysis files with in "
+                   "the summary (default=1)")
+@click.argument("analysis_file", type=str, nargs=-1, required=True)
+def display(analysis_file, var, group, info, keepbits, ci, curve, reverse,
+            export, summary, cis, format, output, workers):
+    if summary:
+        try:
+            display_summary(analysis_file, var, group, parse_cis(cis),
+                            format, output, workers)
+        except OSError as e:
+            print(f"Could not write summary: {output}, reason: {e}")
         sys.exit(0)
-    # Parse the analysis file
-    try:
-        analysis = json.load(fh)
-    except Exception as e:
-        print(f"Analysis file cannot be parsed: {analysis_file}, reason: {e}")
+
+    if len(analysis_file) != 1:
+        print("Only one analysis file can be displayed, unless --summary is "
+              "used")
         sys.exit(0)
+    analysis_file = analysis_file[0]
 
-    # check that the version matches
-    version_err_msg = (
-        f"Version of file: {analysis_file} does not match current version:"
-        f" {CIC_FILE_FORMAT_VERSION}.  Please recalculate analysis."
-    )
+    # Load the analysis file, this also checks the version
     try:
-        version = analysis["version"]
-        if version != CIC_FILE_FORMAT_VERSION:
-            print(version_err_msg)
-            sys.exit(0)
-    except KeyError:
-        print(version_err_msg)
+        analysis = load_analysis(analysis_file)
+    except AnalysisFileError as e:
+        print(e)
+        sys.exit(0)
+
+    # export the analysis to JSON, rather than displaying it
+    if export:
+        try:
+            with open(export, "w") as fh:
+                export_json(analysis, fh)
+        except OSError as e:
+            print(f"Could not write JSON file: {export}, reason: {e}")
         sys.exit(0)
 
     # get the file name and display
@@ -128,7 +266,9 @@ def display(analysis_file, var, group, info, keepbits, ci, reverse):
     
     for g in groups:
         if (group and g == group) or (not group):
-            display_group(groups[g], var, info, keepbits, ci, reverse)
+            display_group(
+                groups[g], var, info, keepbits, ci, reverse, curve
+            )
         else:
             print(f"Group {g} not found in analysis file")
 
@@ -0,0 +1,160 @@
+#! /usr/bin/env python
+import click
+import sys
+import os
+import json
+import time
+from ceda_icompress.Core.errors import CICError
+from ceda_icompress.Core.defaults import METHODS, DEFAULT_SAMPLES
+from ceda_icompress.IO.analysisfile import load_analysis, AnalysisFileError
+
+def get_explore_vars(group, var, group_name):
+    """Get the floating point variables to explore, from the group and its
+    subgroups recursively"""
+    import numpy as np
+    vars = []
+    if group_name is None or group.name == group_name:
+        for v in group.variables:
+            input_var = group.variables[v]
+            if var is not None and v != var:
+                continue
+            if (isinstance(input_var.dtype, np.dtype) and
+                    input_var.dtype.kind == "f"):
+                vars.append(input_var)
+    for g in group.groups:
+        vars.extend(get_explore_vars(group.groups[g], var, group_name))
+    return vars
+
+
+def explore_var(input_var, analysis, params):
+    """Read a sample of blocks of the variable and run every trial on them"""
+    from ceda_icompress.Estimate.predictor import sample_var
+    from ceda_icompress.Estimate.explore import explore_blocks
+    Va = None
+    if analysis is not None:
+        try:
+            Va = analysis["groups"][input_var.group().name]["vars"][
+                input_var.name
+            ]
+        except KeyError:
+            Va = None
+    blocks, n_blocks = sample_var(input_var, params["samples"])
+    if len(blocks) == 0:
+        return None
+    data = [input_var[b] for b in blocks]
+    st = time.time()
+    results = explore_blocks(
+        data, params["methods"], Va, params["deflate"], params["workers"]
+    )
+    if params["debug"]:
+        print(f"Explored variable: {input_var.name}\n"
+              f"    Trials         : {len(results)}\n"
+              f"    Time taken     : {time.time()-st}")
+    return {"type" : str(input_var.dtype),
+            "samples" : len(blocks),
+            "blocks" : n_blocks,
+            "trials" : results}
+
+
+def print_explore(path, explored, frontier_only):
+    """Print the trials of a variable as a table"""
+    print(f"Variable: {path} ({explored['type']}), {explored['samples']} of "
+          f"{explored['blocks']} blocks sampled")
+    print(f"   {'method':<9}{'nsb':>4}{'ratio':>8}{'bits/value':>11}"
+          f"{'max abs error':>15}{'rmse':>12}{'correlation':>13}"
+          f"{'info':>8}")
+    for r in explored["trials"]:
+        if frontier_only and not r["frontier"]:
+            continue
+        mark = "*" if r["frontier"] else " "
+        info = r.get("info_retained")
+        info = "" if info is None else f"{info:.4f}"
+        print(f" {mark} {r['method']:<9}{r['nsb']:>4}{r['ratio']:>8.4f}"
+              f"{r['bits_per_value']:>11.3f}"
+              f"{r.get('max_abs_error', 0.0):>15.4g}"
+              f"{r.get('rmse', 0.0):>12.4g}"
+              f"{r.get('correlation', 1.0):>13.8f}{info:>8}")
+
+
+@click.command(
+    help="Explore the compressed size and error of every bit manipulation "
+         "method and number of significant bits, on a sample of a netCDF file"
+)
+@click.option("-a", "--analysis_file", default=None, type=str,
+              help="Analysis file generated from cic_analyse, needed for the "
+                   "bitmask method and information retained")
+@click.option("-v", "--var", default=None, type=str,
+              help="Variable in netCDF file to explore")
+@click.option("-g", "--group", default=None, type=str,
+              help="Group in netCDF file to explore")
+@click.option("-m", "--methods", default=",".join(METHODS), type=str,
+              help="Comma separated list of bit manipulation methods to "
+                   "explore")
+@click.option("-d", "--deflate", default=1, type=int,
+              help="Deflate (compression) level to use")
+@click.option("-n", "--samples", default=DEFAULT_SAMPLES, type=int,
+              help="Number of blocks of each variable to sample")
+@click.option("-w", "--workers", default=os.cpu_count(), type=int,
+              help="Number of worker processes")
+@click.option("-f", "--frontier", is_flag=True, default=False,
+              help="Only display the trials on the rate-distortion frontier")
+@click.option("-o", "--output", default=None, type=str,
+              help="Write the results to a JSON file")
+@click.option("-D", "--debug", default=False, is_flag=True,
+              help="Provide debug info")
+@click.argument("file", type=str)
+def explore(file, analysis_file, var, group, methods, deflate, samples,
+            workers, frontier, output, debug):
+    # import here, so that --help does not import numpy and netCDF4
+    from ceda_icompress.Core.analysis import load_dataset
+    from ceda_icompress.IO.chunkcopy import var_path
+    methods = methods.split(",")
+    for m in methods:
+        if m not in METHODS:
+            print(f"Unknown bit manipulation method: {m}")
+            sys.exit(0)
+    analysis = None
+    if analysis_file is not None:
+        try:
+            analysis = load_analysis(analysis_file)
+        except AnalysisFileError as e:
+            print(e)
+            sys.exit(0)
+
+    params = {"methods" : methods,
+              "deflate" : deflate,
+              "samples" : samples,
+              "workers" : workers,
+              "debug"   : debug}
+    file = os.path.abspath(file)
+    try:
+        input_ds = load_dataset(file)
+    except CICError as e:
+        print(e)
+        sys.exit(0)
+    explore_vars = get_explore_vars(input_ds, var, group)
+    if len(explore_vars) == 0:
+        print("No floating point variables found to explore")
+        sys.exit(0)
+    results = {}
+    for input_var in explore_vars:
+        explored = explore_var(input_var, analysis, params)
+        if explored is None:
+            continue
+        path = var_path(input_var)
+        results[path] = explored
+        print_explore(path, explored, frontier)
+    input_ds.close()
+
+    if output is not None:
+        try:
+            with open(output, "w") as fh:
+                json.dump({"file" : file, "vars" : results}, fh, indent=1)
+        except OSError as e:
+            print(f"Could not write output file: {output}, reason: {e}")
+
+def main():
+    explore()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+import click
+import os
+import sys
+from ceda_icompress.Server.client import ServerError
+
+@click.command(
+    help="Run a server that compresses netCDF files on request from "
+         "cic_submit, without the start up cost for each file"
+)
+@click.option("-s", "--socket", default=None, type=str,
+              help="UNIX socket to listen on (default: "
+                   "$XDG_RUNTIME_DIR/cic_server-UID.sock)")
+@click.option("-w", "--workers", default=os.cpu_count(), type=int,
+              help="Number of worker processes")
+@click.option("-D", "--debug", default=False, is_flag=True,
+              help="Provide debug info")
+def server(socket, workers, debug):
+    # import here, so that --help does not import asyncio
+    import asyncio
+    from ceda_icompress.Server.daemon import CompressionServer
+    server = CompressionServer(socket, workers, debug)
+    try:
+        counts = asyncio.run(server.run())
+    except ServerError as e:
+        print(e)
+        sys.exit(0)
+    except OSError as e:
+        print(f"Could not listen on socket: {server.socket_path}, reason: {e}")
+        sys.exit(0)
+    if debug:
+        print(f"Completed: {counts['ok']}, failed: {counts['error']}")
+
+def main():
+    server()
+
+if __name__ == "__main__":
+    main()
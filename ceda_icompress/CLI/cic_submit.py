@@ -0,0 +1,155 @@
+#! /usr/bin/env python
+import click
+import sys
+import os
+import json
+from ceda_icompress.Server.client import submit, ServerError
+from ceda_icompress.CLI.report import print_estimate, write_report
+from ceda_icompress.Core.defaults import DEFAULT_SAMPLES
+
+def abspath(path):
+    """The server has a different working directory, so send absolute paths"""
+    return None if path is None else os.path.abspath(path)
+
+
+@click.command(
+    help="Submit a netCDF file to a running cic_server to compress (or "
+         "analyse), and wait for it to complete"
+)
+@click.option("-s", "--socket", default=None, type=str,
+              help="UNIX socket of the server (default: "
+                   "$XDG_RUNTIME_DIR/cic_server-UID.sock)")
+@click.option("-a", "--analysis_file", default=None, type=str,
+              help="Analysis file generated from cic_analyse.py, or the "
+                   "analysis file to write with --analyse")
+@click.option("-o", "--output", default=None, type=str,
+              help="Output file name")
+@click.option("-d", "--deflate", default=1, type=int,
+              help="Deflate (compression) level to use when writing file")
+@click.option("-f", "--force", is_flag=True,
+              help="Force compression of file, even if input file does not "
+              "match the file named in the analysis")
+@click.option("-c", "--ci", default=0.99, type=float,
+              help="The confidence interval - how much information to "
+                   "retain. default = 0.99 (99%)")
+@click.option("-I", "--conv_int", is_flag=True, default=False,
+              help="Convert 64 bit integers to 32 bit integers")
+@click.option("-F", "--conv_float", is_flag=True, default=False,
+              help="Convert 64 bit floats to 32 bit floats")
+@click.option("-N", "--narrow", is_flag=True, default=False,
+              help="Convert variables that are not bit manipulated to the "
+                   "smallest type that represents them exactly")
+@click.option("-m", "--method", default="bitshave", type=str,
+              help="Method to use for bit manipulation: bitshave | bitgroom | "
+                   "bitset | bitmask | pack")
+@click.option("--int_method", default="intround", type=str,
+              help="Method to use for bit manipulation of integer variables: "
+                   "intround | intshave")
+@click.option("--chunk_copy/--no_chunk_copy", default=True,
+              help="Copy the compressed chunks of variables that are not "
+                   "altered directly, if their filters match (needs h5py)")
+@click.option("-V", "--verify", is_flag=True, default=False,
+              help="Calculate the errors introduced by the bit manipulation "
+                   "and add them to the variable attributes")
+@click.option("-R", "--report", default=None, type=str,
+              help="Write the errors introduced by the bit manipulation (or "
+                   "the estimate) to a JSON file (implies --verify)")
+@click.option("-E", "--estimate", is_flag=True, default=False,
+              help="Estimate the size of the output file, and the time taken "
+                   "to compress it, without writing anything")
+@click.option("-n", "--samples", default=DEFAULT_SAMPLES, type=int,
+              help="Number of blocks of each variable to sample for "
+                   "--estimate")
+@click.option("-S", "--slab", default=256, type=int,
+              help="Maximum size of data (in MB) to process per iteration")
+@click.option("-A", "--analyse", is_flag=True, default=False,
+              help="Analyse the file, writing the analysis to "
+                   "--analysis_file, rather than compressing it")
+@click.option("-v", "--var", default=None, type=str,
+              help="Variable in netCDF file to analyse")
+@click.option("-g", "--group", default=None, type=str,
+              help="Group in netCDF file to analyse")
+@click.option("-x", "--axis", default=0, type=int,
+              help="Axis number to analyse")
+@click.option("--status", is_flag=True, default=False,
+              help="Print the status of the server")
+@click.option("--stop", is_flag=True, default=False,
+              help="Stop the server")
+@click.option("-D", "--debug", default=False, is_flag=True,
+              help="Provide debug info")
+@click.argument("file", type=str, required=False)
+def submit_job(file, socket, analysis_file, output, deflate, force, ci,
+               conv_int, conv_float, narrow, method, int_method, chunk_copy,
+               verify, report, estimate, samples, slab, analyse, var, group,
+               axis, status, stop, debug):
+    if status or stop:
+        job = {"op" : "status" if status else "stop"}
+    else:
+        if file is None:
+            print("File name not supplied")
+            sys.exit(0)
+        if analysis_file is None:
+            print("Analysis file name not supplied")
+            sys.exit(0)
+        job = {"file" : abspath(file), "analysis" : abspath(analysis_file)}
+        if analyse:
+            job["op"] = "analyse"
+            job["output"] = job["analysis"]
+            job["var"] = None if var is None else var.split(",")
+            job["group"] = None if group is None else group.split(",")
+            job["axis"] = axis
+        else:
+            job["op"] = "estimate" if estimate else "compress"
+            job["force"] = force
+            job["params"] = {"conf_int"   : ci,
+                             "deflate"    : deflate,
+                             "method"     : method,
+                             "int_method" : int_method,
+                             "conv_int"   : conv_int,
+                             "conv_float" : conv_float,
+                             "narrow"     : narrow,
+                             "chunk_copy" : chunk_copy,
+                             "verify"     : verify or report is not None,
+                             "samples"    : samples,
+                             "slab_bytes" : slab * 1024 * 1024}
+            if not estimate:
+                # check the output file name was supplied
+                if output is None:
+                    print("Output file name not supplied")
+                    sys.exit(0)
+                job["output"] = abspath(output)
+    # block until the job completes
+    try:
+        response = submit(job, socket)
+    except ServerError as e:
+        print(e)
+        sys.exit(0)
+    if response["status"] != "ok":
+        print(response["error"])
+        sys.exit(0)
+
+    result = response["result"]
+    if job["op"] == "estimate":
+        print_estimate(result)
+        if report is not None:
+            write_report(report, {"file" : job["file"], "estimate" : result})
+    elif job["op"] == "compress":
+        if report is not None:
+            write_report(report, {"file" : job["file"],
+                                  "output" : job["output"],
+                                  "vars" : result["errors"]})
+        if debug:
+            print(f"Compressed file: {result['file']}\n"
+                  f"    Output         : {result['output']}\n"
+                  f"    Ratio          : {result['ratio']:.4f}\n"
+                  f"    Time taken     : {result['elapsed']:.3f}")
+    elif job["op"] == "status":
+        print(json.dumps(result, indent=1))
+    elif debug:
+        print(json.dumps(result, indent=1))
+
+def main():
+    submit_job()
+
+if __name__ == "__main__":
+    main()
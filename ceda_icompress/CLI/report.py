@@ -0,0 +1,31 @@
+"""Output of the results of the command line interfaces, shared by cic_compress
+and cic_submit.  Only the standard library is imported, so that cic_submit
+starts quickly."""
+
+import json
+
+def print_estimate(estimate):
+    """Print the estimate as a table"""
+    MB = 1024 * 1024
+    print(f"{'Variable':<24}{'Type':<9}{'Keep':>5}{'Input MB':>11}"
+          f"{'Output MB':>11}{'95% interval MB':>22}{'Time s':>10}")
+    rows = list(estimate["vars"].items()) + [("Total", estimate["total"])]
+    for name, e in rows:
+        if "bytes" not in e:
+            print(f"{name:<24}{e['type']:<9}  not estimated")
+            continue
+        keep = e.get("keepbits")
+        keep = "" if keep is None else str(keep)
+        interval = f"[{e['bytes_low']/MB:.2f}, {e['bytes_high']/MB:.2f}]"
+        print(f"{name:<24}{e.get('type', ''):<9}{keep:>5}"
+              f"{e['uncompressed_bytes']/MB:>11.2f}{e['bytes']/MB:>11.2f}"
+              f"{interval:>22}{e['seconds']:>10.2f}")
+
+
+def write_report(report, contents):
+    """Write the report of the compression, or the estimate, to a JSON file"""
+    try:
+        with open(report, "w") as fh:
+            json.dump(contents, fh, indent=1)
+    except OSError as e:
+        print(f"Could not write report file: {report}, reason: {e}")
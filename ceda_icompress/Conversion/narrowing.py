@@ -0,0 +1,175 @@
+"""Choose the smallest storage type that represents a variable exactly, by
+scanning the variable for its range, integrality and whether it can be
+represented exactly as a 32 bit float."""
+
+import numpy as np
+
+from ceda_icompress.IO.slabs import var_slabs, DEFAULT_SLAB_BYTES
+
+# candidate types, in order of preference (smallest first)
+SIGNED_TYPES = [np.int8, np.int16, np.int32, np.int64]
+UNSIGNED_TYPES = [np.uint8, np.uint16, np.uint32, np.uint64]
+
+class TypeScan:
+    """Accumulate the statistics needed to narrow the type of a variable,
+    over a number of slabs."""
+
+    def __init__(self, dtype):
+        """
+        Args:
+            dtype (numpy dtype) : the type of the variable being scanned
+        Side effects:
+            self.vmin, self.vmax : the range of the (valid) values
+            self.count (int)     : number of (valid) values
+            self.integral (bool) : all values are whole numbers, and none
+                                   are -0.0
+            self.f32_exact (bool): all values are exactly representable as
+                                   a 32 bit float
+            self.nonfinite (bool): some values are NaN or infinite
+        """
+        self.dtype = np.dtype(dtype)
+        self.vmin = None
+        self.vmax = None
+        self.count = 0
+        self.integral = True
+        self.f32_exact = True
+        self.nonfinite = False
+
+    def update(self, A):
+        """Add the values in the (possibly masked) array A to the scan.
+        Masked values are not included."""
+        if np.ma.is_masked(A):
+            v = A.compressed()
+        else:
+            v = np.ma.getdata(A).ravel()
+        if v.size == 0:
+            return
+        if v.dtype.kind == "f":
+            finite = np.isfinite(v)
+            if not finite.all():
+                self.nonfinite = True
+                v = v[finite]
+                if v.size == 0:
+                    return
+            if self.integral:
+                # -0.0 cannot be stored as an integer without losing its sign
+                self.integral = bool(np.all(np.mod(v, 1) == 0) and
+                                     not np.any(np.signbit(v) & (v == 0)))
+            if self.f32_exact and v.dtype.itemsize > 4:
+                # values out of range of a float32 become inf, and so are
+                # not equal
+                with np.errstate(over="ignore"):
+                    v32 = v.astype(np.float32)
+                self.f32_exact = bool(np.all(v32 == v))
+        vmin = v.min()
+        vmax = v.max()
+        if self.vmin is None:
+            self.vmin, self.vmax = vmin, vmax
+        else:
+            self.vmin = min(self.vmin, vmin)
+            self.vmax = max(self.vmax, vmax)
+        self.count += v.size
+
+
+def scan_var(var, max_bytes=DEFAULT_SLAB_BYTES):
+    """Scan a netCDF4 variable, slab by slab.
+
+    Args:
+        var (netCDF4.Variable) : the variable to scan
+        max_bytes (int)        : maximum size of a slab in bytes
+
+    Returns:
+        TypeScan: the statistics of the variable
+    """
+    scan = TypeScan(var.dtype)
+    for s in var_slabs(var, max_bytes):
+        scan.update(var[s])
+    return scan
+
+
+def _fits(t, vmin, vmax):
+    """Check whether the range vmin to vmax fits into the type t"""
+    if vmin is None:
+        return True
+    if np.dtype(t).kind == "f":
+        info = np.finfo(t)
+    else:
+        info = np.iinfo(t)
+    return vmin >= info.min and vmax <= info.max
+
+
+def _represents(t, value):
+    """Check whether a single value (e.g. the _FillValue) is exactly
+    representable in the type t"""
+    if value is None:
+        return True
+    if np.dtype(t).kind == "f":
+        value = np.float64(value)
+        return bool(np.float32(value) == value) or bool(np.isnan(value))
+    if not np.isfinite(value) or np.mod(value, 1) != 0:
+        return False
+    return _fits(t, value, value)
+
+
+def narrowest_type(scan, fill_value=None):
+    """Choose the smallest type that represents all the values in the scan,
+    and the fill value, exactly.
+
+    Args:
+        scan (TypeScan)     : the statistics of the variable
+        fill_value (number) : the _FillValue of the variable, or None
+
+    Returns:
+        tuple: (numpy dtype, str) the type to use and the reason for the
+               choice.  The type is the original type if it cannot be
+               narrowed.
+    """
+    dtype = scan.dtype
+    if dtype.kind in ["i", "u"]:
+        candidates = SIGNED_TYPES if dtype.kind == "i" else UNSIGNED_TYPES
+        for t in candidates:
+            if np.dtype(t).itemsize >= dtype.itemsize:
+                break
+            if (_fits(t, scan.vmin, scan.vmax) and
+                    _represents(t, fill_value)):
+                return np.dtype(t), f"range {scan.vmin} to {scan.vmax}"
+        return dtype, f"range {scan.vmin} to {scan.vmax} needs {dtype.name}"
+    elif dtype.kind == "f":
+        # whole numbers can be stored as integers, as long as there are no
+        # NaNs or infinities
+        if scan.integral and not scan.nonfinite:
+            for t in SIGNED_TYPES:
+                if np.dtype(t).itemsize >= dtype.itemsize:
+                    break
+                if (_fits(t, scan.vmin, scan.vmax) and
+                        _represents(t, fill_value)):
+                    return (np.dtype(t),
+                            f"whole numbers, range {scan.vmin} to {scan.vmax}")
+        if dtype.itemsize > 4 and scan.f32_exact:
+            if _represents(np.float32, fill_value):
+                return np.dtype(np.float32), "exactly representable as float32"
+            return dtype, "_FillValue not representable as float32"
+        if dtype.itemsize > 4:
+            return dtype, "values not exactly representable as float32"
+        return dtype, "values are not whole numbers, or are -0.0"
+    return dtype, f"unsupported type {dtype}"
+
+
+def checked_type(scan, target):
+    """Check that a requested conversion (e.g. --conv_int or --conv_float)
+    will not overflow the target type.  Unlike narrowest_type, a float
+    conversion is allowed to lose precision.
+
+    Args:
+        scan (TypeScan)      : the statistics of the variable
+        target (numpy dtype) : the requested type
+
+    Returns:
+        tuple: (numpy dtype, str) the type to use and the reason for the
+               choice.  The type is the original type if the conversion
+               would overflow.
+    """
+    if _fits(target, scan.vmin, scan.vmax):
+        return np.dtype(target), f"range {scan.vmin} to {scan.vmax}"
+    return (scan.dtype, f"range {scan.vmin} to {scan.vmax} overflows "
+            f"{np.dtype(target).name}")
@@ -0,0 +1,164 @@
+"""Analyse the variables in a netCDF dataset, or a single array, to get the
+bitinformation used to compress them."""
+
+from netCDF4 import Dataset
+import time
+import numpy as np
+from ceda_icompress.InfoMeasures.bitinformation import (bitpairs,
+    mutual_information)
+from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
+from ceda_icompress.IO.mapped import var_reader, read_stored_integers
+from ceda_icompress.Core.errors import (InputFileError, NotFoundError,
+    UnsupportedTypeError)
+
+def load_dataset(file):
+    """Open a netCDF file for reading"""
+    try:
+        ds = Dataset(file)
+    except (FileNotFoundError, OSError) as e:
+        raise InputFileError(str(e))
+    return ds
+
+def get_groups(dataset, group):
+    """Get the groups to analyse, either those named in group, or all of the
+    groups and the root group"""
+    if group is not None:
+        try:
+            grps = [dataset.groups[g] for g in group]
+        except KeyError as e:
+            raise NotFoundError(f"Group(s) not found: {group}")
+    else:
+        # get the groups
+        grps = [dataset.groups[g] for g in dataset.groups]
+        # append the dataset (which is derived from a group)
+        grps.append(dataset)
+    return grps
+
+def get_vars(grp, var):
+    """Get the variables to analyse in the group, either those named in var,
+    or all of them"""
+    if var is not None:
+        try:
+            vars = [grp.variables[v] for v in var]
+        except KeyError as e:
+            raise NotFoundError(
+                f"Variable(s) not found: {var} in group: {grp.name}"
+            )
+    else:
+        vars = [grp.variables[v] for v in grp.variables]
+    return vars
+
+def analyse_var(var, tstart, tend, level, axis, debug=False, batch=None):
+    """Analyse the variable to get the bitcount and the bitinformation.  If
+    batch (a list of dimension names) is given, the bitinformation is also
+    calculated for each index of those dimensions of the variable."""
+    # return dictionary
+    var_dict = {}
+    # form the index / slice
+    s = []
+
+    for d in var.dimensions:
+        if d == "time" or d == "t":
+            s.append(slice(tstart,tend))
+        elif "lev" in d and level is not None:
+            ls = level
+            le = ls + 1
+            s.append(slice(ls,le))
+        else:
+            s.append(slice(None))
+    if len(s) == 0:
+        s = 0
+    elif len(s) == 1:
+        s = s[0]
+    
+    # packed integers are analysed as they are stored
+    read_stored_integers(var)
+    # read through a memory map of the file, if possible
+    data = var_reader(var, debug)[s]
+
+    if debug:
+        print(f"Analysing variable {var.name}, with shape: {data.shape}")
+
+    var_dict["time_start"] = tstart
+    var_dict["time_end"] = tend
+    var_dict["level"] = level
+    # the batch dimensions of this variable, other than the axis analysed
+    batch_axes = []
+    if batch is not None:
+        batch_axes = [i for i, d in enumerate(var.dimensions)
+                      if d in batch and i != axis % data.ndim]
+    if batch_axes:
+        var_dict["batch_dims"] = [var.dimensions[i] for i in batch_axes]
+    try:
+        var_dict.update(analyse_array(data, axis, debug, batch_axes))
+    except UnsupportedTypeError as e:
+        if debug:
+            print(f"    variable {var.name}: {e}")
+        return {} # empty var dict
+    return var_dict
+
+
+def analyse_array(data, axis=0, debug=False, batch_axes=None,
+                  fill_value=None):
+    """Analyse an array to get the bitinformation.
+
+    Args:
+        data (numpy array) : the (possibly masked) array to analyse
+        axis (int)         : the axis to analyse along
+        debug (bool)       : provide debug info
+        batch_axes (list<int>|None) : also get the bitinformation for each
+                             index of these axes, as bitinfo_batch, with the
+                             number of elements in each as elements_batch
+        fill_value (number|None) : a value that is not analysed, even if it
+                             is not masked
+
+    Returns:
+        dict: the analysis of the array, as stored for each variable in the
+              analysis file
+    Raises:
+        UnsupportedTypeError: if the type of the array cannot be analysed
+    """
+    data = np.ma.asarray(data)
+    # right shift on 64 bit numbers & python types not supported by numpy
+    if data.dtype in [np.uint64, np.int64, np.float64, '<f8', '>f8', float, int]:
+        raise UnsupportedTypeError(
+            f"64 bit types ({data.dtype}) are not currently supported"
+        )
+    var_dict = {}
+    # get the bit information
+    st = time.time()
+    try:
+        C, n = bitpairs(data, axis, batch_axes=batch_axes,
+                        fill_value=fill_value)
+    except TypeError as e:
+        raise UnsupportedTypeError(str(e))
+    # the bitinformation of the whole array is that of the sum of the counts
+    # of the batches
+    if batch_axes:
+        bi_batch = mutual_information(C, n)
+        b_axes = tuple(range(0, len(batch_axes)))
+        bi = mutual_information(C.sum(axis=b_axes), n.sum())
+    else:
+        bi = mutual_information(C, n)
+    ed = time.time()
+    if debug:
+        print("    Bit information time taken: ", ed-st)
+    # get the sign, exponent and mantissa bits
+    sig, man, exp = getsigmanexp(data.dtype)
+    var_dict["axis"] = axis
+    var_dict["elements"] = int(data.count())
+    var_dict["type"] = data.dtype.name
+    var_dict["itemsize"] = data.dtype.itemsize          # bits
+    var_dict["byteorder"] = data.dtype.byteorder
+    var_dict["signbit"] = sig
+    var_dict["manbit"] = man
+    var_dict["expbit"] = exp
+    var_dict["bitinfo"] = bi.tolist()
+    if batch_axes:
+        var_dict["batch_axes"] = list(batch_axes)
+        var_dict["bitinfo_batch"] = bi_batch.tolist()
+        var_dict["elements_batch"] = np.ma.count(
+            data, axis=tuple(i for i in range(0, data.ndim)
+                             if i not in batch_axes)
+        ).tolist()
+    return var_dict
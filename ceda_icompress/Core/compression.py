@@ -0,0 +1,613 @@
+"""Copy a netCDF dataset to a new dataset, applying the bit manipulation to
+the variables in the analysis, and the type conversions and compression to
+every variable.  Also estimate the size of the output without writing it."""
+
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+import time
+from ceda_icompress.BitManipulation.bitshave import BitShave
+from ceda_icompress.BitManipulation.bitgroom import BitGroom
+from ceda_icompress.BitManipulation.bitset import BitSet
+from ceda_icompress.BitManipulation.bitmask import BitMask
+from ceda_icompress.BitManipulation.intmanip import IntShave, IntRound
+from ceda_icompress.BitManipulation.pack import Pack
+from ceda_icompress.IO.slabs import var_slabs
+from ceda_icompress.IO.chunkcopy import (can_copy_chunks, copy_chunks,
+    var_path, HDF5_FORMATS)
+from ceda_icompress.IO.mapped import var_reader, read_stored_integers
+from ceda_icompress.IO.journal import fsync_file
+from ceda_icompress.Conversion.narrowing import (TypeScan, scan_var,
+    narrowest_type, checked_type)
+from ceda_icompress.InfoMeasures.errorstats import ErrorStats
+from ceda_icompress.Estimate.predictor import sample_var, estimate_blocks
+from ceda_icompress.BitManipulation.bitmanip import BitManipulationError
+from ceda_icompress.Core.defaults import METHODS, INT_METHODS
+from ceda_icompress.Core.errors import (AnalysisMismatchError, MethodError,
+    UnsupportedTypeError)
+
+COMPRESSION = 'zlib'
+
+def copy_dim(input_dim, output_group):
+    output_dim = output_group.createDimension(
+        dimname = input_dim.name, 
+        size = input_dim.size
+    )
+
+def output_type(input_var, params, bit_manipulate, mv, scan=None):
+    """Determine the type of the output variable.  Variables that are bit
+    manipulated keep their type.  Otherwise, the variable is scanned to find
+    the smallest type that represents it exactly (--narrow) or to check that
+    the requested conversions (--conv_int, --conv_float) will not overflow.
+    If scan (a TypeScan) is given, it is used instead of scanning the whole
+    variable.
+    """
+    var_type = input_var.dtype
+    if bit_manipulate or not isinstance(var_type, np.dtype):
+        return var_type
+    convert = (
+        params["narrow"] and var_type.kind in ["i", "u", "f"] or
+        params["conv_int"] and var_type == np.int64 or
+        params["conv_float"] and var_type == np.float64
+    )
+    if not convert:
+        return var_type
+    # packed variables are read unpacked, so the scan would not reflect the
+    # stored values
+    atts = input_var.ncattrs()
+    if "scale_factor" in atts or "add_offset" in atts:
+        if params["debug"]:
+            print(f"Not converting packed variable: {input_var.name}")
+        return var_type
+
+    if scan is None:
+        scan = scan_var(input_var, params["slab_bytes"])
+    reason = ""
+    if params["narrow"]:
+        var_type, reason = narrowest_type(scan, mv)
+    if var_type == np.int64 and params["conv_int"]:
+        var_type, reason = checked_type(scan, np.int32)
+        if var_type == np.int64 and params["debug"]:
+            print(f"Not converting variable {input_var.name} to int32: "
+                  f"{reason}")
+    elif var_type == np.float64 and params["conv_float"]:
+        var_type, reason = checked_type(scan, np.float32)
+        if var_type == np.float64 and params["debug"]:
+            print(f"Not converting variable {input_var.name} to float32: "
+                  f"{reason}")
+    if params["debug"]:
+        print(
+            f"Converting variable: {input_var.name}\n"
+            f"    Type           : {input_var.dtype} -> {var_type}\n"
+            f"    Reason         : {reason}"
+        )
+    return var_type
+
+def create_output_var(input_var, output_group, params, bit_manipulate,
+                      pack=None):
+    """Create the output variable.  Returns the output variable and whether
+    the chunks of the input variable can be copied directly into it.  If pack
+    (a Pack) is given, the variable is created with the packed type, and the
+    packing attributes."""
+    # get the fill value
+    try:
+        mv = input_var.getncattr("_FillValue")
+    except AttributeError:
+        mv = None
+    # determine the chunking
+    if input_var.chunking() == 'contiguous':
+         chunking = None
+    else:
+         chunking = input_var.chunking()
+    chunking = None
+
+    # what type should we use? If we aren't manipulating the bits then check
+    # whether the type can be narrowed
+    var_type = output_type(input_var, params, bit_manipulate, mv)
+    if pack is not None:
+        var_type = pack.packed_type
+        mv = pack.fill_value
+
+    # can the compressed chunks be copied directly? If so, the output has to
+    # have the same chunking as the input
+    chunk_copy = False
+    if not bit_manipulate and params["chunk_copy"]:
+        chunk_copy, reason = can_copy_chunks(input_var, var_type, params)
+        if chunk_copy:
+            chunking = input_var.chunking()
+        elif params["debug"]:
+            print(f"Not copying chunks of variable: {input_var.name}\n"
+                  f"    Reason         : {reason}")
+
+    # netCDF3 files do not have a chunk cache, and are always big endian, so
+    # write the output in the native byte order
+    if input_var.group().data_model in HDF5_FORMATS:
+        chunk_cache = input_var.get_var_chunk_cache()[0]
+        endian = input_var.endian()
+    else:
+        chunk_cache = None
+        endian = "native"
+
+    # create the output variable
+    output_var = output_group.createVariable(
+        varname = input_var.name,
+        datatype = var_type, 
+        dimensions = input_var.dimensions,
+        compression = COMPRESSION,
+        complevel = params["deflate"],
+        contiguous = False,
+        chunksizes = chunking,
+        endian = endian,
+        fill_value = mv,
+        chunk_cache = chunk_cache
+    )
+    copy_var_atts(input_var, output_var, pack)
+    return output_var, chunk_copy
+
+def copy_var_atts(input_var, output_var, pack=None):
+    """Copy the attributes from input_var to output_var - the _FillValue has
+    already been set, and may be a different type if the type was narrowed.
+    If pack (a Pack) is given, the packing attributes are set."""
+    atts = input_var.__dict__
+    atts.pop("_FillValue", None)
+    if pack is not None:
+        atts = pack.attributes(atts)
+        # the packed values are written as they are
+        output_var.set_auto_scale(False)
+    output_var.setncatts(atts)
+
+def existing_output_var(input_var, output_group, params, bit_manipulate,
+                        pack=None):
+    """Get the output variable that was created before the compression was
+    interrupted, when it is resumed.  Returns the output variable and whether
+    the chunks of the input variable can be copied directly into it, as
+    create_output_var."""
+    output_var = output_group.variables[input_var.name]
+    chunk_copy = False
+    if not bit_manipulate and params["chunk_copy"]:
+        chunk_copy = can_copy_chunks(input_var, output_var.dtype, params)[0]
+    # the attributes may not have been set before the interruption, but the
+    # history may already have been added to, so it is kept
+    history = output_var.__dict__.get("history")
+    copy_var_atts(input_var, output_var, pack)
+    if history is not None:
+        output_var.setncattr("history", history)
+    return output_var, chunk_copy
+
+def get_method(input_var, Va, params):
+    """Create the bit manipulation for the variable, from the variable
+    analysis Va.
+
+    Raises:
+        MethodError: if the method is not known
+        UnsupportedTypeError: if the type of the variable cannot be bit
+                              manipulated
+        AnalysisMismatchError: if the analysis does not match the variable
+    """
+    # check to see if number of bits to retain are enforced?
+    if "retainbits" in Va:
+        NSB = Va["retainbits"]
+    else:
+        NSB = -1
+
+    # get a pointer to the function to use
+    if params["method"] == "bitshave":
+        cls = BitShave
+    elif params["method"] == "bitgroom":
+        cls = BitGroom
+    elif params["method"] == "bitset":
+        cls = BitSet
+    elif params["method"] == "bitmask":
+        cls = BitMask
+    elif params["method"] == "pack":
+        cls = Pack
+    else:
+        raise MethodError(
+            f"Unknown bit manipulation method: {params['method']}"
+        )
+    # integer variables have their own methods, whatever the method for the
+    # floating point variables
+    if np.dtype(input_var.dtype).kind in ["i", "u"]:
+        int_method = params.get("int_method", INT_METHODS[0])
+        if int_method == "intround":
+            cls = IntRound
+        elif int_method == "intshave":
+            cls = IntShave
+        else:
+            raise MethodError(
+                f"Unknown integer bit manipulation method: {int_method}"
+            )
+    # input_var may be a netCDF4 variable or an array
+    name = getattr(input_var, "name", "array")
+    try:
+        method = cls(input_var, NSB, Va, params["conf_int"])
+    except TypeError as e:
+        raise UnsupportedTypeError(f"variable {name}: {e}")
+    except BitManipulationError as e:
+        raise AnalysisMismatchError(f"variable {name}: {e}")
+    return method
+
+
+class MethodCache:
+    """Cache of the bit manipulation objects, so that a long running process
+    (e.g. cic_server) only derives the number of bits to keep once for each
+    variable analysis, method and confidence interval."""
+
+    def __init__(self, maxsize=1024):
+        self.methods = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, input_var, Va, params):
+        """Get the bit manipulation for the variable, see get_method"""
+        key = (params["method"], params.get("int_method"),
+               params["conf_int"], np.dtype(input_var.dtype).str,
+               Va.get("retainbits"),
+               Va.get("elements"), tuple(Va.get("manbit", ())),
+               tuple(Va.get("bitinfo", ())))
+        if key in self.methods:
+            self.hits += 1
+            self.methods.move_to_end(key)
+            return self.methods[key]
+        self.misses += 1
+        method = get_method(input_var, Va, params)
+        self.methods[key] = method
+        if len(self.methods) > self.maxsize:
+            self.methods.popitem(last=False)
+        return method
+
+
+def pack_range(input_var, method, Va, params, scan=None):
+    """Set the range of a Pack from a scan of the variable, read slab by slab
+    unless scan (a TypeScan) is given.  If packing would not make the variable
+    smaller, at the precision of the number of bits to keep, bitshave is used
+    instead.  Returns the bit manipulation to use."""
+    if scan is None:
+        scan = scan_var(input_var, params["slab_bytes"])
+    method.set_range(scan.vmin, scan.vmax)
+    if method.packed_type.itemsize < np.dtype(input_var.dtype).itemsize:
+        if params["debug"]:
+            print(f"Packing variable: {input_var.name}\n"
+                  f"    Type           : {input_var.dtype} -> "
+                  f"{method.packed_type}\n"
+                  f"    Range          : {scan.vmin} to {scan.vmax}\n"
+                  f"    scale_factor   : {method.scale_factor}\n"
+                  f"    add_offset     : {method.add_offset}")
+        return method
+    if params["debug"]:
+        print(f"Not packing variable {input_var.name}: keeping {method.NSB} "
+              f"bits needs {method.packed_type.name}, using bitshave")
+    return BitShave(input_var, method.NSB, Va, params["conf_int"])
+
+
+def resumed_pack(input_var, output_var, method, Va, params):
+    """Get the bit manipulation of a variable to pack, when the compression is
+    resumed, from the type and attributes of the output variable rather than
+    from a scan of the variable.  Returns the bit manipulation to use, as
+    pack_range."""
+    if "scale_factor" not in output_var.ncattrs():
+        # interrupted before the attributes were set
+        return pack_range(input_var, method, Va, params)
+    if output_var.dtype == input_var.dtype:
+        # packing would not have made the variable smaller
+        return BitShave(input_var, method.NSB, Va, params["conf_int"])
+    method.set_packing(output_var.dtype, output_var.scale_factor,
+                       output_var.add_offset)
+    return method
+
+
+def process_var(input_var, output_group, analysis, params, report,
+                methods=None, journal=None):
+    """Process a single variable, adding the time taken (and the error
+    statistics, if params["verify"] is set) to report.  Returns whether the
+    chunks of the variable still need to be copied.  methods is an optional
+    MethodCache.  If journal (a Journal) is given, each slab is recorded in
+    it once written, and the slabs already written, and the variables
+    already complete, are skipped."""
+    st = time.time()
+    path = var_path(input_var)
+    if journal is not None and path in journal.done:
+        if params["debug"]:
+            print(f"Skipping complete variable: {input_var.name}")
+        report[path] = dict(journal.done[path])
+        return False
+    report[path] = {}
+    # the variable exists if the compression is resumed
+    existing = input_var.name in output_group.variables
+    # are we going to manipulate the bits?
+    bit_manipulate = (output_group.name in analysis["groups"] and 
+        input_var.name in analysis["groups"][output_group.name]["vars"])
+
+    # get the bit manipulation before creating the var, as packing changes
+    # the type of the var
+    pack = None
+    if (bit_manipulate):
+        # get the variable analysis from the analysis dictionary
+        Va = analysis["groups"][output_group.name]["vars"][input_var.name]
+        # packed integers are bit manipulated, and written, as they are
+        # stored, rather than unpacked
+        stored_integers = read_stored_integers(input_var)
+        # a Pack depends on the range of the variable, so cannot be cached
+        if methods is None or params["method"] == "pack":
+            method = get_method(input_var, Va, params)
+        else:
+            method = methods.get(input_var, Va, params)
+        if isinstance(method, Pack):
+            if existing:
+                method = resumed_pack(input_var,
+                                      output_group.variables[input_var.name],
+                                      method, Va, params)
+            else:
+                method = pack_range(input_var, method, Va, params)
+            if isinstance(method, Pack):
+                pack = method
+
+    # create the var
+    if existing:
+        output_var, chunk_copy = existing_output_var(
+            input_var, output_group, params, bit_manipulate, pack
+        )
+    else:
+        output_var, chunk_copy = create_output_var(
+            input_var, output_group, params, bit_manipulate, pack
+        )
+    # bitshave / bitgroom the data if the variable is in the analysis file
+    if (bit_manipulate):
+        if stored_integers:
+            output_var.set_auto_scale(False)
+
+        # add a description of the compression to the variable
+        atts = output_var.__dict__
+        # the _FillValue cannot be set again once a resumed variable has data
+        atts.pop("_FillValue", None)
+        atts["compression"] = (
+            f"ceda-icompress: keepbits: {method.NSB}, "
+            f"method: {method.method}, "
+            f"bitmask: {method.mask:<032b}."
+        )
+        if pack is not None:
+            atts["compression"] += f" packed: {pack.packed_type.name}."
+        # add to the history of the variable, unless it was added before the
+        # compression was interrupted
+        if (not existing or
+            atts.get("history") == input_var.__dict__.get("history")):
+            nowtime = datetime.now().replace(microsecond=0).isoformat()
+            history = (f"{nowtime} altered by ceda-icompress: lossy "
+                       f"compression.")
+            if "history" in atts:
+                atts["history"] += " " + history
+            else:
+                atts["history"] = history
+        output_var.setncatts(atts)
+
+        if params["debug"]:
+            print(
+                f"Processing variable: {input_var.name}\n"
+                f"    Retained bits  : {method.NSB}\n"
+                f"    Bitmask        : {method.mask:<032b}"
+            )
+        # verify the compression by calculating the errors while each slab
+        # is in memory
+        if params["verify"]:
+            stats = ErrorStats(
+                Va["bitinfo"], method.keep_mask, input_var.dtype.itemsize*8
+            )
+        # process the variable in slabs to prevent memory swapping, reading
+        # through a memory map of the file if possible
+        source = var_reader(input_var, params["debug"])
+        slabs = var_slabs(input_var, params["slab_bytes"])
+        for i, s in enumerate(slabs):
+            if (journal is not None and
+                journal.slab_written(output_var, path, i, s)):
+                if params["verify"]:
+                    # compare with the values already written
+                    B = output_var[s]
+                    if pack is not None:
+                        B = pack.unpack(B)
+                    stats.update(source[s], B)
+                continue
+            A = source[s]
+            B = method.process(A)
+            if pack is not None:
+                # netCDF4 does not fill the masked values if the variable has
+                # a scale_factor and is not scaled automatically
+                data = B.filled()
+            else:
+                data = B
+            output_var[s] = data
+            if params["verify"]:
+                # compare the values as they will be read back
+                if pack is not None:
+                    B = pack.unpack(B)
+                stats.update(A, B)
+            if journal is not None:
+                journal.write_slab(output_var, path, i, s, data)
+        ed = time.time()
+        if params["debug"]:
+            print(f"    Slabs          : {len(slabs)} of shape {slabs.slab}")
+            print("    Time taken     :", ed-st)
+        if params["verify"]:
+            res = stats.results()
+            output_var.setncatts(
+                {f"compression_{k}" : res[k] for k in res if k != "elements"}
+            )
+            report[path].update(res)
+            if params["debug"]:
+                for k in res:
+                    print(f"    {k:<15}: {res[k]}")
+    elif not chunk_copy:
+        # copy the variable in slabs, converting the type if requested
+        source = var_reader(input_var, params["debug"])
+        for i, s in enumerate(var_slabs(input_var, params["slab_bytes"])):
+            if (journal is not None and
+                journal.slab_written(output_var, path, i, s)):
+                continue
+            data = source[s]
+            output_var[s] = data
+            if journal is not None:
+                journal.write_slab(output_var, path, i, s, data)
+    report[path]["seconds"] = time.time() - st
+    # the chunks are copied, and recorded, after all the variables
+    if journal is not None and not chunk_copy:
+        journal.write_done(path, report[path], output_var)
+    # return whether the chunks of the variable still need to be copied
+    return chunk_copy
+
+
+def process_groups(input_group, output_group, analysis, params, report,
+                   methods=None, journal=None):
+    """Process the group recursively, returning the paths of the variables
+    whose chunks are to be copied directly.  The time taken (and the error
+    statistics) of each variable are added to report.  If the compression is
+    resumed, the groups and dimensions already in output_group are kept."""
+    # input_group might be a Dataset
+    # copy the metadata
+    atts = input_group.__dict__
+    output_group.setncatts(atts)
+
+    # copy the dimensions
+    for dim in input_group.dimensions:
+        if dim not in output_group.dimensions:
+            copy_dim(input_group.dimensions[dim], output_group)
+    # copy the variables
+    chunk_copy_paths = []
+    for var in input_group.variables:
+        input_var = input_group.variables[var]
+        if process_var(input_var, output_group, analysis, params, report,
+                       methods, journal):
+            chunk_copy_paths.append(var_path(input_var))
+    # copy all the groups belonging to this group recursively
+    for grp in input_group.groups:
+        if grp in output_group.groups:
+            new_group = output_group.groups[grp]
+        else:
+            new_group = output_group.createGroup(grp)
+        chunk_copy_paths.extend(
+            process_groups(
+                input_group.groups[grp], new_group, analysis, params, report,
+                methods, journal
+            )
+        )
+    return chunk_copy_paths
+
+
+def process(input_ds, output_ds, analysis, params, methods=None,
+            journal=None):
+    """Process the input dataset, using the analysis, writing to the output_ds.
+    Returns the time taken by each variable, along with the error statistics
+    if params["verify"] is set.  If journal (a Journal) is given, the
+    progress is recorded in it, and the output_ds can be a partial output,
+    opened to append to, which is completed.  The output_ds is closed if
+    chunks are copied into it, otherwise the caller closes it, e.g. to get
+    the contents of a dataset in memory."""
+    # first copy all the groups, variables and metadata
+    report = {}
+    chunk_copy_paths = process_groups(
+        input_ds, output_ds, analysis, params, report, methods, journal
+    )
+    # copy the compressed chunks of the variables that are not processed,
+    # once netCDF4 has finished with the output file
+    if len(chunk_copy_paths) > 0:
+        output_path = output_ds.filepath()
+        output_ds.close()
+        copy_chunks(input_ds.filepath(), output_path, chunk_copy_paths,
+                    params["debug"])
+        if journal is not None:
+            fsync_file(output_path)
+            for p in chunk_copy_paths:
+                journal.write_done(p, report[p])
+    return report
+
+
+def check_analysis(file, analysis, params, force=False):
+    """Check that the analysis, and the method in params, can be used to
+    compress the file"""
+    # check that the name of the file in the analysis file matches the name of
+    # the input file
+    try:
+        analysis_input_file = analysis["file"]
+    except KeyError:
+        raise AnalysisMismatchError(
+            f"Could not find file key in analysis for file: {file}"
+        )
+    if analysis_input_file != file and not force:
+        raise AnalysisMismatchError(
+            f"Analysed file: {analysis_input_file}, does not match file to be "
+            f"compressed: {file}"
+        )
+
+    # get the bit manipulation method
+    if params["method"] not in METHODS:
+        raise MethodError(
+            f"Unknown bit manipulation method: {params['method']}"
+        )
+    if params.get("int_method", INT_METHODS[0]) not in INT_METHODS:
+        raise MethodError(
+            f"Unknown integer bit manipulation method: {params['int_method']}"
+        )
+
+
+def estimate_var(input_var, group_name, analysis, params):
+    """Estimate the compressed size of a variable, and the time taken to
+    compress it, from a sample of blocks of the variable."""
+    bit_manipulate = (group_name in analysis["groups"] and
+        input_var.name in analysis["groups"][group_name]["vars"])
+    res = {"type" : str(input_var.dtype), "keepbits" : None}
+    # variable length types cannot be compressed in memory
+    if not isinstance(input_var.dtype, np.dtype):
+        return res
+    try:
+        mv = input_var.getncattr("_FillValue")
+    except AttributeError:
+        mv = None
+    if bit_manipulate:
+        read_stored_integers(input_var)
+    blocks, n_blocks = sample_var(input_var, params["samples"])
+    if bit_manipulate:
+        Va = analysis["groups"][group_name]["vars"][input_var.name]
+        method = get_method(input_var, Va, params)
+        res["keepbits"] = int(method.NSB)
+        scan_seconds = 0.0
+        if isinstance(method, Pack):
+            # the range is taken from the sampled blocks only, rather than
+            # the whole variable
+            st = time.time()
+            scan = TypeScan(input_var.dtype)
+            for b in blocks:
+                scan.update(input_var[b])
+            scan_seconds = time.time() - st
+            method = pack_range(input_var, method, Va, params, scan)
+            if isinstance(method, Pack):
+                res["type"] = str(method.packed_type)
+        process_fn = lambda A: np.ma.filled(method.process(A))
+    else:
+        # the type is chosen from a scan of the sampled blocks only, rather
+        # than the whole variable
+        st = time.time()
+        scan = TypeScan(input_var.dtype)
+        for b in blocks:
+            scan.update(input_var[b])
+        scan_seconds = time.time() - st
+        var_type = output_type(input_var, params, False, mv, scan)
+        res["type"] = str(np.dtype(var_type))
+        process_fn = lambda A: np.ma.filled(A).astype(var_type)
+    res.update(estimate_blocks(
+        input_var, blocks, n_blocks, process_fn, params["deflate"]
+    ))
+    # project the time taken to scan the whole variable
+    if len(blocks) > 0:
+        res["seconds"] += scan_seconds * n_blocks / len(blocks)
+    return res
+
+
+def estimate_groups(input_group, analysis, params, estimate):
+    """Estimate the compressed size of each variable in the group, recursively,
+    adding the results to estimate"""
+    for var in input_group.variables:
+        input_var = input_group.variables[var]
+        estimate[var_path(input_var)] = estimate_var(
+            input_var, input_group.name, analysis, params
+        )
+    for grp in input_group.groups:
+        estimate_groups(input_group.groups[grp], analysis, params, estimate)
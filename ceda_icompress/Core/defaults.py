@@ -0,0 +1,14 @@
+"""Default values shared by the library and the command line interfaces.
+Nothing is imported here, so that the command line interfaces can use these
+as the defaults of their options without importing numpy or netCDF4."""
+
+# the bit manipulation methods
+METHODS = ["bitshave", "bitgroom", "bitset", "bitmask", "pack"]
+# the bit manipulation methods for integer variables
+INT_METHODS = ["intround", "intshave"]
+# default number of blocks sampled from each variable, by the estimate and
+# explore
+DEFAULT_SAMPLES = 16
+# default maximum size of an output file compressed in memory (1GB), larger
+# files are written to a temporary file
+DEFAULT_MEMORY_BYTES = 1024 * 1024 * 1024
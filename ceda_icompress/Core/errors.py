@@ -0,0 +1,41 @@
+"""Exceptions raised by the analysis and compression.  They all derive from
+CICError, so that a caller can handle any of them, and the command line
+interfaces print the message and exit."""
+
+class CICError(Exception):
+    pass
+
+
+class InputFileError(CICError):
+    """The input file could not be opened"""
+    pass
+
+
+class OutputFileError(CICError):
+    """The output file could not be created"""
+    pass
+
+
+class NotFoundError(CICError):
+    """A group or variable was not found in the file"""
+    pass
+
+
+class AnalysisMismatchError(CICError):
+    """The analysis cannot be used to compress the file"""
+    pass
+
+
+class MethodError(CICError):
+    """Unknown bit manipulation method"""
+    pass
+
+
+class UnsupportedTypeError(CICError):
+    """The type of the data cannot be analysed or compressed"""
+    pass
+
+
+class ParameterError(CICError):
+    """Unknown or invalid parameter"""
+    pass
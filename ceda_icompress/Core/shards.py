@@ -0,0 +1,224 @@
+"""Compress the variables of a netCDF dataset in parallel.  Writes to a netCDF4
+(HDF5) file are serialised, so rather than writing every variable to the
+output, each variable is compressed by a worker process into its own shard: a
+temporary netCDF4 file that only contains that variable (and its groups and
+dimensions).  The shards are then stitched into the output by copying the
+compressed chunks of each variable directly, without decompressing and
+recompressing them.  The chunks of the variables that are not altered, and
+can be copied from the input (see chunkcopy), are copied from the input when
+the output is stitched.
+
+The shards are written to a temporary directory next to the output file, so
+that they are on the same filesystem, which is removed when the output is
+complete.  Stitching needs h5py."""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress.Core.analysis import load_dataset
+from ceda_icompress.Core.compression import process_var, copy_dim
+from ceda_icompress.IO.chunkcopy import copy_chunks, var_path
+from ceda_icompress.IO.analysisfile import analysis_to_dict
+from ceda_icompress.Core.errors import OutputFileError
+from ceda_icompress.Kernels.registry import share_kernel_threads
+
+def _init_worker(workers):
+    share_kernel_threads(workers)
+
+
+def walk_vars(group):
+    """Get the variables of a group, and its groups recursively, in the order
+    they are written by process_groups"""
+    vars = list(group.variables.values())
+    for grp in group.groups.values():
+        vars.extend(walk_vars(grp))
+    return vars
+
+
+def get_group(ds, path):
+    """Get the group at path in the dataset ds, creating it (and the groups
+    above it) if it does not exist"""
+    group = ds
+    for name in path.strip("/").split("/"):
+        if name == "":
+            continue
+        if name in group.groups:
+            group = group.groups[name]
+        else:
+            group = group.createGroup(name)
+    return group
+
+
+def compress_shard(file, shard, path, analysis, params):
+    """Compress one variable of a file into a shard.  Run in a worker process.
+
+    Args:
+        file (str)      : the netCDF file to compress
+        shard (str)     : the shard to write
+        path (str)      : the path of the variable in the file
+        analysis (dict) : the analysis
+        params (dict)   : the parameters of the compression
+
+    Returns:
+        tuple: (path, chunk_copy, report), whether the chunks of the variable
+               are to be copied from the input, and the time taken (and the
+               error statistics) of the variable
+    """
+    input_ds = load_dataset(file)
+    try:
+        input_var = input_ds[path]
+        shard_ds = Dataset(shard, "w", format="NETCDF4")
+        try:
+            # the dimensions of the variable may be in the groups above it
+            for dim in input_var.get_dims():
+                dim_group = get_group(shard_ds, dim.group().path)
+                if dim.name not in dim_group.dimensions:
+                    copy_dim(dim, dim_group)
+            shard_group = get_group(shard_ds, input_var.group().path)
+            report = {}
+            chunk_copy = process_var(input_var, shard_group, analysis, params,
+                                     report)
+        finally:
+            shard_ds.close()
+    finally:
+        input_ds.close()
+    return path, chunk_copy, report[path]
+
+
+def can_stitch(shard_var):
+    """Check whether the chunks of the variable in a shard can be copied into
+    the output"""
+    return (isinstance(shard_var.dtype, np.dtype) and
+            shard_var.chunking() != "contiguous")
+
+
+def stitch_var(shard_var, output_group):
+    """Create the variable in the output, with the same type, chunking,
+    filters and attributes as in the shard, so that its chunks can be copied.
+    If they cannot be copied, the values are copied as they are stored."""
+    try:
+        mv = shard_var.getncattr("_FillValue")
+    except AttributeError:
+        mv = None
+    chunking = shard_var.chunking()
+    filters = shard_var.filters() or {}
+    output_var = output_group.createVariable(
+        varname = shard_var.name,
+        datatype = shard_var.dtype,
+        dimensions = shard_var.dimensions,
+        compression = "zlib" if filters.get("zlib") else None,
+        complevel = filters.get("complevel", 4),
+        shuffle = filters.get("shuffle", False),
+        fletcher32 = filters.get("fletcher32", False),
+        contiguous = chunking == "contiguous",
+        chunksizes = None if chunking == "contiguous" else chunking,
+        endian = shard_var.endian(),
+        fill_value = mv
+    )
+    atts = shard_var.__dict__
+    atts.pop("_FillValue", None)
+    output_var.setncatts(atts)
+    if not can_stitch(shard_var):
+        shard_var.set_auto_maskandscale(False)
+        output_var.set_auto_maskandscale(False)
+        output_var[...] = shard_var[...]
+    return output_var
+
+
+def stitch_groups(input_group, output_group, shards, chunk_copy_paths):
+    """Create the groups, dimensions and variables of the input in the output,
+    recursively, taking the variables from the shards.  Returns the paths of
+    the variables whose chunks are to be copied from their shard."""
+    output_group.setncatts(input_group.__dict__)
+    for dim in input_group.dimensions:
+        copy_dim(input_group.dimensions[dim], output_group)
+    stitch_paths = []
+    for input_var in input_group.variables.values():
+        path = var_path(input_var)
+        with Dataset(shards[path]) as shard_ds:
+            shard_var = shard_ds[path]
+            stitch_var(shard_var, output_group)
+            if path not in chunk_copy_paths and can_stitch(shard_var):
+                stitch_paths.append(path)
+    for grp in input_group.groups:
+        stitch_paths.extend(
+            stitch_groups(input_group.groups[grp],
+                          output_group.createGroup(grp), shards,
+                          chunk_copy_paths)
+        )
+    return stitch_paths
+
+
+def process_shards(input_ds, output, analysis, params, workers):
+    """Process the input dataset, using the analysis, writing to the output
+    file, with each variable compressed in parallel, by a pool of workers,
+    into a shard, and the shards stitched into the output.  Returns the time
+    taken by each variable, along with the error statistics if
+    params["verify"] is set, as process.
+
+    Args:
+        input_ds (netCDF4.Dataset) : the dataset to compress
+        output (str)               : the netCDF file to write
+        analysis (dict)            : the analysis
+        params (dict)              : the parameters of the compression
+        workers (int)              : the number of worker processes
+
+    Returns:
+        dict: the report of each variable, keyed by its path
+    Raises:
+        OutputFileError: if the shards, or the output, cannot be written
+    """
+    file = input_ds.filepath()
+    paths = [var_path(v) for v in walk_vars(input_ds)]
+    # the analysis is pickled to the workers, so the variables of an npz
+    # analysis file are read first
+    analysis = analysis_to_dict(analysis)
+    try:
+        shard_dir = tempfile.mkdtemp(prefix=".cic_shards_",
+                                     dir=os.path.dirname(output))
+    except OSError as e:
+        raise OutputFileError(
+            f"Could not create the shards of output file {output}, "
+            f"reason: {e}"
+        )
+    try:
+        shards = {p : os.path.join(shard_dir, f"shard_{i}.nc")
+                  for i, p in enumerate(paths)}
+        report = {}
+        chunk_copy_paths = []
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(workers,)) as pool:
+            futures = [pool.submit(compress_shard, file, shards[p], p,
+                                   analysis, params) for p in paths]
+            for f in as_completed(futures):
+                path, chunk_copy, var_report = f.result()
+                report[path] = var_report
+                if chunk_copy:
+                    chunk_copy_paths.append(path)
+        # the report is in the order of the variables
+        report = {p : report[p] for p in paths}
+
+        # stitch the shards into the output
+        try:
+            output_ds = Dataset(output, "w", format="NETCDF4")
+        except Exception as e:
+            raise OutputFileError(
+                f"Could not open output file {str(output)}, reason: {e}"
+            )
+        try:
+            stitch_paths = stitch_groups(input_ds, output_ds, shards,
+                                         chunk_copy_paths)
+        finally:
+            output_ds.close()
+        for p in stitch_paths:
+            copy_chunks(shards[p], output, [p], params["debug"])
+        if len(chunk_copy_paths) > 0:
+            copy_chunks(file, output, chunk_copy_paths, params["debug"])
+    finally:
+        shutil.rmtree(shard_dir, ignore_errors=True)
+    return report
@@ -0,0 +1,156 @@
+"""Explore the trade off between the compressed size and the error of a
+variable (the rate-distortion curve), for every number of significant bits and
+every bit manipulation method.  A sample of blocks of the variable is read
+once, and then each method and number of bits is applied to the blocks in
+memory, by a pool of worker processes."""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from ceda_icompress.BitManipulation.bitshave import BitShave
+from ceda_icompress.BitManipulation.bitgroom import BitGroom
+from ceda_icompress.BitManipulation.bitset import BitSet
+from ceda_icompress.BitManipulation.bitmask import BitMask
+from ceda_icompress.BitManipulation.pack import Pack
+from ceda_icompress.Conversion.narrowing import TypeScan
+from ceda_icompress.InfoMeasures.errorstats import ErrorStats
+from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
+from ceda_icompress.InfoMeasures.keepbits import DEFAULT_CURVE_CIS
+from ceda_icompress.Estimate.predictor import compressed_size
+from ceda_icompress.Kernels.registry import share_kernel_threads
+
+METHODS = {"bitshave" : BitShave,
+           "bitgroom" : BitGroom,
+           "bitset" : BitSet,
+           "bitmask" : BitMask,
+           "pack" : Pack}
+
+# the sampled blocks of the variable being explored, set in each worker by
+# _init_worker so that they are only sent to the worker once
+_blocks = None
+
+def _init_worker(blocks, workers):
+    global _blocks
+    _blocks = blocks
+    share_kernel_threads(workers)
+
+
+def trial(method, NSB, ci, analysis, deflate, blocks=None):
+    """Apply a bit manipulation method to the sampled blocks, and compress
+    them in memory.
+
+    Args:
+        method (str)    : the bit manipulation method
+        NSB (int)       : the number of significant bits, or -1 to derive
+                          them from the analysis
+        ci (float)      : the confidence interval, if NSB is -1
+        analysis (dict) : the analysis of the variable, or None
+        deflate (int)   : the deflate level
+        blocks (list)   : the sampled blocks (default: those in the worker)
+
+    Returns:
+        dict: the number of significant bits, the compressed bytes and the
+              error statistics (see ErrorStats)
+    """
+    if blocks is None:
+        blocks = _blocks
+    man = METHODS[method](blocks[0], NSB, analysis, ci)
+    if method == "pack":
+        scan = TypeScan(blocks[0].dtype)
+        for A in blocks:
+            scan.update(A)
+        man.set_range(scan.vmin, scan.vmax)
+    bitinfo = None if analysis is None else analysis.get("bitinfo")
+    stats = ErrorStats(bitinfo, man.keep_mask, blocks[0].dtype.itemsize*8)
+    raw = 0
+    size = 0
+    for A in blocks:
+        B = man.process(A)
+        raw += A.nbytes
+        size += compressed_size(np.ma.filled(B), deflate)
+        if method == "pack":
+            B = man.unpack(B)
+        stats.update(A, B)
+    res = {"method" : method,
+           "nsb" : int(man.NSB),
+           "bytes" : size,
+           "ratio" : size / raw if raw else 1.0}
+    if method == "pack":
+        res["packed_type"] = man.packed_type.name
+    if NSB == -1:
+        res["ci"] = ci
+    res.update(stats.results())
+    res["bits_per_value"] = 8.0 * size / res["elements"] \
+        if res["elements"] else 0.0
+    return res
+
+
+def trials(dtype, methods, analysis=None, cis=DEFAULT_CURVE_CIS):
+    """Get the trials to run for a variable: every number of significant bits
+    for bitshave, bitgroom, bitset and pack, and a range of confidence
+    intervals for bitmask, which needs the analysis.
+
+    Returns:
+        list<tuple>: (method, NSB, ci) for each trial
+    """
+    sig, man, exp = getsigmanexp(np.dtype(dtype))
+    n_man = man[1] - man[0]
+    tasks = []
+    for m in methods:
+        if m == "bitmask":
+            if analysis is not None:
+                tasks.extend([(m, -1, ci) for ci in cis])
+        else:
+            tasks.extend([(m, nsb, None) for nsb in range(0, n_man+1)])
+    return tasks
+
+
+def frontier(results, metric="rmse"):
+    """Mark the results on the rate-distortion frontier: those for which no
+    other result is both smaller and has a smaller error.  Each result gets
+    a "frontier" key."""
+    best = np.inf
+    for r in sorted(results, key=lambda r: (r["bytes"], r.get(metric, 0.0))):
+        error = r.get(metric, 0.0)
+        r["frontier"] = bool(error < best)
+        if r["frontier"]:
+            best = error
+    return results
+
+
+def explore_blocks(blocks, methods, analysis=None, deflate=1, workers=1,
+                   cis=DEFAULT_CURVE_CIS):
+    """Run every trial on the sampled blocks of a variable.
+
+    Args:
+        blocks (list<numpy array>) : the sampled blocks of the variable
+        methods (list<str>)        : the bit manipulation methods to try
+        analysis (dict)            : the analysis of the variable, or None
+        deflate (int)              : the deflate level
+        workers (int)              : the number of worker processes
+        cis (list<float>)          : the confidence intervals for bitmask
+
+    Returns:
+        list<dict>: the result of each trial (see trial), with those on the
+                    rate-distortion frontier marked
+    """
+    tasks = trials(blocks[0].dtype, methods, analysis, cis)
+    if workers <= 1:
+        results = [trial(m, n, c, analysis, deflate, blocks)
+                   for m, n, c in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=_init_worker,
+                                 initargs=(blocks, workers)) as pool:
+            futures = [pool.submit(trial, m, n, c, analysis, deflate)
+                       for m, n, c in tasks]
+            results = [f.result() for f in futures]
+    # bitmask can give the same mask for different confidence intervals
+    seen = set()
+    unique = []
+    for r in results:
+        key = (r["method"], r["nsb"], r["bytes"])
+        if r["method"] != "bitmask" or key not in seen:
+            unique.append(r)
+            seen.add(key)
+    return frontier(unique)
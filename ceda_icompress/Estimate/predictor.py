@@ -0,0 +1,190 @@
+"""Predict the size of the compressed output, and the time taken to compress
+it, from a random sample of blocks of each variable.  Each block is read,
+processed by the bit manipulation (or type conversion) and compressed in
+memory with the same filters that cic_compress uses, so nothing is written.
+
+The compressed size of a variable is estimated with a ratio estimator: the
+ratio of compressed to uncompressed bytes over the sampled blocks, scaled up
+to the whole variable.  The confidence interval comes from the variance of
+the ratio between blocks, with a finite population correction, so that
+sampling every block gives an exact answer."""
+
+import random
+import time
+import zlib
+import numpy as np
+
+from ceda_icompress.IO.slabs import SlabIterator
+from ceda_icompress.Core.defaults import DEFAULT_SAMPLES
+
+# default size of a sampled block, in bytes (4MB) - close to the size of the
+# chunks that netCDF chooses by default
+DEFAULT_SAMPLE_BYTES = 4 * 1024 * 1024
+# z value for the 95% confidence interval
+Z_95 = 1.959964
+
+def shuffle_bytes(A):
+    """Reorder the bytes of an array in the same way as the HDF5 shuffle
+    filter: the first byte of every element, then the second byte, etc."""
+    A = np.ascontiguousarray(A)
+    b = A.view(np.uint8).reshape(-1, A.dtype.itemsize)
+    return b.T.tobytes()
+
+
+def compressed_size(A, deflate, shuffle=True):
+    """Get the number of bytes that the array A compresses to, using the
+    zlib (deflate) filter at level deflate, after the shuffle filter.
+
+    Args:
+        A (numpy array) : the array to compress
+        deflate (int)   : the deflate level, 0 to 9
+        shuffle (bool)  : apply the shuffle filter first
+
+    Returns:
+        int: the number of compressed bytes
+    """
+    if deflate == 0:
+        return A.nbytes
+    if shuffle:
+        data = shuffle_bytes(A)
+    else:
+        data = np.ascontiguousarray(A).tobytes()
+    return len(zlib.compress(data, deflate))
+
+
+def sample_blocks(shape, itemsize, chunks=None, samples=DEFAULT_SAMPLES,
+                  sample_bytes=DEFAULT_SAMPLE_BYTES, seed=0):
+    """Choose a random sample of blocks of a variable.
+
+    Args:
+        shape (tuple<int>)      : shape of the variable
+        itemsize (int)          : size of a single element in bytes
+        chunks (list<int>|None) : chunk sizes of the variable
+        samples (int)           : maximum number of blocks to sample
+        sample_bytes (int)      : maximum size of a block in bytes
+        seed (int)              : seed of the random number generator, so
+                                  that the estimate can be repeated
+
+    Returns:
+        tuple: (list<tuple<slice>>, int) the sampled blocks and the total
+               number of blocks in the variable
+    """
+    blocks = SlabIterator(shape, itemsize, sample_bytes, chunks)
+    n_blocks = len(blocks)
+    if n_blocks <= samples:
+        return list(blocks), n_blocks
+    chosen = set(random.Random(seed).sample(range(0, n_blocks), samples))
+    sampled = [b for i, b in enumerate(blocks) if i in chosen]
+    return sampled, n_blocks
+
+
+class SizeEstimate:
+    """Accumulate the uncompressed and compressed sizes, and the time taken,
+    of the sampled blocks of a variable."""
+
+    def __init__(self):
+        self.raw = []
+        self.compressed = []
+        self.seconds = 0.0
+
+    def update(self, raw, compressed, seconds):
+        """Add a sampled block.
+
+        Args:
+            raw (int)        : uncompressed size of the block in bytes
+            compressed (int) : compressed size of the block in bytes
+            seconds (float)  : time taken to read, process and compress the
+                               block
+        """
+        self.raw.append(raw)
+        self.compressed.append(compressed)
+        self.seconds += seconds
+
+    def results(self, total_bytes, n_blocks):
+        """Scale the sample up to the whole variable.
+
+        Args:
+            total_bytes (int) : uncompressed size of the whole variable
+            n_blocks (int)    : number of blocks in the whole variable
+
+        Returns:
+            dict: the estimated compressed bytes, with the lower and upper
+                  bounds of the 95% confidence interval, and the projected
+                  time to compress the variable
+        """
+        n = len(self.raw)
+        res = {"samples" : n,
+               "blocks" : n_blocks,
+               "uncompressed_bytes" : int(total_bytes)}
+        raw = np.array(self.raw, dtype=np.float64)
+        comp = np.array(self.compressed, dtype=np.float64)
+        if n == 0 or raw.sum() == 0:
+            res.update({"bytes" : 0, "bytes_low" : 0, "bytes_high" : 0,
+                        "ratio" : 1.0, "seconds" : 0.0})
+            return res
+        ratio = comp.sum() / raw.sum()
+        estimate = ratio * total_bytes
+        if n >= n_blocks:
+            # every block was sampled
+            low = high = estimate
+        elif n < 2:
+            # the variance cannot be estimated from one block
+            low, high = 0.0, float(total_bytes)
+        else:
+            s2 = np.sum((comp - ratio * raw)**2) / (n - 1)
+            fpc = 1.0 - n / n_blocks
+            se = total_bytes / raw.mean() * np.sqrt(fpc * s2 / n)
+            low = max(estimate - Z_95 * se, 0.0)
+            high = estimate + Z_95 * se
+        throughput = raw.sum() / self.seconds if self.seconds > 0 else 0.0
+        res.update({
+            "bytes" : int(round(estimate)),
+            "bytes_low" : int(round(low)),
+            "bytes_high" : int(round(high)),
+            "ratio" : float(ratio),
+            "throughput" : float(throughput),
+            "seconds" : float(total_bytes / throughput) if throughput else 0.0,
+        })
+        return res
+
+
+def sample_var(var, samples=DEFAULT_SAMPLES, sample_bytes=DEFAULT_SAMPLE_BYTES,
+               seed=0):
+    """Choose a random sample of blocks of a netCDF4 variable, aligned with
+    its chunks.  See sample_blocks."""
+    chunks = var.chunking()
+    if chunks == "contiguous":
+        chunks = None
+    return sample_blocks(
+        var.shape, var.dtype.itemsize, chunks, samples, sample_bytes, seed
+    )
+
+
+def estimate_blocks(var, blocks, n_blocks, process, deflate):
+    """Estimate the compressed size of a netCDF4 variable, and the time taken
+    to compress it, from the sampled blocks.
+
+    Args:
+        var (netCDF4.Variable)   : the variable to estimate
+        blocks (list<tuple>)     : the sampled blocks, from sample_var
+        n_blocks (int)           : the number of blocks in the variable
+        process (function)       : applied to each block before compressing
+                                   it, e.g. the bit manipulation.  It should
+                                   return an array of the output type, with
+                                   any masked values filled
+        deflate (int)            : the deflate level
+
+    Returns:
+        dict: see SizeEstimate.results
+    """
+    est = SizeEstimate()
+    itemsize = var.dtype.itemsize
+    for b in blocks:
+        st = time.time()
+        A = process(var[b])
+        size = compressed_size(A, deflate)
+        est.update(A.nbytes, size, time.time() - st)
+        # the output type may be narrower than the input type
+        itemsize = A.dtype.itemsize
+    total_bytes = int(np.prod(var.shape, dtype=np.int64)) * itemsize
+    return est.results(total_bytes, n_blocks)
@@ -0,0 +1,244 @@
+"""Read and write the analysis files created by cic_analyse.
+
+Two formats are supported:
+    json : the whole analysis as a single JSON document
+    npz  : a NumPy .npz (zip) container.  A header holds the file metadata and
+           an index of the groups and variables.  Each variable is stored as
+           separate members, with the arrays (e.g. bitinfo) stored natively,
+           so a single variable can be loaded without reading the rest.
+
+The readers are selected by the format and the version stored in the file.
+numpy is only imported to read or write the npz format, so that cic_display
+starts quickly for a JSON analysis file."""
+
+import json
+from collections.abc import Mapping
+
+from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+from ceda_icompress.Core.errors import CICError
+
+FORMATS = ["json", "npz"]
+# the first bytes of a zip file
+ZIP_MAGIC = b"PK"
+
+class AnalysisFileError(CICError):
+    pass
+
+
+def _to_json(obj):
+    """Convert numpy types for writing to JSON"""
+    import numpy as np
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Cannot convert type to JSON: {type(obj)}")
+
+
+def analysis_to_dict(analysis):
+    """Convert an analysis, in either format, to plain dictionaries, lists and
+    numbers, as read from a JSON analysis file.  The lazy variables of an npz
+    analysis file are read, and the arrays converted to lists, so that the
+    analysis can be written as JSON, or pickled to send to another process.
+
+    Args:
+        analysis (dict) : the analysis, from load_analysis or cic_analyse
+
+    Returns:
+        dict: a copy of the analysis
+    """
+    if isinstance(analysis, Mapping):
+        return {k : analysis_to_dict(x) for k, x in analysis.items()}
+    if isinstance(analysis, (list, tuple)):
+        return [analysis_to_dict(x) for x in analysis]
+    # numpy arrays and scalars
+    if hasattr(analysis, "tolist"):
+        return analysis.tolist()
+    return analysis
+
+
+def export_json(analysis, fh):
+    """Write an analysis, in either format, as JSON to an open file"""
+    out = analysis_to_dict(analysis)
+    out.pop("format", None)
+    json.dump(out, fh)
+
+
+def _write_npz(analysis, fh):
+    """Write the analysis to an open file in the npz format"""
+    import numpy as np
+    members = {}
+    index = {}
+    n = 0
+    for g, grp in analysis["groups"].items():
+        index[g] = {}
+        for v, var in grp["vars"].items():
+            meta = {}
+            arrays = []
+            for k, x in var.items():
+                # lists and arrays are stored natively
+                if isinstance(x, (list, np.ndarray)):
+                    members[f"v{n}.{k}"] = np.asarray(x)
+                    arrays.append(k)
+                else:
+                    meta[k] = x
+            meta["arrays"] = arrays
+            members[f"v{n}.meta"] = np.array(json.dumps(meta, default=_to_json))
+            index[g][v] = n
+            n += 1
+    header = {k : analysis[k] for k in analysis if k != "groups"}
+    header["format"] = "npz"
+    header["index"] = index
+    members["header"] = np.array(json.dumps(header, default=_to_json))
+    np.savez(fh, **members)
+
+
+def write_analysis(analysis, path, format="json"):
+    """Write the analysis to a file.
+
+    Args:
+        analysis (dict) : the analysis, as created by cic_analyse
+        path (str)      : the file to write to
+        format (str)    : the format to write, json | npz
+    """
+    if format not in FORMATS:
+        raise AnalysisFileError(f"Unknown analysis file format: {format}")
+    try:
+        if format == "json":
+            with open(path, "w") as fh:
+                export_json(analysis, fh)
+        else:
+            with open(path, "wb") as fh:
+                _write_npz(analysis, fh)
+    except OSError as e:
+        raise AnalysisFileError(f"Could not write analysis file: {path}, "
+                                f"reason: {e}")
+
+
+class LazyVars(Mapping):
+    """The variables in a group of an npz analysis file.  Each variable is
+    only read from the file when it is first accessed."""
+
+    def __init__(self, npz, index):
+        self._npz = npz
+        self._index = index
+        self._cache = {}
+
+    def __getitem__(self, name):
+        if name not in self._cache:
+            n = self._index[name]
+            var = json.loads(str(self._npz[f"v{n}.meta"]))
+            for k in var.pop("arrays"):
+                var[k] = self._npz[f"v{n}.{k}"]
+            self._cache[name] = var
+        return self._cache[name]
+
+    def __contains__(self, name):
+        # check the index, rather than loading the variable
+        return name in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class Analysis(dict):
+    """An analysis loaded from a file.  For the npz format, the file is kept
+    open to read the variables when they are accessed, and is closed by
+    close, or by using the analysis as a context manager."""
+
+    def __init__(self, analysis, npz=None):
+        super().__init__(analysis)
+        self._npz = npz
+
+    def close(self):
+        """Close the analysis file, if it is still open"""
+        if self._npz is not None:
+            self._npz.close()
+            self._npz = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def to_dict(self):
+        """Get the analysis as plain dictionaries, see analysis_to_dict"""
+        return analysis_to_dict(self)
+
+
+def _read_json_0_1(analysis, path):
+    """Version 0.1 of the json format is the dictionary itself"""
+    return analysis
+
+
+def _read_npz_0_1(npz, header, path):
+    """Version 0.1 of the npz format"""
+    analysis = {k : header[k] for k in header if k != "index"}
+    analysis["groups"] = {
+        g : {"vars" : LazyVars(npz, header["index"][g])}
+        for g in header["index"]
+    }
+    return analysis
+
+# readers, by format and version
+READERS = {
+    "json" : {0.1 : _read_json_0_1},
+    "npz"  : {0.1 : _read_npz_0_1},
+}
+
+def _get_reader(format, version, path):
+    try:
+        return READERS[format][version]
+    except KeyError:
+        raise AnalysisFileError(
+            f"Version of file: {path} does not match current version:"
+            f" {CIC_FILE_FORMAT_VERSION}.  Please recalculate analysis."
+        )
+
+
+def load_analysis(path):
+    """Load an analysis file, in either format.  The format is detected from
+    the contents of the file.
+
+    Args:
+        path (str) : the analysis file to read
+
+    Returns:
+        Analysis: the analysis, a dictionary.  For the npz format, the
+                  variables in each group are loaded when they are accessed,
+                  until the analysis is closed.  Use to_dict to get a copy
+                  that can be written as JSON or pickled.
+    """
+    try:
+        with open(path, "rb") as fh:
+            magic = fh.read(len(ZIP_MAGIC))
+    except FileNotFoundError:
+        raise AnalysisFileError(f"Analysis file cannot be found: {path}")
+    except OSError as e:
+        raise AnalysisFileError(f"Analysis file cannot be read: {path}, "
+                                f"reason: {e}")
+    try:
+        if magic == ZIP_MAGIC:
+            import numpy as np
+            npz = np.load(path)
+            try:
+                header = json.loads(str(npz["header"]))
+                reader = _get_reader("npz", header.get("version"), path)
+                return Analysis(reader(npz, header, path), npz)
+            except Exception:
+                npz.close()
+                raise
+        else:
+            with open(path, "r") as fh:
+                analysis = json.load(fh)
+            reader = _get_reader("json", analysis.get("version"), path)
+            return Analysis(reader(analysis, path))
+    except AnalysisFileError:
+        raise
+    except Exception as e:
+        raise AnalysisFileError(f"Analysis file cannot be parsed: {path}, "
+                                f"reason: {e}")
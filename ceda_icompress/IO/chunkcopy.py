@@ -0,0 +1,105 @@
+"""Copy the compressed chunks of a variable directly from the input file to the
+output file, without decompressing and recompressing them.  This is used for
+variables that are not bit manipulated and whose filters already match those
+that would be used to write the output.
+
+Uses h5py, which is an optional dependency.  If h5py is not installed then
+variables are copied in the usual way."""
+
+import numpy as np
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+# formats of netCDF file that are stored as HDF5
+HDF5_FORMATS = ["NETCDF4", "NETCDF4_CLASSIC"]
+
+def target_filters(params):
+    """Get the filters that cic_compress uses to write a variable, in the
+    same form as netCDF4.Variable.filters()"""
+    return {
+        "zlib" : params["deflate"] > 0,
+        "complevel" : params["deflate"],
+        "shuffle" : True,
+        "fletcher32" : False,
+    }
+
+
+def can_copy_chunks(input_var, var_type, params):
+    """Determine whether the chunks of the input variable can be copied
+    directly into the output variable.
+
+    Args:
+        input_var (netCDF4.Variable) : the variable to copy
+        var_type (numpy dtype)       : the type of the output variable
+        params (dict)                : parameters of cic_compress
+
+    Returns:
+        tuple: (bool, str) whether the chunks can be copied and, if not, the
+               reason why not
+    """
+    if h5py is None:
+        return False, "h5py is not installed"
+    if input_var.group().data_model not in HDF5_FORMATS:
+        return False, "input file is not HDF5"
+    if not isinstance(input_var.dtype, np.dtype):
+        return False, "variable length type"
+    if var_type != input_var.dtype:
+        return False, "type is converted"
+    if input_var.chunking() == "contiguous":
+        return False, "variable is not chunked"
+    filters = input_var.filters()
+    if filters is None:
+        return False, "variable has no filters"
+    # any filters not written by cic_compress (e.g. szip, zstd) mean the
+    # chunks cannot be copied
+    target = target_filters(params)
+    for f in filters:
+        if filters[f] != target.get(f, False):
+            return False, f"filter {f} differs"
+    return True, ""
+
+
+def var_path(var):
+    """Get the path to a netCDF4 variable in the HDF5 file"""
+    path = var.group().path
+    if path == "/":
+        return "/" + var.name
+    return path + "/" + var.name
+
+
+def copy_chunks(input_file, output_file, paths, debug=False):
+    """Copy the chunks of the variables from the input file to the output
+    file.  The output variables must have been created with the same type,
+    chunking and filters as the input variables, and the output file must
+    have been closed by netCDF4.
+
+    Args:
+        input_file (str)  : path of the input file
+        output_file (str) : path of the output file
+        paths (list<str>) : paths of the variables in the HDF5 files
+        debug (bool)      : print debug information
+
+    Returns:
+        int: the number of bytes copied
+    """
+    n_bytes = 0
+    with h5py.File(input_file, "r") as fin, h5py.File(output_file, "r+") as fout:
+        for p in paths:
+            src = fin[p]
+            dst = fout[p]
+            if dst.shape != src.shape:
+                dst.resize(src.shape)
+            v_bytes = 0
+            for i in range(0, src.id.get_num_chunks()):
+                info = src.id.get_chunk_info(i)
+                mask, chunk = src.id.read_direct_chunk(info.chunk_offset)
+                dst.id.write_direct_chunk(info.chunk_offset, chunk, mask)
+                v_bytes += len(chunk)
+            if debug:
+                print(f"Copied chunks of variable: {p}\n"
+                      f"    Bytes          : {v_bytes}")
+            n_bytes += v_bytes
+    return n_bytes
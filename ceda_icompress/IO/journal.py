@@ -0,0 +1,289 @@
+"""A journal of the compression of a file, so that a compression that is
+interrupted (e.g. by the node being pre-empted) can be resumed from the last
+slab written, rather than started again.
+
+The journal is a sidecar file, next to the output file, with one JSON record
+per line:
+
+    {"header" : ...}                      the input file, the analysis and
+                                          the parameters
+    {"var" : path, "slab" : i, "crc" : c} slab i of the variable has been
+                                          written, with the CRC32 checksum c
+                                          of the values stored in the file
+    {"var" : path, "done" : report}       the variable is complete
+
+The output file is flushed to disk before each record is written, and the
+journal after it, so that every slab in the journal is on disk.  When the
+compression is resumed, the slabs in the journal are checked by reading back
+the values stored in the output file and comparing their checksum, which only
+needs the chunks to be decompressed, and the slabs that are missing or do not
+match are written again.  The journal is removed when the compression is
+complete."""
+
+import os
+import json
+import zlib
+import numpy as np
+from netCDF4 import default_fillvals
+
+from ceda_icompress.Core.errors import OutputFileError
+from ceda_icompress.IO.analysisfile import analysis_to_dict
+
+# the journal of an output file is the output file name with this suffix
+JOURNAL_SUFFIX = ".journal"
+# the parameters that do not change the output file, and so can differ when
+# the compression is resumed
+RESUME_PARAMS = ["debug", "samples", "resume"]
+
+def journal_path(output):
+    """Get the path of the journal of the output file"""
+    return str(output) + JOURNAL_SUFFIX
+
+
+def journal_header(file, analysis, params):
+    """Get the header of the journal, which has to match for the compression
+    to be resumed.
+
+    Args:
+        file (str)      : the input file
+        analysis (dict) : the analysis used to compress the file
+        params (dict)   : the parameters of the compression
+
+    Returns:
+        dict: the header, which can be written as JSON
+    """
+    # the contents of the analysis, whichever format it was read from
+    analysis_crc = zlib.crc32(
+        json.dumps(analysis_to_dict(analysis), sort_keys=True).encode()
+    )
+    return {"file" : str(file),
+            "analysis" : analysis_crc,
+            "params" : {p : params[p] for p in sorted(params)
+                        if p not in RESUME_PARAMS}}
+
+
+def array_checksum(data):
+    """Get the CRC32 checksum of an array of values"""
+    # variable length types are arrays of objects
+    if data.dtype.kind == "O":
+        return zlib.crc32(
+            "\0".join(str(x) for x in data.ravel()).encode()
+        )
+    # the values are compared in the native byte order
+    data = data.astype(data.dtype.newbyteorder("="), copy=False)
+    return zlib.crc32(np.ascontiguousarray(data).tobytes())
+
+
+def slab_checksum(var, slab):
+    """Get the CRC32 checksum of the values of a slab of a netCDF4 variable,
+    as they are stored in the file, i.e. not masked or scaled."""
+    mask, scale = var.mask, var.scale
+    var.set_auto_maskandscale(False)
+    try:
+        data = np.asarray(var[slab])
+    finally:
+        var.set_auto_mask(mask)
+        var.set_auto_scale(scale)
+    return array_checksum(data)
+
+
+def stored_values(var, data):
+    """Get the values that are stored in the file when data is written to a
+    netCDF4 variable, following the conversions made by netCDF4: if the
+    variable is scaled automatically, the values are packed with its
+    scale_factor and add_offset, and the masked values are filled, then the
+    values are converted to the type of the variable.
+
+    Args:
+        var (netCDF4.Variable) : the variable written to
+        data (np.ndarray)      : the values written to the variable
+
+    Returns:
+        np.ndarray: the values as they are stored in the file
+    """
+    # variable length types are written as they are
+    if not isinstance(var.dtype, np.dtype):
+        return np.asarray(data)
+    packed = hasattr(var, "scale_factor") or hasattr(var, "add_offset")
+    if not np.ma.isMA(data):
+        # the values are not converted until they have been scaled if the
+        # variable has an add_offset, or is an integer with a scale_factor
+        if ((var.scale and var.dtype.kind in "iu" and
+             hasattr(var, "scale_factor")) or hasattr(var, "add_offset")):
+            data = np.array(data, np.float64)
+        else:
+            data = np.array(data, var.dtype)
+    if var.scale:
+        if hasattr(var, "add_offset"):
+            data = data - var.add_offset
+        if hasattr(var, "scale_factor"):
+            data = data / var.scale_factor
+        if packed and var.dtype.kind in "iu":
+            data = np.around(data)
+        data = data.astype(var.dtype)
+        if np.ma.isMA(data):
+            data = _fill(var, data)
+    # otherwise the values under the mask are written
+    return np.ma.getdata(data).astype(var.dtype, copy=False)
+
+
+def _fill(var, data):
+    """Fill the masked values of data, as netCDF4 does when writing them to
+    a variable that is scaled automatically"""
+    if hasattr(var, "missing_value"):
+        if np.all(np.isin(data.data[data.mask], var.missing_value)):
+            return data.data
+        fill = np.ravel(var.missing_value)[0]
+    elif hasattr(var, "_FillValue"):
+        fill = var._FillValue
+    else:
+        fill = default_fillvals[var.dtype.str[1:]]
+    return data.filled(fill)
+
+
+def fsync_file(path):
+    """Flush a file, which has been written by another library, to disk"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_var(var):
+    """Flush the file of a netCDF4 variable to disk"""
+    group = var.group()
+    group.sync()
+    fsync_file(group.filepath())
+
+
+def _plain(x):
+    """Convert the numpy scalars in a record, e.g. the error statistics, to
+    the python types that can be written as JSON"""
+    return x.item()
+
+
+class Journal:
+    """The journal of the compression of a file, see the module
+    documentation."""
+
+    def __init__(self, path, header, resume=False):
+        """Open the journal, reading it if the compression is resumed, or
+        creating it otherwise.
+
+        Args:
+            path (str)    : the path of the journal
+            header (dict) : the header of the journal, see journal_header
+            resume (bool) : read the journal, to resume the compression
+        Side effects:
+            self.slabs (dict) : the checksums of the slabs written, keyed by
+                                the path of the variable, then the slab
+            self.done (dict)  : the report of the variables that are
+                                complete, keyed by the path of the variable
+        Raises:
+            OutputFileError: if the journal cannot be read or written, or
+                             was written by a different compression
+        """
+        self.path = path
+        self.slabs = {}
+        self.done = {}
+        if resume:
+            torn = self._read(header)
+            mode = "a"
+        else:
+            mode = "w"
+        try:
+            self.fh = open(path, mode)
+        except OSError as e:
+            raise OutputFileError(
+                f"Could not open journal file {path}, reason: {e}"
+            )
+        if not resume:
+            self._write({"header" : header})
+        elif torn:
+            # end the record that was cut short, so that the next record is
+            # written on a line of its own
+            self.fh.write("\n")
+
+    def _read(self, header):
+        """Read the records of the journal.  Returns whether the last record
+        was cut short, i.e. the journal does not end with a new line."""
+        try:
+            with open(self.path) as fh:
+                text = fh.read()
+        except OSError as e:
+            raise OutputFileError(
+                f"Could not read journal file {self.path}, reason: {e}"
+            )
+        records = []
+        for l in text.splitlines():
+            try:
+                records.append(json.loads(l))
+            except json.JSONDecodeError:
+                # a record cut short by an interruption is skipped, and the
+                # records after it, written by a later resume, are still read
+                continue
+        # compare the header as it would be read back from the journal
+        if (len(records) == 0 or
+            records[0].get("header") != json.loads(json.dumps(header))):
+            raise OutputFileError(
+                f"Cannot resume compression from journal file {self.path}: "
+                f"it was written for a different input file, analysis or "
+                f"parameters"
+            )
+        for r in records[1:]:
+            if "slab" in r:
+                self.slabs.setdefault(r["var"], {})[r["slab"]] = r["crc"]
+            elif "done" in r:
+                self.done[r["var"]] = r["done"]
+        return text != "" and not text.endswith("\n")
+
+    def _write(self, record):
+        """Write a record to the journal, and flush it to disk"""
+        self.fh.write(json.dumps(record, default=_plain) + "\n")
+        self.fh.flush()
+        os.fsync(self.fh.fileno())
+
+    def slab_written(self, var, path, i, slab):
+        """Check that slab i of the variable has been written, as recorded in
+        the journal.
+
+        Args:
+            var (netCDF4.Variable) : the output variable
+            path (str)             : the path of the variable
+            i (int)                : the index of the slab
+            slab (tuple<slice>)    : the slab
+
+        Returns:
+            bool: whether the slab is in the journal, and its checksum
+                  matches the values in the output file
+        """
+        crc = self.slabs.get(path, {}).get(i)
+        return crc is not None and slab_checksum(var, slab) == crc
+
+    def write_slab(self, var, path, i, slab, data):
+        """Record that slab i of the variable has been written, once the
+        output file is on disk.  The checksum is taken from the values
+        written, data, rather than read back from the file."""
+        sync_var(var)
+        crc = array_checksum(stored_values(var, data))
+        self.slabs.setdefault(path, {})[i] = crc
+        self._write({"var" : path, "slab" : i, "crc" : crc})
+
+    def write_done(self, path, report, var=None):
+        """Record that the variable is complete, with its report, once the
+        output variable var, if given, is on disk"""
+        if var is not None:
+            sync_var(var)
+        self.done[path] = report
+        self._write({"var" : path, "done" : report})
+
+    def close(self):
+        """Close the journal, keeping it so the compression can be resumed"""
+        if not self.fh.closed:
+            self.fh.close()
+
+    def remove(self):
+        """Close and remove the journal, once the compression is complete"""
+        self.close()
+        os.remove(self.path)
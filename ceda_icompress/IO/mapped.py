@@ -0,0 +1,295 @@
+"""Read variables through a memory map of the file, rather than through the
+netCDF library, for the layouts where the values are stored unaltered at a
+known place in the file:
+
+    netCDF3 files (classic, 64 bit offset and 64 bit data), where the offset
+    of each variable is in the header, and record variables are interleaved
+    with a fixed stride.
+
+    HDF5 (netCDF4) files, for variables with contiguous storage and no
+    filters.  The offset is found with h5py, which is an optional dependency.
+
+Slabs of a mapped variable are views of the page cache, so the data is not
+copied by the netCDF library.  The values are masked where they equal the
+_FillValue, as netCDF4 does.  The kernels work on values in native byte order,
+so values stored in the other byte order (for example, all netCDF3 files on
+little endian machines) are byte swapped, in a single copy, as they are read.
+"""
+
+import os
+import struct
+from functools import lru_cache
+import numpy as np
+from netCDF4 import default_fillvals
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+from ceda_icompress.IO.chunkcopy import var_path, HDF5_FORMATS
+
+NC3_FORMATS = ["NETCDF3_CLASSIC", "NETCDF3_64BIT_OFFSET", "NETCDF3_64BIT_DATA"]
+# nc_type in the netCDF3 header, and the type it is stored as
+NC3_TYPES = {1 : ">i1", 2 : "S1", 3 : ">i2", 4 : ">i4", 5 : ">f4", 6 : ">f8",
+             7 : ">u1", 8 : ">u2", 9 : ">u4", 10 : ">i8", 11 : ">u8"}
+# tags in the netCDF3 header
+NC_DIMENSION = 0x0A
+NC_VARIABLE = 0x0B
+NC_ATTRIBUTE = 0x0C
+# attributes that make netCDF4 return values different to those stored
+UNMAPPED_ATTS = ["scale_factor", "add_offset", "missing_value", "valid_min",
+                 "valid_max", "valid_range", "_Unsigned"]
+
+class MapError(Exception):
+    pass
+
+
+class _Header:
+    """Read the fields of a netCDF3 header, in big endian order"""
+
+    def __init__(self, fh):
+        self.fh = fh
+        magic = fh.read(4)
+        if magic[:3] != b"CDF" or magic[3] not in [1, 2, 5]:
+            raise MapError("not a netCDF3 file")
+        self.version = magic[3]
+
+    def int(self):
+        return struct.unpack(">i", self.fh.read(4))[0]
+
+    def size(self):
+        """Read a count, which is 64 bit in the 64 bit data format"""
+        if self.version == 5:
+            return struct.unpack(">q", self.fh.read(8))[0]
+        return struct.unpack(">i", self.fh.read(4))[0]
+
+    def offset(self):
+        """Read an offset, which is 64 bit except in the classic format"""
+        if self.version == 1:
+            return struct.unpack(">i", self.fh.read(4))[0]
+        return struct.unpack(">q", self.fh.read(8))[0]
+
+    def name(self):
+        n = self.size()
+        name = self.fh.read(n).decode("utf-8")
+        self.fh.read(-n % 4)
+        return name
+
+    def list_size(self, tag, kind):
+        """Read the tag and the number of elements of a list, checking that
+        the tag is tag, or zero if the list is absent"""
+        t = self.int()
+        n = self.size()
+        if t not in [0, tag]:
+            raise MapError(f"corrupt {kind} list")
+        return n
+
+    def skip_atts(self):
+        n = self.list_size(NC_ATTRIBUTE, "attribute")
+        for i in range(0, n):
+            self.name()
+            nc_type = self.int()
+            nelems = self.size()
+            nbytes = nelems * np.dtype(NC3_TYPES[nc_type]).itemsize
+            self.fh.read(nbytes + (-nbytes % 4))
+
+
+def read_nc3_header(path):
+    """Read the layout of the variables from the header of a netCDF3 file.
+
+    Args:
+        path (str) : the netCDF3 file
+
+    Returns:
+        dict: for each variable, its type, dimension lengths, offset (begin)
+              and whether it is a record variable, and the record size
+    """
+    with open(path, "rb") as fh:
+        hdr = _Header(fh)
+        hdr.size()              # numrecs, the netCDF library knows this
+        # dimensions
+        n = hdr.list_size(NC_DIMENSION, "dimension")
+        dims = []
+        for i in range(0, n):
+            hdr.name()
+            dims.append(hdr.size())
+        # global attributes
+        hdr.skip_atts()
+        # variables
+        n = hdr.list_size(NC_VARIABLE, "variable")
+        vars = {}
+        for i in range(0, n):
+            name = hdr.name()
+            ndims = hdr.size()
+            dimids = [hdr.size() for d in range(0, ndims)]
+            hdr.skip_atts()
+            nc_type = hdr.int()
+            vsize = hdr.size()
+            begin = hdr.offset()
+            vars[name] = {
+                "type" : NC3_TYPES[nc_type],
+                "record" : ndims > 0 and dims[dimids[0]] == 0,
+                "vsize" : vsize,
+                "begin" : begin,
+            }
+    # the record size is the sum of the (padded) sizes of the record
+    # variables, except that a single record variable is not padded
+    records = [v for v in vars.values() if v["record"]]
+    recsize = sum(v["vsize"] for v in records)
+    return {"vars" : vars, "recsize" : recsize, "nrecvars" : len(records)}
+
+
+@lru_cache(maxsize=4)
+def _file_map(path, mtime, size):
+    """Memory map the whole of a file, read only.  The modification time and
+    size are part of the cache key, so a changed file is mapped again."""
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def _nc3_layout(var):
+    """Get the offset, type and strides of a variable in a netCDF3 file"""
+    path = var.group().filepath()
+    header = read_nc3_header(path)
+    try:
+        v = header["vars"][var.name]
+    except KeyError:
+        raise MapError("variable not found in header")
+    dtype = np.dtype(v["type"])
+    shape = var.shape
+    # C order strides of the variable, or of one record of it
+    strides = []
+    stride = dtype.itemsize
+    for s in reversed(shape):
+        strides.insert(0, stride)
+        stride *= s
+    if v["record"]:
+        if header["nrecvars"] == 1:
+            strides[0] = stride // max(shape[0], 1)
+        else:
+            strides[0] = header["recsize"]
+    return path, v["begin"], dtype, tuple(strides)
+
+
+def _hdf5_layout(var):
+    """Get the offset, type and strides of a contiguous variable in an HDF5
+    file"""
+    if h5py is None:
+        raise MapError("h5py is not installed")
+    path = var.group().filepath()
+    with h5py.File(path, "r") as fh:
+        dset = fh[var_path(var)]
+        if dset.chunks is not None:
+            raise MapError("variable is chunked")
+        if dset.id.get_create_plist().get_nfilters() > 0:
+            raise MapError("variable has filters")
+        offset = dset.id.get_offset()
+        dtype = dset.dtype
+    if offset is None:
+        raise MapError("variable has no storage")
+    strides = []
+    stride = dtype.itemsize
+    for s in reversed(var.shape):
+        strides.insert(0, stride)
+        stride *= s
+    return path, offset, dtype, tuple(strides)
+
+
+class MappedVariable:
+    """A read only variable backed by a memory map of the file.  Indexing it
+    with slices gives a masked array, as indexing a netCDF4 variable does."""
+
+    def __init__(self, var):
+        """
+        Args:
+            var (netCDF4.Variable) : the variable to map
+        Side effects:
+            self.array (numpy array) : view of the mapped file, in the byte
+                                       order of the file
+            self.fill_value          : the value that is masked, or None
+        Raises:
+            MapError: if the variable cannot be mapped
+        """
+        if not isinstance(var.dtype, np.dtype) or var.dtype.kind not in "iuf":
+            raise MapError("type cannot be mapped")
+        atts = var.ncattrs()
+        for a in UNMAPPED_ATTS:
+            if a in atts:
+                raise MapError(f"variable has the {a} attribute")
+        # the value that netCDF4 masks
+        if "_FillValue" in atts:
+            self.fill_value = var.getncattr("_FillValue")
+        elif var.dtype.itemsize == 1:
+            # whether netCDF4 masks the default fill value of a byte
+            # depends on the fill mode of the variable
+            raise MapError("byte variable has no _FillValue")
+        else:
+            self.fill_value = default_fillvals[var.dtype.str[1:]]
+
+        data_model = var.group().data_model
+        if data_model in NC3_FORMATS:
+            path, offset, dtype, strides = _nc3_layout(var)
+        elif data_model in HDF5_FORMATS:
+            path, offset, dtype, strides = _hdf5_layout(var)
+        else:
+            raise MapError(f"{data_model} files cannot be mapped")
+        if dtype.newbyteorder("=") != var.dtype.newbyteorder("="):
+            raise MapError("type in file does not match")
+
+        st = os.stat(path)
+        # check that all of the variable is in the file
+        end = offset
+        if 0 not in var.shape:
+            end += sum((s-1) * t for s, t in zip(var.shape, strides))
+            end += dtype.itemsize
+        if end > st.st_size:
+            raise MapError("variable extends beyond the end of the file")
+        mm = _file_map(path, st.st_mtime, st.st_size)
+        self.array = np.ndarray(var.shape, dtype=dtype, buffer=mm,
+                                offset=offset, strides=strides)
+        self.shape = self.array.shape
+        self.dtype = dtype.newbyteorder("=")
+        self.name = var.name
+
+    def __getitem__(self, s):
+        if isinstance(s, list):
+            s = tuple(s)
+        if self.array.ndim == 0:
+            # a view of a scalar, rather than a copy of its value
+            s = Ellipsis
+        # indexing with integers gives a numpy scalar, rather than an array
+        A = np.asarray(self.array[s])
+        if not A.dtype.isnative:
+            A = A.astype(self.dtype)
+        if self.fill_value is None:
+            return np.ma.asarray(A)
+        if np.isnan(self.fill_value):
+            mask = np.isnan(A)
+        else:
+            mask = A == self.fill_value
+        return np.ma.masked_where(mask, A, copy=False)
+
+
+def var_reader(var, debug=False):
+    """Get the fastest way of reading a netCDF4 variable: a MappedVariable if
+    the variable can be mapped, otherwise the variable itself.  Both can be
+    indexed in the same way."""
+    try:
+        return MappedVariable(var)
+    except (MapError, OSError) as e:
+        if debug:
+            print(f"Not mapping variable: {var.name}\n"
+                  f"    Reason         : {e}")
+        return var
+
+
+def read_stored_integers(var):
+    """Read an integer variable as the integers stored in the file, rather
+    than unpacked by its scale_factor and add_offset to floating point
+    numbers, so that packed variables are analysed and bit manipulated as the
+    integers they are stored as.  Returns whether the variable is read as
+    integers."""
+    if not isinstance(var.dtype, np.dtype) or var.dtype.kind not in "iu":
+        return False
+    var.set_auto_scale(False)
+    return True
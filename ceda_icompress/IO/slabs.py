@@ -0,0 +1,113 @@
+"""Split an N-dimensional variable into slabs that fit in a memory budget, so
+that large variables can be streamed through the analysis and compression,
+rather than loaded all at once."""
+
+import itertools
+import numpy as np
+
+# default maximum size of a slab, in bytes (256MB)
+DEFAULT_SLAB_BYTES = 256 * 1024 * 1024
+
+def slab_shape(shape, itemsize, max_bytes=DEFAULT_SLAB_BYTES, chunks=None):
+    """Determine the shape of a slab that is no larger than max_bytes.
+    The slab spans the innermost dimensions in full and is split along the
+    outermost dimensions.  If chunks are given, the split dimension is
+    rounded down to a multiple of the chunk size so that each slab reads
+    whole chunks.
+
+    Args:
+        shape (tuple<int>)      : shape of the variable
+        itemsize (int)          : size of a single element in bytes
+        max_bytes (int)         : maximum size of a slab in bytes
+        chunks (list<int>|None) : chunk sizes of the variable, or None if
+                                  the variable is contiguous
+
+    Returns:
+        tuple<int>: the shape of a slab
+    """
+    shape = tuple(int(s) for s in shape)
+    # at least one element must be processed per slab
+    max_elems = max(max_bytes // itemsize, 1)
+    slab = [1] * len(shape)
+    for i in range(0, len(shape)):
+        # number of elements in the dimensions inside this one
+        inner = int(np.prod(shape[i+1:], dtype=np.int64))
+        if inner * shape[i] <= max_elems:
+            # whole of this dimension and all inner ones fit
+            slab[i:] = shape[i:]
+            break
+        elif inner <= max_elems:
+            # split along this dimension
+            n = max_elems // inner
+            if chunks is not None and chunks[i] <= n:
+                n = (n // chunks[i]) * chunks[i]
+            slab[i] = n
+            slab[i+1:] = shape[i+1:]
+            break
+        # otherwise this dimension is iterated one element at a time
+    return tuple(slab)
+
+
+class SlabIterator:
+    """Iterate over a variable in slabs, yielding a tuple of slices for each
+    slab.  The slices can be used to index both a netCDF4 variable and a
+    numpy array."""
+
+    def __init__(self, shape, itemsize, max_bytes=DEFAULT_SLAB_BYTES,
+                 chunks=None):
+        """
+        Args:
+            shape (tuple<int>)      : shape of the variable
+            itemsize (int)          : size of a single element in bytes
+            max_bytes (int)         : maximum size of a slab in bytes
+            chunks (list<int>|None) : chunk sizes of the variable
+        Side effects:
+            self.shape (tuple<int>) : the shape of the variable
+            self.slab (tuple<int>)  : the shape of each (full) slab
+        """
+        self.shape = tuple(int(s) for s in shape)
+        self.slab = slab_shape(self.shape, itemsize, max_bytes, chunks)
+
+    def __len__(self):
+        """Number of slabs the variable is split into"""
+        n = 1
+        for s, l in zip(self.shape, self.slab):
+            if s == 0:
+                return 0
+            n *= -(-s // l)
+        return n
+
+    def __iter__(self):
+        # scalar variables are a single slab
+        if len(self.shape) == 0:
+            yield ()
+            return
+        # nothing to iterate over if any dimension is empty
+        if 0 in self.shape:
+            return
+        starts = [range(0, s, l) for s, l in zip(self.shape, self.slab)]
+        for st in itertools.product(*starts):
+            yield tuple(
+                slice(b, min(b+l, s), 1)
+                for b, l, s in zip(st, self.slab, self.shape)
+            )
+
+
+def var_slabs(var, max_bytes=DEFAULT_SLAB_BYTES):
+    """Create a SlabIterator for a netCDF4 variable, aligning the slabs with
+    the chunking of the variable.
+
+    Args:
+        var (netCDF4.Variable) : the variable to iterate over
+        max_bytes (int)        : maximum size of a slab in bytes
+
+    Returns:
+        SlabIterator: the iterator over the slabs of the variable
+    """
+    chunks = var.chunking()
+    if chunks == "contiguous":
+        chunks = None
+    # variable length types (e.g. strings) do not have an itemsize, so
+    # estimate it as the size of a pointer
+    itemsize = np.dtype(var.dtype).itemsize or 8
+    return SlabIterator(var.shape, itemsize, max_bytes, chunks)
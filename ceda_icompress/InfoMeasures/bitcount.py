@@ -1,12 +1,14 @@
 import numpy as np
 
 from ceda_icompress.InfoMeasures.whichUint import whichUint
+from ceda_icompress.Kernels.registry import get_kernel
 
 def bitcount(A):
     """Calculate the number of times that bit=1 occurs at each bit position in
     the type of the input array, across all array elements.
     For example, in a 32 bit type, count how many 1s are in position 0 across
-    the whole array.  Repeat for the other 31 positions.
+    the whole array.  Repeat for the other 31 positions.  Masked elements are
+    not counted.
 
     Code inspired by https://github.com/esowc/Elefridge.jl
 
@@ -20,26 +22,55 @@ def bitcount(A):
                         32               for an int / float.
                         64               for a long int / double
     """
-    # get the UInt type of the array so we can create the count array
+    # get the UInt type of the array
     t_uint = whichUint(A.dtype)             # type
-    n_bits = A.itemsize*8                   # number of bits per array element
-    N = np.zeros((n_bits,), dtype=np.int32) # count array
-
-    # convert the array to a view of the array in the UInt type and flatten it
-    Av = A.view(dtype=t_uint).flatten()
-
-    # now loop over each element of the array and count the bits in the position
-    for b in np.arange(0, n_bits, dtype=t_uint):
-        # define the mask based on the datatype
-        mask = t_uint(0b1) << b
-        # mask with the whole array
-        Ar = np.ma.bitwise_and(Av, mask)
-        # count
-        N[b] = np.count_nonzero(Ar)
-    return N
+
+    # convert the array to a view of the array in the UInt type and flatten
+    # the unmasked elements
+    Av = np.ma.asarray(A).view(dtype=t_uint).compressed()
+
+    # count the bits in each position
+    return get_kernel("bitcount")(Av)
+
+
+def batch_shape(A, batch_axes):
+    """Normalise the batch axes of the array A.
+
+    Args:
+        A (numpy array)               : the array to batch
+        batch_axes (int|tuple|None)   : the axes to batch over, None for none
+
+    Returns:
+        tuple: the batch axes, as non-negative ints, and the shape of the
+               batch
+    Raises:
+        ValueError: if an axis is out of range, or repeated
+    """
+    if batch_axes is None:
+        batch_axes = ()
+    elif isinstance(batch_axes, (int, np.integer)):
+        batch_axes = (batch_axes,)
+    axes = []
+    for a in batch_axes:
+        if a < -A.ndim or a >= A.ndim:
+            raise ValueError(f"Batch axis {a} is out of range for an array "
+                             f"with {A.ndim} dimensions")
+        a = int(a) % A.ndim
+        if a in axes:
+            raise ValueError(f"Batch axis {a} is repeated")
+        axes.append(a)
+    return tuple(axes), tuple(A.shape[a] for a in axes)
+
+
+def batch_rows(A, batch_axes):
+    """Reshape the array A so that each batch is a row, with the batch axes
+    (see batch_shape) in order first"""
+    n_batch = int(np.prod([A.shape[a] for a in batch_axes], dtype=np.int64))
+    Am = np.moveaxis(A, batch_axes, tuple(range(0, len(batch_axes))))
+    return Am.reshape((n_batch, -1))
 
 
-def bitpaircount(A, B):
+def bitpaircount(A, B, batch_axes=None, valid=None):
     """Calculate the number of times that bitpairs occur at each bit position in
     the input array (A) compared to the array (B).
     The bit pairs are: 00, 01, 10, 11
@@ -50,46 +81,54 @@ def bitpaircount(A, B):
       4. how many 11s are in position An & Bn
     Repeat for n=0..N, where N is the maximum size of the two flattened arrays
 
+    If batch_axes are given, the pairs are counted separately for each index
+    of the batch axes (e.g. each level, or each time), in a single pass over
+    the arrays.
+
+    Args:
+        A, B (numpy array)          : the arrays to count the bit pairs of,
+                                      with the same shape
+        batch_axes (int|tuple|None) : the axes to count each index of
+                                      separately
+        valid (numpy array|None)    : the pairs to count, with the same
+                                      shape.  If None, the pairs where
+                                      neither A or B is masked.
+
     Returns:
-     numpy array(4,B): the bit pair count of the array.
+     numpy array(2,2,B): the bit pair count of the array.
          B will be 8 elements wide for a byte.
                   16               for a short int.
                   32               for an int / float.
                   64               for a long int / double
-         4 reflects that there are 4 pairs, the positions are:
-                  0 : 00
-                  1 : 01
-                  2 : 10
-                  3 : 11
+         2,2 reflects that there are 4 pairs, the positions are:
+                  0,0 : 00
+                  0,1 : 01
+                  1,0 : 10
+                  1,1 : 11
+         With batch_axes, the shape is (batch..., 2, 2, B), where batch is
+         the shape of the batch axes.
     """
     # get the UInt type of the array so we can create the count array
     t_uint = whichUint(A.dtype)             # type
     n_bits = A.itemsize*8                   # number of bits per array element
-    N = np.zeros((4, n_bits,), dtype=np.int64) # count array
+    batch_axes, b_shape = batch_shape(A, batch_axes)
 
-    # 1. convert the arrays to a view of the array in the UInt type 
-    # 2. take a slice
-    # 3. then flatten it into a bitstream
+    # 1. convert the arrays to a view of the array in the UInt type
+    # 2. then reshape it into a bitstream for each batch
     # using view before a slice means that the array is not copied
-    Av = A.view(dtype=t_uint).flatten()
-    Bv = B.view(dtype=t_uint).flatten()
-
-    # count the bits in the position of each array
-    for b in np.arange(0, n_bits, dtype=t_uint):
-        # position mask for this bit
-        b_mask = t_uint(0b1) << b
-        # get the bit for A
-        Ar = np.ma.bitwise_and(Av, b_mask)
-        # get the bit for B
-        Br = np.ma.bitwise_and(Bv, b_mask)
-        # shift back for each array, A by b-1, B by b
-        # this forms the pairs when A + B
-        Ab = np.ma.right_shift(Ar, b-1)
-        Bb = np.ma.right_shift(Br, b)
-        bitpair = np.ma.bitwise_or(Ab, Bb)
-        # count up the bit pairs
-        for m in np.arange(0, 4, dtype=np.int32):
-            N[m, b] += np.count_nonzero(bitpair == m)
-    # reshape the array to 2x2
-    N = N.reshape((2,2,n_bits))
+    Av = batch_rows(A.view(dtype=t_uint), batch_axes)
+    Bv = batch_rows(B.view(dtype=t_uint), batch_axes)
+    # pairs with a masked element are not counted
+    if valid is None:
+        mask = np.ma.mask_or(np.ma.getmask(Av), np.ma.getmask(Bv))
+        valid = None if mask is np.ma.nomask else ~mask
+    else:
+        valid = batch_rows(valid, batch_axes)
+
+    # count the bit pairs in each position, in each batch
+    N = get_kernel("bitpaircount")(
+        np.ma.getdata(Av), np.ma.getdata(Bv), valid
+    )
+    # reshape the array to 2x2, for each batch
+    N = N.reshape(b_shape + (2,2,n_bits))
     return N
@@ -1,6 +1,7 @@
 import numpy as np
 
 from ceda_icompress.InfoMeasures.whichUint import whichUint
+from ceda_icompress.Kernels.registry import get_kernel
 
 def bitentropy(A, base=2):
     """Calculate the bit entropy of a numpy array.
@@ -17,25 +18,19 @@ def bitentropy(A, base=2):
     # get the type of the array when converted to a UInt
     t_uint = whichUint(A.dtype)
 
-    # convert the array to the UInt type, flatten it and sort it
-    Av = A.view(dtype=t_uint).flatten()
+    # convert the non masked values to the UInt type, flatten and sort them
+    Av = np.ma.asarray(A).view(dtype=t_uint).compressed()
     Av.sort()
 
     # get the number of non masked values in the array
-    n = Av.count()
-    E = 0.0     # entropy
-    m = 1.0     # counter
-
-    for x in np.arange(0, n-1):
-        if Av[x] == Av[x+1]:
-            m += 1.0
-        else:
-            p = m/n
-            E -= p*np.log(p)
-            m = 1.0
-
-    p = m/n         # complete for last adjacent values
-    E -= p*np.log(p)
+    n = Av.size
+    if n == 0:
+        return 0.0
+
+    # the probability of each value is the length of its run in the sorted
+    # values
+    p = get_kernel("run_lengths")(Av) / n
+    E = -np.sum(p*np.log(p))
 
     # convert to given base, 2 i.e. [bit] by default
     E /= np.log(base)
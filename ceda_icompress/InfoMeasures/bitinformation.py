@@ -1,9 +1,110 @@
 import numpy as np
 
-from ceda_icompress.InfoMeasures.bitcount import bitpaircount
-from ceda_icompress.InfoMeasures.signedexponent import signed_exponent
+from ceda_icompress.InfoMeasures.bitcount import bitpaircount, batch_shape
+from ceda_icompress.InfoMeasures.signedexponent import (signed_exponent,
+    signed_magnitude)
 
-def bitinformation(X, axis=0, convert_exponent=True, base=2):
+def invalid_elements(X, fill_value=None):
+    """Get the elements of X that are not valid: those that are masked, NaN
+    or infinite, or equal to the fill_value (if it is not masked already).
+
+    Returns:
+        numpy array(bool)|nomask: the invalid elements, or nomask if they are
+                                  all valid
+    """
+    data = np.ma.getdata(X)
+    invalid = np.ma.getmask(X)
+    if data.dtype.kind == "f":
+        nonfinite = ~np.isfinite(data)
+        if nonfinite.any():
+            invalid = np.ma.mask_or(invalid, nonfinite, shrink=False)
+    if fill_value is not None and not np.isnan(fill_value):
+        fill = data == fill_value
+        if fill.any():
+            invalid = np.ma.mask_or(invalid, fill, shrink=False)
+    return invalid
+
+
+def bitpairs(X, axis=0, convert_exponent=True, batch_axes=None,
+             fill_value=None):
+    """Count the bit pairs of neighbouring elements of X along the axis, and
+    the number of pairs, for bitinformation.  A pair is only counted if both
+    of its elements are valid (see invalid_elements), and the number of pairs
+    is the number of valid pairs.  The validity of the pairs is found once,
+    and the counting works on the data, rather than the masked array.
+
+    Args:
+        X (numpy array)             : array to count the bit pairs of
+        axis (int)                  : the axis to form the pairs along
+        convert_exponent (bool)     : convert the exponent to a signed
+                                      exponent, or integers to a sign and
+                                      magnitude
+        batch_axes (int|tuple|None) : the axes to count each index of
+                                      separately, see bitpaircount
+        fill_value (number|None)    : a value that is not valid, even if it
+                                      is not masked
+
+    Returns:
+        numpy array(batch...,2,2,B): the bit pair counts
+        numpy array(batch...)      : the number of pairs in each batch
+    Raises:
+        ValueError: if the axis is one of the batch axes
+    """
+    invalid = invalid_elements(X, fill_value)
+    X = np.ma.getdata(X)
+    if convert_exponent:
+        if X.dtype.kind == "f":
+            X = np.ma.getdata(signed_exponent(X))
+        elif X.dtype.kind == "i":
+            # integers have no exponent, but are converted to a sign and
+            # magnitude in the same way
+            X = np.ma.getdata(signed_magnitude(X))
+    batch_axes, b_shape = batch_shape(X, batch_axes)
+    axis = axis % X.ndim
+    if axis in batch_axes:
+        raise ValueError(f"The axis {axis} cannot also be a batch axis")
+
+    # calculate the slices
+    a_slice = tuple(
+        slice(0, -1) if i==axis else slice(None) for i in range(0, X.ndim)
+    )
+    b_slice = tuple(
+        slice(1, None) if i==axis else slice(None) for i in range(0, X.ndim)
+    )
+    A = X.view()[a_slice]
+    B = X.view()[b_slice]
+    # the pairs where both elements are valid
+    valid = None
+    if invalid is not np.ma.nomask:
+        valid = ~(invalid[a_slice] | invalid[b_slice])
+
+    # get the counts of pairs of bits 00 01 10 11
+    C = bitpaircount(A, B, batch_axes, valid)
+    # every valid pair is counted once in each bit
+    n = C[..., 0].sum(axis=(-2, -1))
+    return C, n
+
+
+def mutual_information(C, n, base=2):
+    """Calculate the mutual information of each bit from the bit pair counts
+    C, of n pairs, as returned by bitpairs.  C and n can be summed over
+    batches first to combine them."""
+    # a batch with no pairs has no information
+    n = np.maximum(np.asarray(n, dtype=np.float64), 1.0)
+    # probability mass function of the bitpairs
+    P = C.astype(np.float64) / n[..., np.newaxis, np.newaxis, np.newaxis]
+    Pm = np.ma.masked_equal(P, 0.0)
+    # conditional probabilities
+    Pr = np.ma.sum(Pm, axis=-3)[..., np.newaxis, :, :]
+    Ps = np.ma.sum(Pm, axis=-2)[..., :, np.newaxis, :]
+    # mutual information
+    M = (np.ma.sum(Pm * np.ma.log(Pm / (Ps * Pr)), axis=(-3,-2)) /
+         np.ma.log(base))
+    return M
+
+
+def bitinformation(X, axis=0, convert_exponent=True, base=2,
+                   batch_axes=None, fill_value=None):
     """Calculate the bitwise information content, as defined in Shannon
     Information Theory, and on the webpage:
         https://github.com/esowc/Elefridge.jl.
@@ -24,34 +125,18 @@ def bitinformation(X, axis=0, convert_exponent=True, base=2):
 
     Inputs:
         A (numpy array): array to calculate bitinformation for.
+        batch_axes (int|tuple|None): calculate the bitinformation for each
+            index of these axes, e.g. each level, in a single pass
+        fill_value (number|None): a value that is not valid, even if it is
+            not masked.  Pairs with a masked, NaN, infinite or fill value
+            are not counted.
 
     Returns:
-        float: the bitinformation of the input array
+        float: the bitinformation of the input array, with the shape
+               (batch..., n_bits) if batch_axes are given
     """
 
     ### probability mass function version replaces  
     ### conditional probability version ###
-    if convert_exponent:
-        X = signed_exponent(X)
-
-    # calculate the slices
-    a_slice = tuple(
-        slice(0, -1) if i==axis else slice(None) for i in range(0, X.ndim)
-    )
-    b_slice = tuple(
-        slice(1, None) if i==axis else slice(None) for i in range(0, X.ndim)
-    )
-    A = X.view()[a_slice]
-    B = X.view()[b_slice]
-
-    # get the counts of pairs of bits 00 01 10 11
-    C = bitpaircount(A, B)
-    # probability mass function of the bitpairs
-    P = C.astype(np.float64) / B.count()
-    Pm = np.ma.masked_equal(P, 0.0)
-    # conditional probabilities
-    Pr = np.ma.sum(Pm, axis=0)[np.newaxis, ...]
-    Ps = np.ma.sum(Pm, axis=1)[:, np.newaxis,...]
-    # mutual information
-    M = np.ma.sum(Pm * np.ma.log(Pm / (Ps * Pr)), axis=(0,1)) / np.ma.log(base)
-    return M
+    C, n = bitpairs(X, axis, convert_exponent, batch_axes, fill_value)
+    return mutual_information(C, n, base)
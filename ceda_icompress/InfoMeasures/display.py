@@ -174,13 +174,14 @@ def displayBitInfoLegend():
 def displayBitInformation(B, sig, man, exp, reverse=False):
     """Display a colour for each bit information bit."""
     S = ""
+    # B can be a list or an array
     if reverse:
-        st = B.size-1
+        st = len(B)-1
         ed = -1
         step = -1
     else:
         st = 0
-        ed = B.size
+        ed = len(B)
         step = 1
     for i in range(st, ed, step):
         # calculate the position in the colour bar table
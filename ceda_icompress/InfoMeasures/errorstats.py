@@ -0,0 +1,107 @@
+import numpy as np
+
+class ErrorStats:
+    """Accumulate statistics of the error between an original array and the
+    bit manipulated array, over a number of slabs.  The statistics of each
+    slab are merged using the parallel algorithm of Chan et al., so that the
+    mean, variance and covariance are accurate however many slabs there are.
+
+    Statistics:
+        max_abs_error  : maximum of |B - A|
+        max_rel_error  : maximum of |B - A| / |A|, for A != 0
+        mean_bias      : mean of B - A
+        rmse           : root mean square of B - A
+        correlation    : Pearson correlation coefficient of A and B
+        info_retained  : fraction of the bit information retained
+    """
+
+    def __init__(self, bitinfo=None, keep_mask=None, n_bits=None):
+        """
+        Args:
+            bitinfo (numpy array) : the bit information from the analysis
+            keep_mask (int)       : mask of the bits retained by the bit
+                                    manipulation
+            n_bits (int)          : number of bits in the type
+        """
+        self.n = 0
+        self.mean_a = 0.0
+        self.mean_b = 0.0
+        self.m2_a = 0.0
+        self.m2_b = 0.0
+        self.c_ab = 0.0
+        self.sum_d = 0.0
+        self.sum_dd = 0.0
+        self.max_abs = 0.0
+        self.max_rel = 0.0
+        self.info_retained = None
+        if bitinfo is not None and keep_mask is not None:
+            bi = np.array(bitinfo, dtype=np.float64)
+            kept = np.array(
+                [(int(keep_mask) >> i) & 1 for i in range(0, n_bits)],
+                dtype=bool
+            )
+            total = np.sum(bi)
+            if total > 0:
+                self.info_retained = float(np.sum(bi[kept]) / total)
+            else:
+                self.info_retained = 1.0
+
+    def update(self, A, B):
+        """Add the errors between the original slab A and the manipulated slab
+        B.  Masked and non-finite values are not included."""
+        a = np.ma.getdata(A)
+        b = np.ma.getdata(B)
+        valid = ~(np.ma.getmaskarray(A) | np.ma.getmaskarray(B))
+        valid &= np.isfinite(a) & np.isfinite(b)
+        a = a[valid].astype(np.float64)
+        b = b[valid].astype(np.float64)
+        n = a.size
+        if n == 0:
+            return
+        d = b - a
+        ad = np.abs(d)
+        self.max_abs = max(self.max_abs, float(np.max(ad)))
+        nz = a != 0
+        if nz.any():
+            self.max_rel = max(self.max_rel,
+                               float(np.max(ad[nz] / np.abs(a[nz]))))
+        self.sum_d += float(np.sum(d))
+        self.sum_dd += float(np.dot(d, d))
+        # moments of this slab
+        mean_a = float(np.mean(a))
+        mean_b = float(np.mean(b))
+        a -= mean_a
+        b -= mean_b
+        m2_a = float(np.dot(a, a))
+        m2_b = float(np.dot(b, b))
+        c_ab = float(np.dot(a, b))
+        # merge with the moments so far
+        N = self.n + n
+        delta_a = mean_a - self.mean_a
+        delta_b = mean_b - self.mean_b
+        f = self.n * n / N
+        self.m2_a += m2_a + delta_a * delta_a * f
+        self.m2_b += m2_b + delta_b * delta_b * f
+        self.c_ab += c_ab + delta_a * delta_b * f
+        self.mean_a += delta_a * n / N
+        self.mean_b += delta_b * n / N
+        self.n = N
+
+    def results(self):
+        """Get the statistics as a dictionary"""
+        if self.n == 0:
+            return {"elements" : 0}
+        if self.m2_a > 0 and self.m2_b > 0:
+            corr = self.c_ab / np.sqrt(self.m2_a * self.m2_b)
+        else:
+            # constant fields are perfectly correlated if they are equal
+            corr = 1.0 if self.sum_dd == 0 else 0.0
+        res = {"elements" : self.n,
+               "max_abs_error" : self.max_abs,
+               "max_rel_error" : self.max_rel,
+               "mean_bias" : self.sum_d / self.n,
+               "rmse" : float(np.sqrt(self.sum_dd / self.n)),
+               "correlation" : float(corr)}
+        if self.info_retained is not None:
+            res["info_retained"] = self.info_retained
+        return res
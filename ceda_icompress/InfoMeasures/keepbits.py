@@ -1,15 +1,68 @@
+import math
 import numpy as np
+from functools import lru_cache
 from ceda_icompress.InfoMeasures.entropy import entropy
 
+# coefficients of the rational approximations to the inverse of the normal
+# cumulative distribution function, from P. J. Acklam
+_A = [-3.969683028665376e+01,  2.209460984245205e+02, -2.759285104469687e+02,
+       1.383577518672690e+02, -3.066479806614716e+01,  2.506628277459239e+00]
+_B = [-5.447609879822406e+01,  1.615858368580409e+02, -1.556989798598866e+02,
+       6.680131188771972e+01, -1.328068155288572e+01]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00,  4.374664141464968e+00,  2.938163982698783e+00]
+_D = [ 7.784695709041462e-03,  3.224671290700398e-01,  2.445134137142996e+00,
+       3.754408661907416e+00]
+# the approximation switches to the tails below this probability
+_P_LOW = 0.02425
+# default confidence intervals for the keep bits curves
+DEFAULT_CURVE_CIS = [0.5, 0.8, 0.9, 0.95, 0.98, 0.99, 0.995, 0.999, 0.9999,
+                     0.99999]
+
+def norm_ppf(p):
+    """Calculate the quantile of the standard normal distribution for the
+    probability p (the inverse of the cumulative distribution function).
+    Uses the rational approximation of Acklam, with one step of Halley's
+    method to refine it to near double precision."""
+    if p <= 0.0:
+        return -np.inf
+    if p >= 1.0:
+        return np.inf
+    if p < _P_LOW:
+        # lower tail
+        q = np.sqrt(-2 * np.log(p))
+        x = ((((((_C[0]*q+_C[1])*q+_C[2])*q+_C[3])*q+_C[4])*q+_C[5]) /
+             ((((_D[0]*q+_D[1])*q+_D[2])*q+_D[3])*q+1))
+    elif p <= 1 - _P_LOW:
+        # central region
+        q = p - 0.5
+        r = q * q
+        x = ((((((_A[0]*r+_A[1])*r+_A[2])*r+_A[3])*r+_A[4])*r+_A[5])*q /
+             (((((_B[0]*r+_B[1])*r+_B[2])*r+_B[3])*r+_B[4])*r+1))
+    else:
+        # upper tail
+        q = np.sqrt(-2 * np.log(1 - p))
+        x = -((((((_C[0]*q+_C[1])*q+_C[2])*q+_C[3])*q+_C[4])*q+_C[5]) /
+              ((((_D[0]*q+_D[1])*q+_D[2])*q+_D[3])*q+1))
+    # refine with Halley's method
+    e = 0.5 * math.erfc(-x / math.sqrt(2)) - p
+    u = e * math.sqrt(2 * math.pi) * math.exp(x * x / 2)
+    return float(x - u / (1 + x * u / 2))
+
+
 def binom_confidence(n, ci):
-    # create a normal distribution generator
-    g = np.random.default_rng()
-    h = np.quantile(
-        g.standard_normal(n, dtype=np.float32), 
-        1-(1-ci) / 2
-    ) / (2*np.sqrt(n)) + 0.5
+    """Calculate the probability in a binomial distribution of n trials, with
+    p = 0.5, below which a result is not significant at the confidence
+    interval ci.
+
+    n  : the number of elements, or the shape of the array
+    ci : the confidence interval"""
+    return _binom_confidence(int(np.prod(n)), float(ci))
 
-    return h
+
+@lru_cache(maxsize=None)
+def _binom_confidence(n, ci):
+    return norm_ppf(1-(1-ci) / 2) / (2*np.sqrt(n)) + 0.5
 
 
 def free_entropy(n, ci):
@@ -50,3 +103,56 @@ def keepbits(bi, manbit, elements, ci):
         i += 1
 
     return manbit[1]-i
+
+
+def free_entropy_curve(n, cis):
+    """Calculate the free entropy for each of the confidence intervals in cis,
+    see free_entropy"""
+    p = np.array([binom_confidence(n, ci) for ci in np.ravel(cis)])
+    # clamp to a max of 1.0
+    p = np.minimum(p, 1.0)
+    H = np.zeros(p.shape)
+    for P in [p, 1-p]:
+        idx = np.where((P > 0.0) & (P < 1.0))
+        H[idx] -= P[idx] * np.log2(P[idx])
+    return 1.0 - H
+
+
+def keepbits_curve(bi, manbit, elements, cis):
+    """Calculate the number of bits to retain in a data field for each of an
+    array of confidence intervals, in one pass.  Equivalent to calling
+    keepbits for each confidence interval, but does not alter bi.
+    bi       : bit information, calculated from bitinformation,
+    manbit   : the start and end range of the mantissa bits for each value
+    elements : the number of (non-masked) elements in the array
+    cis      : the confidence intervals (numpy array)"""
+    cis = np.ravel(np.asarray(cis, dtype=np.float64))
+    bi = np.asarray(bi, dtype=np.float64)
+    width = manbit[1] - manbit[0]
+    if width <= 0:
+        return np.zeros(cis.shape, dtype=np.int64)
+    # mask the insignificant, for each confidence interval (a row each)
+    fe = free_entropy_curve(elements, cis)
+    B = np.where(bi[np.newaxis, :] > fe[:, np.newaxis], bi[np.newaxis, :], 0.0)
+    # normalised cumulative information
+    bi_sum = np.cumsum(B, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bi_sum = bi_sum / bi_sum[:, -1:]
+    # the number of bits, from the start of the mantissa, before ci amount of
+    # info is reached
+    below = bi_sum[:, manbit[0]:manbit[1]] < (1.0 - cis)[:, np.newaxis]
+    n_below = np.where(below.all(axis=1), width, np.argmin(below, axis=1))
+    return width - n_below
+
+
+def bitmask_curve(bi, manbit, elements, cis):
+    """Calculate the number of mantissa bits that the bitmask method retains
+    for each of an array of confidence intervals, in one pass.  Arguments are
+    the same as keepbits_curve."""
+    cis = np.ravel(np.asarray(cis, dtype=np.float64))
+    bi = np.asarray(bi, dtype=np.float64)
+    threshold = np.array(
+        [binom_confidence(elements, ci) - 0.5 for ci in cis]
+    )
+    sig = bi[np.newaxis, manbit[0]:manbit[1]] > threshold[:, np.newaxis]
+    return np.sum(sig, axis=1)
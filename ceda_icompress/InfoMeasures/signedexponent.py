@@ -1,8 +1,9 @@
 import numpy as np
-from ceda_icompress.InfoMeasures.whichUint import whichUint, whichint
+from ceda_icompress.InfoMeasures.whichUint import whichUint
 from ceda_icompress.BitManipulation.bitmasks import (
     get_man_bitmask, get_sig_bitmask, get_exp_bitmask)
 from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
+from ceda_icompress.Kernels.registry import get_kernel
 
 def exponent_bias(t=np.float32):
     """Get the bias for the exponent in the IEEE floating point representation
@@ -31,9 +32,8 @@ def signed_exponent(A):
         numpy array: the converted array    
     """
 
-    # get the type of the array when converted to a Uint and int
+    # get the type of the array when converted to a Uint
     t_uint = whichUint(A.dtype)
-    t_int = whichint(A.dtype)
 
     # get the sign and exponent bit masks
     smask = get_sig_bitmask(A.dtype)
@@ -50,15 +50,25 @@ def signed_exponent(A):
     # number of mantissa bits
     mbits = man[1] - man[0]
 
-    # do the conversion
-    Av = A.view(dtype=t_uint)
-    sm = np.ma.bitwise_and(Av, smmask)
-    e0 = np.ma.right_shift(np.ma.bitwise_and(Av, emask), mbits)
-    e1 = e0.astype(t_int) - bias
+    # do the conversion, keeping the mask of A
+    Av = np.ma.getdata(A).view(dtype=t_uint)
+    B = get_kernel("signed_exponent")(Av, smmask, emask, esigmask, mbits, bias)
+    return np.ma.masked_array(B, mask=np.ma.getmask(A))
 
-    max_eabs = np.iinfo(t_uint).max >> mbits
-    eabs = np.ma.mod(np.abs(e1), max_eabs + 1)
-    esign = np.ma.where(e1 < 0, esigmask, 0)
-    esigned = np.ma.bitwise_or(esign, np.ma.left_shift(eabs, mbits))
-    B = np.ma.bitwise_or(sm, esigned).astype(t_uint)
-    return B
+
+def signed_magnitude(A):
+    """Convert an array of signed integers in A from two's complement into a
+       sign bit and magnitude, like the sign and mantissa of a floating point
+       number, so that the bit information of a negative number is in the same
+       bits as that of the positive number.
+    Args:
+        A (numpy array): array to convert
+    Returns:
+        numpy array: the converted array
+    """
+    t_uint = whichUint(A.dtype)
+    # the magnitude of a negative number is its two's complement.  The
+    # magnitude of the most negative number does not fit, and becomes zero
+    Av = np.ma.getdata(A).view(dtype=t_uint)
+    B = get_kernel("signed_magnitude")(Av)
+    return np.ma.masked_array(B, mask=np.ma.getmask(A))
@@ -0,0 +1,142 @@
+"""Summarise many analysis files, e.g. all of those in a campaign, as a table
+with a row for each variable: the number of bits to keep at a number of
+confidence intervals, the number of elements and type, and how much of the bit
+information is in the sign, exponent and mantissa.
+
+The files are loaded in parallel by a pool of processes.  The rows are
+returned in the order of the files, as a generator, and only a limited number
+of files are loaded ahead of the rows being consumed, so that the memory used
+does not grow with the number of files."""
+
+import os
+import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ceda_icompress.IO.analysisfile import load_analysis, AnalysisFileError
+from ceda_icompress.InfoMeasures.keepbits import keepbits_curve
+
+# the suffixes of the analysis files found in a directory
+ANALYSIS_SUFFIXES = (".cic", ".json", ".npz")
+# the default confidence intervals to calculate the keep bits at
+DEFAULT_SUMMARY_CIS = [0.99, 0.999, 0.9999]
+# the number of files loaded ahead of the rows being consumed, per worker
+READ_AHEAD = 4
+
+def analysis_files(paths):
+    """Find the analysis files in a list of paths, which can be files,
+    directories (searched recursively for files ending in ANALYSIS_SUFFIXES)
+    or glob patterns.  A generator, so that the whole list of files is not
+    held in memory."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for f in sorted(files):
+                    if f.endswith(ANALYSIS_SUFFIXES):
+                        yield os.path.join(root, f)
+        elif glob.has_magic(path):
+            for f in sorted(glob.iglob(path, recursive=True)):
+                if os.path.isdir(f):
+                    yield from analysis_files([f])
+                else:
+                    yield f
+        else:
+            yield path
+
+
+def _info_sum(bi, start, end):
+    return float(sum(bi[start:end])) if start >= 0 else 0.0
+
+
+def summarise_variable(variable, cis=DEFAULT_SUMMARY_CIS):
+    """Summarise the analysis of a single variable.
+
+    Args:
+        variable (dict)   : the analysis of the variable
+        cis (list<float>) : the confidence intervals to calculate the keep
+                            bits at
+
+    Returns:
+        dict: the type, elements, keep bits at each confidence interval, and
+              the bit information in the sign, exponent and mantissa
+    """
+    bi = [float(b) for b in variable["bitinfo"]]
+    sig = variable["signbit"]
+    man = variable["manbit"]
+    exp = variable["expbit"]
+    kb = keepbits_curve(bi, man, variable["elements"], cis)
+    row = {"type" : variable["type"],
+           "elements" : int(variable["elements"])}
+    for c, k in zip(cis, kb):
+        row[f"keepbits_{c}"] = int(k)
+    row["info_sign"] = _info_sum(bi, sig, sig+1)
+    row["info_exponent"] = _info_sum(bi, exp[0], exp[1])
+    row["info_mantissa"] = _info_sum(bi, man[0], man[1])
+    return row
+
+
+def summarise_file(path, cis=DEFAULT_SUMMARY_CIS, var=None, group=None):
+    """Summarise each variable in an analysis file.
+
+    Args:
+        path (str)        : the analysis file
+        cis (list<float>) : the confidence intervals for the keep bits
+        var (str)         : only summarise this variable (default: all)
+        group (str)       : only summarise this group (default: all)
+
+    Returns:
+        list<dict>: a row for each variable, see summarise_variable, with the
+                    file, group and var.  If the file cannot be read, a single
+                    row with the error.
+    """
+    rows = []
+    try:
+        with load_analysis(path) as analysis:
+            for g, grp in analysis["groups"].items():
+                if group is not None and g != group:
+                    continue
+                for v in grp["vars"]:
+                    if var is not None and v != var:
+                        continue
+                    row = {"file" : path, "group" : g, "var" : v}
+                    try:
+                        row.update(summarise_variable(grp["vars"][v], cis))
+                    except (KeyError, TypeError, IndexError) as e:
+                        row["error"] = (f"Incomplete information in "
+                                        f"analysis: {e}")
+                    rows.append(row)
+    except AnalysisFileError as e:
+        rows = [{"file" : path, "error" : str(e)}]
+    except (KeyError, AttributeError) as e:
+        rows = [{"file" : path,
+                 "error" : f"Incomplete information in analysis file: {e}"}]
+    return rows
+
+
+def summarise_files(paths, cis=DEFAULT_SUMMARY_CIS, var=None, group=None,
+                    workers=1):
+    """Summarise the analysis files, in parallel.
+
+    Args:
+        paths (iterable<str>) : the analysis files, see analysis_files
+        cis (list<float>)     : the confidence intervals for the keep bits
+        var, group (str)      : see summarise_file
+        workers (int)         : the number of worker processes
+
+    Returns:
+        generator<dict>: the rows of each file, in the order of the files
+    """
+    if workers <= 1:
+        for path in paths:
+            yield from summarise_file(path, cis, var, group)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append(pool.submit(summarise_file, path, cis, var, group))
+            # wait for the oldest file before loading too far ahead
+            if len(pending) >= workers * READ_AHEAD:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
@@ -0,0 +1,172 @@
+"""The compiled kernels, in Numba.  See registry for the kernels, and the
+arrays they work on.  Each kernel is a single loop over the array, split into
+chunks that run in parallel, and is compiled the first time it is used, then
+cached on disk.  numba is an optional dependency: importing this module
+raises ImportError if it is not installed.  The kernels take the number of
+threads to run on, which is limited to the number of threads numba was
+started with.
+
+The loops work on 64 bit unsigned integers, so that the masks and shifts have
+the same type whatever the type of the array, and the results are returned in
+the type of the array."""
+
+import numpy as np
+import numba
+from numba import njit, prange
+
+def _set_threads(threads):
+    """Set the number of numba threads, and return it"""
+    if threads is None:
+        threads = numba.config.NUMBA_NUM_THREADS
+    threads = max(1, min(threads, numba.config.NUMBA_NUM_THREADS))
+    numba.set_num_threads(threads)
+    return threads
+
+
+def _n_chunks(m, threads):
+    """The number of chunks to split m elements into, one per thread"""
+    return max(1, min(_set_threads(threads), m))
+
+
+@njit(parallel=True, cache=True)
+def _bitcount(Av, n_bits, n_chunks):
+    m = Av.size
+    size = (m + n_chunks - 1) // n_chunks
+    P = np.zeros((n_chunks, n_bits), dtype=np.int64)
+    for t in prange(n_chunks):
+        for j in range(t * size, min((t + 1) * size, m)):
+            x = np.uint64(Av[j])
+            for b in range(n_bits):
+                P[t, b] += (x >> np.uint64(b)) & np.uint64(1)
+    return P
+
+
+def bitcount(Av, threads=None):
+    """See numpykernels.bitcount"""
+    Av = np.ascontiguousarray(Av).reshape(-1)
+    P = _bitcount(Av, Av.itemsize*8, _n_chunks(Av.size, threads))
+    return P.sum(axis=0)
+
+
+@njit(parallel=True, cache=True)
+def _bitpaircount(Av, Bv, valid, use_valid, n_bits, n_chunks):
+    n_batch, m = Av.shape
+    size = (m + n_chunks - 1) // n_chunks
+    P = np.zeros((n_batch * n_chunks, 4, n_bits), dtype=np.int64)
+    for t in prange(n_batch * n_chunks):
+        r = t // n_chunks
+        c = t % n_chunks
+        for j in range(c * size, min((c + 1) * size, m)):
+            if use_valid and not valid[r, j]:
+                continue
+            x = np.uint64(Av[r, j])
+            y = np.uint64(Bv[r, j])
+            for b in range(n_bits):
+                p = (((x >> np.uint64(b)) & np.uint64(1)) * np.uint64(2) +
+                     ((y >> np.uint64(b)) & np.uint64(1)))
+                P[t, np.intp(p), b] += 1
+    return P
+
+
+def bitpaircount(Av, Bv, valid=None, threads=None):
+    """See numpykernels.bitpaircount"""
+    Av = np.ascontiguousarray(Av)
+    Bv = np.ascontiguousarray(Bv)
+    n_batch, m = Av.shape
+    n_bits = Av.itemsize*8
+    if valid is None:
+        use_valid = False
+        valid = np.ones((1, 1), dtype=np.bool_)
+    else:
+        use_valid = True
+        valid = np.ascontiguousarray(valid)
+    n_chunks = _n_chunks(m, threads)
+    P = _bitpaircount(Av, Bv, valid, use_valid, n_bits, n_chunks)
+    return P.reshape((n_batch, n_chunks, 4, n_bits)).sum(axis=1)
+
+
+@njit(cache=True)
+def _run_lengths(Sv):
+    m = Sv.size
+    if m == 0:
+        return np.zeros((0,), dtype=np.int64)
+    n_runs = 1
+    for j in range(1, m):
+        if Sv[j] != Sv[j-1]:
+            n_runs += 1
+    L = np.zeros((n_runs,), dtype=np.int64)
+    r = 0
+    L[0] = 1
+    for j in range(1, m):
+        if Sv[j] != Sv[j-1]:
+            r += 1
+        L[r] += 1
+    return L
+
+
+def run_lengths(Sv, threads=None):
+    """See numpykernels.run_lengths, in a single thread"""
+    return _run_lengths(np.ascontiguousarray(Sv))
+
+
+@njit(parallel=True, cache=True)
+def _signed_exponent(Av, R, smmask, emask, esigmask, mbits, bias, max_eabs):
+    for j in prange(Av.size):
+        x = np.uint64(Av[j])
+        e1 = np.int64((x & emask) >> mbits) - bias
+        eabs = np.uint64(abs(e1) % (max_eabs + 1))
+        r = (x & smmask) | (eabs << mbits)
+        if e1 < 0:
+            r |= esigmask
+        R[j] = r
+
+
+def signed_exponent(Av, smmask, emask, esigmask, mbits, bias, threads=None):
+    """See numpykernels.signed_exponent"""
+    _set_threads(threads)
+    t_uint = Av.dtype.type
+    shape = Av.shape
+    Av = np.ascontiguousarray(Av).reshape(-1)
+    R = np.empty_like(Av)
+    max_eabs = int(np.iinfo(t_uint).max >> mbits)
+    _signed_exponent(Av, R, np.uint64(smmask), np.uint64(emask),
+                     np.uint64(esigmask), np.uint64(mbits), np.int64(bias),
+                     np.int64(max_eabs))
+    return R.reshape(shape)
+
+
+@njit(parallel=True, cache=True)
+def _signed_magnitude(Av, R, smask):
+    for j in prange(Av.size):
+        x = np.uint64(Av[j])
+        if x & smask:
+            # the two's complement, in the bits of the type
+            R[j] = smask | (((~x) + np.uint64(1)) & (smask - np.uint64(1)))
+        else:
+            R[j] = x
+
+
+def signed_magnitude(Av, threads=None):
+    """See numpykernels.signed_magnitude"""
+    _set_threads(threads)
+    shape = Av.shape
+    Av = np.ascontiguousarray(Av).reshape(-1)
+    R = np.empty_like(Av)
+    _signed_magnitude(Av, R, np.uint64(1) << np.uint64(Av.itemsize*8 - 1))
+    return R.reshape(shape)
+
+
+@njit(parallel=True, cache=True)
+def _bitmanipulate(Av, R, and_mask, or_mask):
+    for j in prange(Av.size):
+        R[j] = (np.uint64(Av[j]) & and_mask) | or_mask
+
+
+def bitmanipulate(Av, and_mask, or_mask, threads=None):
+    """See numpykernels.bitmanipulate"""
+    _set_threads(threads)
+    shape = Av.shape
+    Av = np.ascontiguousarray(Av).reshape(-1)
+    R = np.empty_like(Av)
+    _bitmanipulate(Av, R, np.uint64(and_mask), np.uint64(or_mask))
+    return R.reshape(shape)
@@ -0,0 +1,108 @@
+"""The reference kernels, in NumPy.  See registry for the kernels, and the
+arrays they work on."""
+
+import numpy as np
+
+def bitcount(Av):
+    """Count the number of 1s in each bit position.
+
+    Args:
+        Av (numpy array) : the unsigned integers to count
+
+    Returns:
+        numpy array(B): the count of each of the B bits
+    """
+    n_bits = Av.itemsize*8
+    N = np.zeros((n_bits,), dtype=np.int64)
+    for b in range(0, n_bits):
+        N[b] = np.count_nonzero((Av >> b) & 1)
+    return N
+
+
+def bitpaircount(Av, Bv, valid=None):
+    """Count the pairs of bits 00, 01, 10 and 11 in each bit position of the
+    elements of Av and Bv, in each row.
+
+    Args:
+        Av, Bv (numpy array(R,M)) : the unsigned integers to pair, with each
+                                    batch as a row
+        valid (numpy array(R,M))  : the pairs to count, None for all
+
+    Returns:
+        numpy array(R,4,B): the counts of each pair, for each of the B bits,
+                            in each row
+    """
+    n_batch = Av.shape[0]
+    n_bits = Av.itemsize*8
+    N = np.zeros((n_batch, 4, n_bits), dtype=np.int64)
+    if valid is None:
+        n = np.full((n_batch,), Av.shape[1], dtype=np.int64)
+    else:
+        n = np.count_nonzero(valid, axis=-1)
+    for b in range(0, n_bits):
+        a = ((Av >> b) & 1).astype(bool)
+        c = ((Bv >> b) & 1).astype(bool)
+        if valid is not None:
+            a &= valid
+            c &= valid
+        # the counts of 1x, x1 and 11 give the others
+        n1x = np.count_nonzero(a, axis=-1)
+        nx1 = np.count_nonzero(c, axis=-1)
+        n11 = np.count_nonzero(a & c, axis=-1)
+        N[:, 0, b] = n - n1x - nx1 + n11
+        N[:, 1, b] = nx1 - n11
+        N[:, 2, b] = n1x - n11
+        N[:, 3, b] = n11
+    return N
+
+
+def run_lengths(Sv):
+    """Get the length of each run of equal values in the sorted 1D array Sv"""
+    if Sv.size == 0:
+        return np.zeros((0,), dtype=np.int64)
+    ends = np.flatnonzero(Sv[1:] != Sv[:-1])
+    return np.diff(np.concatenate(([-1], ends, [Sv.size-1]))).astype(np.int64)
+
+
+def signed_exponent(Av, smmask, emask, esigmask, mbits, bias):
+    """Convert the biased exponent of the floating point numbers, viewed as
+    unsigned integers in Av, to a sign bit and the magnitude of the exponent.
+
+    Args:
+        Av (numpy array) : the floating point numbers, as unsigned integers
+        smmask (uint)    : the mask of the sign and mantissa bits
+        emask (uint)     : the mask of the exponent bits
+        esigmask (uint)  : the bit to store the sign of the exponent in
+        mbits (int)      : the number of mantissa bits
+        bias (int)       : the exponent bias
+
+    Returns:
+        numpy array: the converted numbers, in the type of Av
+    """
+    t_uint = Av.dtype.type
+    max_eabs = np.iinfo(t_uint).max >> mbits
+    sm = Av & smmask
+    e1 = ((Av & emask) >> mbits).astype(np.int64) - bias
+    eabs = (np.abs(e1) % (max_eabs + 1)).astype(t_uint)
+    esign = np.where(e1 < 0, esigmask, t_uint(0)).astype(t_uint)
+    return sm | esign | (eabs << t_uint(mbits))
+
+
+def signed_magnitude(Av):
+    """Convert the two's complement signed integers, viewed as unsigned
+    integers in Av, to a sign bit and magnitude.  The magnitude of the most
+    negative number does not fit, and becomes zero."""
+    t_uint = Av.dtype.type
+    smask = t_uint(1) << t_uint(Av.itemsize*8 - 1)
+    neg = (Av & smask) != 0
+    mag = np.where(neg, ~Av + t_uint(1), Av).astype(t_uint)
+    return np.where(neg, smask, t_uint(0)).astype(t_uint) | (mag & ~smask)
+
+
+def bitmanipulate(Av, and_mask, or_mask):
+    """Set the bits of the unsigned integers in Av to (Av & and_mask) |
+    or_mask, e.g. to shave, set or groom them"""
+    R = np.bitwise_and(Av, and_mask)
+    if or_mask:
+        np.bitwise_or(R, or_mask, out=R)
+    return R
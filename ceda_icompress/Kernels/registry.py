@@ -0,0 +1,191 @@
+"""A registry of the kernels of the hot loops in the analysis (InfoMeasures)
+and the bit manipulation (BitManipulation).  Each kernel has an
+implementation in each backend:
+
+    numpy : the reference kernels, in numpykernels, always available
+    numba : compiled kernels, in numbakernels, if numba is installed.  These
+            run over the array in a single pass, in parallel, and are cached
+            on disk after they are first compiled
+
+The backend is chosen with set_kernel_backend, or by setting the CIC_KERNELS
+environment variable to numpy, numba or auto.  The default, auto, uses numba
+if it is installed, and numpy otherwise.  If numba is chosen but is not
+installed, the numpy kernels are used.
+
+The kernels work on plain (not masked) arrays of unsigned integers, which are
+views of the data.  The callers handle the masks.  The kernels of every
+backend must give exactly the same results as the numpy kernels.
+
+The kernels run on a number of threads: the numpy kernels split the arrays
+into blocks, which are processed by a pool of threads (see threads), and the
+numba kernels use that many numba threads.  The number of threads is set with
+set_kernel_threads, or the CIC_THREADS environment variable, and defaults to
+the number of CPUs that the process can run on."""
+
+import os
+import importlib
+from functools import partial
+
+from ceda_icompress.Core.errors import ParameterError
+
+# the backends, in order of preference for auto
+BACKENDS = ["numba", "numpy"]
+# the environment variable to choose the backend
+KERNEL_ENV = "CIC_KERNELS"
+# the environment variable to set the number of threads
+THREADS_ENV = "CIC_THREADS"
+# the kernels that every backend provides
+KERNELS = ["bitcount", "bitpaircount", "run_lengths", "signed_exponent",
+           "signed_magnitude", "bitmanipulate"]
+# the functions in threads that run each numpy kernel on a pool of threads
+THREADED = {"bitcount" : "bitcount",
+            "bitpaircount" : "bitpaircount",
+            "signed_exponent" : "elementwise",
+            "signed_magnitude" : "elementwise",
+            "bitmanipulate" : "elementwise"}
+
+_MODULES = {"numpy" : "ceda_icompress.Kernels.numpykernels",
+            "numba" : "ceda_icompress.Kernels.numbakernels"}
+# the modules of the backends that have been loaded, None if the backend
+# could not be loaded
+_loaded = {}
+# the backend in use, None until the first kernel is used
+_backend = None
+# the number of threads, None until the first kernel is used
+_threads = None
+
+def _load(backend):
+    """Import the module of a backend, or None if it is not installed"""
+    if backend not in _loaded:
+        try:
+            _loaded[backend] = importlib.import_module(_MODULES[backend])
+        except ImportError:
+            _loaded[backend] = None
+    return _loaded[backend]
+
+
+def available_kernel_backends():
+    """Get the backends that can be used, in order of preference"""
+    return [b for b in BACKENDS if _load(b) is not None]
+
+
+def set_kernel_backend(backend="auto"):
+    """Choose the backend of the kernels.
+
+    Args:
+        backend (str) : numpy | numba | auto
+
+    Returns:
+        str: the backend that will be used, which is numpy if the backend
+             chosen is not installed
+    Raises:
+        ParameterError: if the backend is not known
+    """
+    global _backend
+    if backend == "auto":
+        backend = available_kernel_backends()[0]
+    elif backend not in BACKENDS:
+        raise ParameterError(
+            f"Unknown kernel backend: {backend}, should be one of: "
+            f"{', '.join(BACKENDS + ['auto'])}"
+        )
+    if _load(backend) is None:
+        backend = "numpy"
+    _backend = backend
+    return _backend
+
+
+def get_kernel_backend():
+    """Get the backend of the kernels, choosing it from the CIC_KERNELS
+    environment variable if it has not been set"""
+    if _backend is None:
+        set_kernel_backend(os.environ.get(KERNEL_ENV, "auto"))
+    return _backend
+
+
+def cpu_count():
+    """The number of CPUs that the process can run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def set_kernel_threads(threads=None):
+    """Set the number of threads the kernels run on.
+
+    Args:
+        threads (int|None) : the number of threads, None for the number of
+                             CPUs that the process can run on
+
+    Returns:
+        int: the number of threads
+    Raises:
+        ParameterError: if the number of threads is less than one
+    """
+    global _threads
+    if threads is None:
+        threads = cpu_count()
+    threads = int(threads)
+    if threads < 1:
+        raise ParameterError(
+            f"The number of kernel threads must be at least 1: {threads}"
+        )
+    _threads = threads
+    return _threads
+
+
+def get_kernel_threads():
+    """Get the number of threads the kernels run on, from the CIC_THREADS
+    environment variable if it has not been set"""
+    if _threads is None:
+        try:
+            set_kernel_threads(os.environ.get(THREADS_ENV))
+        except ValueError:
+            raise ParameterError(
+                f"{THREADS_ENV} should be a number of threads: "
+                f"{os.environ[THREADS_ENV]}"
+            )
+    return _threads
+
+
+def share_kernel_threads(workers):
+    """Set the number of threads of a worker process, one of a pool of
+    workers, to its share of the CPUs, so that the pool does not run more
+    threads than there are CPUs.  CIC_THREADS, if set, is used instead.
+
+    Returns:
+        int: the number of threads
+    """
+    if THREADS_ENV in os.environ:
+        return get_kernel_threads()
+    return set_kernel_threads(max(1, cpu_count() // max(1, workers)))
+
+
+def get_kernel(name, backend=None, threads=None):
+    """Get a kernel.
+
+    Args:
+        name (str)         : the name of the kernel, one of KERNELS
+        backend (str|None) : the backend, or None for the backend in use
+        threads (int|None) : the number of threads, or None for the number
+                             set by set_kernel_threads
+
+    Returns:
+        function: the kernel
+    """
+    if backend is None:
+        backend = get_kernel_backend()
+    if threads is None:
+        threads = get_kernel_threads()
+    module = _load(backend)
+    if module is None:
+        backend = "numpy"
+        module = _load(backend)
+    kernel = getattr(module, name)
+    if backend == "numba":
+        return partial(kernel, threads=threads)
+    if threads > 1 and name in THREADED:
+        threaded = importlib.import_module("ceda_icompress.Kernels.threads")
+        return partial(getattr(threaded, THREADED[name]), kernel, threads)
+    return kernel
@@ -0,0 +1,67 @@
+"""Run the numpy kernels on a pool of threads.  The arrays are split into
+contiguous blocks, each kernel is run on a block in a thread, and the partial
+results are combined.  NumPy releases the GIL in the operations the kernels
+use, so the blocks are processed in parallel.
+
+The pairs of bitpaircount are split after they have been formed, as the
+elements of Av and Bv at the same index, so the pairs across the boundary
+between two blocks of the original array are counted, in one of the blocks.
+The counts of the blocks are summed."""
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# the smallest number of elements in a block, so that small arrays are not
+# split
+MIN_BLOCK = 1 << 16
+
+def blocks(m, n_threads):
+    """Split m elements into at most n_threads contiguous blocks, of at least
+    MIN_BLOCK elements.
+
+    Returns:
+        list<slice>: the blocks
+    """
+    n_blocks = max(1, min(n_threads, m // MIN_BLOCK))
+    size = -(-m // n_blocks)
+    return [slice(b * size, min((b + 1) * size, m))
+            for b in range(0, n_blocks)]
+
+
+def _map(function, parts, n_threads):
+    """Run function on each of the parts, in a pool of threads"""
+    if len(parts) == 1:
+        return [function(parts[0])]
+    with ThreadPoolExecutor(max_workers=min(n_threads, len(parts))) as pool:
+        return list(pool.map(function, parts))
+
+
+def bitcount(kernel, n_threads, Av):
+    """Run the bitcount kernel on blocks of the 1D array Av"""
+    parts = _map(lambda s: kernel(Av[s]), blocks(Av.size, n_threads),
+                 n_threads)
+    return np.sum(parts, axis=0)
+
+
+def bitpaircount(kernel, n_threads, Av, Bv, valid=None):
+    """Run the bitpaircount kernel on blocks of the columns of Av and Bv, in
+    every row"""
+    def count(s):
+        v = None if valid is None else valid[:, s]
+        return kernel(Av[:, s], Bv[:, s], v)
+    parts = _map(count, blocks(Av.shape[1], n_threads), n_threads)
+    return np.sum(parts, axis=0)
+
+
+def elementwise(kernel, n_threads, Av, *args):
+    """Run a kernel that converts each element of Av, e.g. signed_exponent,
+    on blocks of Av"""
+    Af = Av.reshape(-1)
+    parts = blocks(Af.size, n_threads)
+    if len(parts) == 1:
+        return kernel(Av, *args)
+    R = np.empty_like(Af)
+    def convert(s):
+        R[s] = kernel(Af[s], *args)
+    _map(convert, parts, n_threads)
+    return R.reshape(Av.shape)
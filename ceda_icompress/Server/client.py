@@ -0,0 +1,57 @@
+"""Submit jobs to a running cic_server over its UNIX socket.  Only the
+standard library is imported, so that a client starts quickly: the cost of
+importing numpy and netCDF4 has already been paid by the server."""
+
+import json
+import os
+import socket
+import tempfile
+
+from ceda_icompress.Core.errors import CICError
+
+class ServerError(CICError):
+    """The server could not be contacted, or closed the connection"""
+    pass
+
+
+def default_socket():
+    """Get the default path of the server socket, private to the user"""
+    runtime = os.environ.get("XDG_RUNTIME_DIR", tempfile.gettempdir())
+    return os.path.join(runtime, f"cic_server-{os.getuid()}.sock")
+
+
+def submit(job, socket_path=None, timeout=None):
+    """Send a job to the server, and wait for it to complete.
+
+    Args:
+        job (dict)         : the job, with an "op" key of compress, estimate,
+                             analyse, ping, status or stop, and the arguments
+                             of the op.  Paths should be absolute, as the
+                             server may have a different working directory
+        socket_path (str)  : the socket of the server (default:
+                             default_socket())
+        timeout (float)    : seconds to wait for the job (default: forever)
+
+    Returns:
+        dict: the response, with "status" ("ok" or "error") and either the
+              "result" of the job, or the "error" and its "type"
+    Raises:
+        ServerError: if the server cannot be contacted
+    """
+    if socket_path is None:
+        socket_path = default_socket()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(socket_path)
+            sock.sendall(json.dumps(job).encode("utf-8") + b"\n")
+            with sock.makefile("rb") as fh:
+                line = fh.readline()
+    except OSError as e:
+        raise ServerError(
+            f"Could not contact server on socket: {socket_path}, reason: {e}"
+        )
+    if not line:
+        raise ServerError(f"Server on socket: {socket_path} closed the "
+                          "connection")
+    return json.loads(line)
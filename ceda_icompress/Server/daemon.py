@@ -0,0 +1,282 @@
+"""A long running server that compresses (or analyses) files on request, so
+that the cost of starting Python, importing numpy and netCDF4 and parsing the
+analysis is not paid for every file.
+
+Jobs are sent as lines of JSON over a local UNIX socket (see client.submit),
+and each is answered with a line of JSON when it completes.  The jobs are run
+by a pool of worker processes, started when the server starts.  Each worker
+keeps the analysis files it has parsed, keyed by their modification time and
+size, and the bit manipulations it has constructed (see MethodCache)."""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from ceda_icompress.Server.client import ServerError, default_socket
+
+# the bit manipulations constructed by this worker, set by _init_worker
+_methods = None
+
+def _init_worker(workers):
+    """Import the modules in the worker when it starts, rather than when the
+    first job arrives"""
+    global _methods
+    from ceda_icompress import api
+    from ceda_icompress.Kernels.registry import share_kernel_threads
+    _methods = api.MethodCache()
+    share_kernel_threads(workers)
+
+
+def _warm(i):
+    return os.getpid()
+
+
+@lru_cache(maxsize=64)
+def _cached_analysis(path, mtime, size):
+    """Parse an analysis file.  The modification time and size are part of
+    the cache key, so a changed file is parsed again."""
+    from ceda_icompress.api import load_analysis
+    return load_analysis(path)
+
+
+def load_analysis_cached(path):
+    """Get the parsed analysis file, from the cache if it has not changed"""
+    from ceda_icompress.api import load_analysis
+    try:
+        st = os.stat(path)
+    except OSError:
+        # let load_analysis report the error
+        return load_analysis(path)
+    return _cached_analysis(path, st.st_mtime_ns, st.st_size)
+
+
+def _json_default(obj):
+    """Convert the numpy scalars in the results to Python types"""
+    if hasattr(obj, "item"):
+        return obj.item()
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    raise TypeError(f"Cannot convert {type(obj)} to JSON")
+
+
+def run_job(job):
+    """Run a compress, estimate or analyse job in a worker.
+
+    Args:
+        job (dict) : the job, see client.submit.  The keys are:
+            compress : file, output, analysis, params, force
+            estimate : file, analysis, params, force
+            analyse  : file, output, var, group, tstart, tend, level, axis,
+                       format, batch
+
+    Returns:
+        dict: the response, see client.submit
+    """
+    from ceda_icompress import api
+    op = job.get("op")
+    try:
+        if op == "compress":
+            res = api.compress_dataset(
+                job["file"], job["output"],
+                load_analysis_cached(job["analysis"]), job.get("params"),
+                job.get("force", False), _methods
+            )
+            result = {"file" : res.file,
+                      "output" : res.output,
+                      "bytes_in" : res.bytes_in,
+                      "bytes_out" : res.bytes_out,
+                      "ratio" : res.ratio,
+                      "timings" : res.timings,
+                      "errors" : res.errors,
+                      "elapsed" : res.elapsed}
+        elif op == "estimate":
+            result = api.estimate_dataset(
+                job["file"], load_analysis_cached(job["analysis"]),
+                job.get("params"), job.get("force", False)
+            )
+        elif op == "analyse":
+            res = api.analyse_dataset(
+                job["file"], job.get("var"), job.get("group"),
+                job.get("tstart"), job.get("tend"), job.get("level"),
+                job.get("axis", 0), batch=job.get("batch")
+            )
+            output = job["output"]
+            format = job.get("format")
+            if format is None:
+                format = "npz" if output.endswith(".npz") else "json"
+            # write to a temporary name, so that a partially written analysis
+            # file is never left behind
+            tmp = output + ".part"
+            res.write(tmp, format)
+            os.replace(tmp, output)
+            result = {"analysis" : output,
+                      "timings" : res.timings,
+                      "elapsed" : res.elapsed}
+        else:
+            raise api.ParameterError(f"Unknown job: {op}")
+    except KeyError as e:
+        return {"status" : "error", "type" : "ParameterError",
+                "error" : f"Job {op} is missing the argument: {e}"}
+    except api.CICError as e:
+        return {"status" : "error", "type" : type(e).__name__,
+                "error" : str(e)}
+    # the results contain numpy scalars, which cannot be returned as JSON
+    return {"status" : "ok",
+            "result" : json.loads(json.dumps(result, default=_json_default))}
+
+
+class CompressionServer:
+    """Accept jobs on a UNIX socket, and run them in a pool of worker
+    processes."""
+
+    def __init__(self, socket_path=None, workers=1, debug=False):
+        """
+        Args:
+            socket_path (str) : the socket to listen on (default:
+                                default_socket())
+            workers (int)     : the number of worker processes
+            debug (bool)      : print each job as it completes
+        """
+        if socket_path is None:
+            socket_path = default_socket()
+        self.socket_path = socket_path
+        self.workers = workers
+        self.debug = debug
+        self.pool = None
+        self.connections = {}
+        self.stopping = None
+        self.started = None
+        self.counts = {"ok" : 0, "error" : 0}
+
+    def _start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers,
+                                        initializer=_init_worker,
+                                        initargs=(self.workers,))
+
+    def _remove_stale_socket(self):
+        """Remove the socket left by a server that did not exit cleanly, or
+        raise a ServerError if a server is still running on it"""
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)
+                return
+        raise ServerError(
+            f"A server is already running on socket: {self.socket_path}"
+        )
+
+    def status(self):
+        return {"pid" : os.getpid(),
+                "socket" : self.socket_path,
+                "workers" : self.workers,
+                "uptime" : time.time() - self.started,
+                "jobs" : dict(self.counts)}
+
+    async def _run_job(self, job):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(self.pool, run_job, job)
+        except BrokenProcessPool as e:
+            # a worker died (e.g. killed, or crashed in a library), so start
+            # a new pool for the next job
+            self._start_pool()
+            return {"status" : "error", "type" : type(e).__name__,
+                    "error" : f"Worker process failed: {e}"}
+        except Exception as e:
+            return {"status" : "error", "type" : type(e).__name__,
+                    "error" : str(e)}
+
+    async def _dispatch(self, job):
+        """Run a job, returning the response"""
+        op = job.get("op")
+        if op == "ping":
+            return {"status" : "ok", "result" : {"pid" : os.getpid()}}
+        elif op == "status":
+            return {"status" : "ok", "result" : self.status()}
+        elif op == "stop":
+            self.stopping.set()
+            return {"status" : "ok", "result" : {}}
+        st = time.time()
+        response = await self._run_job(job)
+        self.counts[response["status"]] += 1
+        if self.debug:
+            print(f"{str(op):<9}: {response['status']:<7} "
+                  f"{job.get('file', '')} {response.get('error', '')} "
+                  f"({time.time()-st:.3f}s)")
+        return response
+
+    async def _handle(self, reader, writer):
+        """Handle a connection: each line is a job, answered in order"""
+        self.connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    job = json.loads(line)
+                    if not isinstance(job, dict):
+                        raise ValueError("job is not an object")
+                except ValueError as e:
+                    response = {"status" : "error", "type" : "ParameterError",
+                                "error" : f"Could not parse job: {e}"}
+                else:
+                    response = await self._dispatch(job)
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            # the client went away before the job finished
+            pass
+        finally:
+            writer.close()
+            self.connections.pop(asyncio.current_task(), None)
+
+    async def run(self):
+        """Run the server until a stop job is received, or (in the main
+        thread) SIGINT or SIGTERM"""
+        loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        self.started = time.time()
+        self._remove_stale_socket()
+        self._start_pool()
+        try:
+            # start the workers now, so that the first jobs do not wait for
+            # them to import the modules
+            await asyncio.gather(*[
+                loop.run_in_executor(self.pool, _warm, i)
+                for i in range(0, self.workers)
+            ])
+            server = await asyncio.start_unix_server(
+                self._handle, path=self.socket_path
+            )
+            # only the user can submit jobs
+            os.chmod(self.socket_path, 0o600)
+            if threading.current_thread() is threading.main_thread():
+                for sig in [signal.SIGINT, signal.SIGTERM]:
+                    loop.add_signal_handler(sig, self.stopping.set)
+            if self.debug:
+                print(f"Listening on socket: {self.socket_path}, with "
+                      f"{self.workers} workers")
+            async with server:
+                await self.stopping.wait()
+                # close the connections that are waiting for a job, and wait
+                # for the running jobs to finish
+                for writer in self.connections.values():
+                    writer.close()
+                await asyncio.gather(*self.connections,
+                                     return_exceptions=True)
+        finally:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+        return dict(self.counts)
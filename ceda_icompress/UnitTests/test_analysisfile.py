@@ -0,0 +1,91 @@
+import unittest
+import os
+import json
+import pickle
+import tempfile
+import numpy as np
+
+from ceda_icompress.IO.analysisfile import (write_analysis, load_analysis,
+    export_json, AnalysisFileError)
+from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+
+def make_analysis(n_vars=3):
+    """Make an analysis dictionary like the output of cic_analyse"""
+    rng = np.random.default_rng(10)
+    analysis = {"Analysis" : "BitInformation",
+                "date" : "2022-01-01T00:00:00",
+                "file" : "/tmp/test.nc",
+                "groups" : {"/" : {"vars" : {}}, "g1" : {"vars" : {}}},
+                "version" : CIC_FILE_FORMAT_VERSION}
+    for g in analysis["groups"]:
+        for n in range(0, n_vars):
+            analysis["groups"][g]["vars"][f"v{n}"] = {
+                "axis" : 0,
+                "elements" : 1000,
+                "type" : "float32",
+                "manbit" : [0, 23],
+                "bitinfo" : rng.random(32).tolist(),
+            }
+    return analysis
+
+class analysisfileTest(unittest.TestCase):
+    """Test the analysis file formats round trip."""
+    def test_roundtrip(self):
+        analysis = make_analysis()
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ["json", "npz"]:
+                path = os.path.join(tmp, f"analysis.{fmt}")
+                write_analysis(analysis, path, fmt)
+                A = load_analysis(path)
+                self.assertEqual(A["file"], analysis["file"])
+                for g in analysis["groups"]:
+                    vars = analysis["groups"][g]["vars"]
+                    self.assertEqual(list(A["groups"][g]["vars"]), list(vars))
+                    for v in vars:
+                        self.assertTrue("v0" in A["groups"][g]["vars"])
+                        Av = A["groups"][g]["vars"][v]
+                        self.assertTrue(
+                            (np.array(Av["bitinfo"]) == vars[v]["bitinfo"]).all()
+                        )
+                        self.assertEqual(Av["elements"], vars[v]["elements"])
+                        self.assertEqual(list(Av["manbit"]), vars[v]["manbit"])
+
+    def test_export(self):
+        # exporting the npz file to JSON gives the same JSON
+        analysis = make_analysis()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "analysis.npz")
+            write_analysis(analysis, path, "npz")
+            path = os.path.join(tmp, "analysis.json")
+            with open(path, "w") as fh:
+                export_json(load_analysis(os.path.join(tmp, "analysis.npz")),
+                            fh)
+            with open(path) as fh:
+                self.assertEqual(json.load(fh), analysis)
+
+    def test_to_dict(self):
+        # the analysis can be converted to plain dictionaries, and closed
+        analysis = make_analysis()
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ["json", "npz"]:
+                path = os.path.join(tmp, f"analysis.{fmt}")
+                write_analysis(analysis, path, fmt)
+                with load_analysis(path) as A:
+                    D = A.to_dict()
+                D.pop("format", None)
+                self.assertEqual(D, analysis)
+                self.assertEqual(pickle.loads(pickle.dumps(D)), analysis)
+                self.assertEqual(json.loads(json.dumps(D)), analysis)
+
+    def test_version(self):
+        analysis = make_analysis()
+        analysis["version"] = -1
+        with tempfile.TemporaryDirectory() as tmp:
+            for fmt in ["json", "npz"]:
+                path = os.path.join(tmp, f"analysis.{fmt}")
+                write_analysis(analysis, path, fmt)
+                with self.assertRaises(AnalysisFileError):
+                    load_analysis(path)
+
+if __name__ == '__main__':
+    unittest.main()
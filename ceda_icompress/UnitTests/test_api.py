@@ -0,0 +1,152 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress import api
+
+def create_file(path):
+    """Create a file with a smooth float variable and an integer variable"""
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("t", 8)
+    ds.createDimension("x", 64)
+    x = np.linspace(0.0, 2*np.pi, 64)
+    tas = ds.createVariable("tas", "f4", ("t", "x"))
+    tas[:] = (280.0 + 10.0 * np.sin(x[None,:] + np.arange(8)[:,None]))
+    n = ds.createVariable("n", "i4", ("x",))
+    n[:] = np.arange(64)
+    ds.close()
+
+
+class apiTest(unittest.TestCase):
+    """Test the library interface, and that it raises the typed exceptions
+    rather than exiting."""
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.A = rng.normal(280.0, 10.0, (50, 40)).astype(np.float32)
+
+    def test_array(self):
+        analysis = api.analyse_array(self.A)
+        self.assertEqual(analysis["elements"], self.A.size)
+        self.assertEqual(len(analysis["bitinfo"]), 32)
+        res = api.compress_array(self.A, analysis, "bitshave", 0.99,
+                                 verify=True)
+        self.assertEqual(res.data.shape, self.A.shape)
+        self.assertEqual(res.errors["elements"], self.A.size)
+        self.assertLessEqual(res.nsb, 23)
+        # the number of significant bits can be given instead
+        res = api.compress_array(self.A, nsb=4)
+        self.assertEqual(res.nsb, 4)
+        self.assertTrue(np.allclose(res.data, self.A, rtol=2.0**-4))
+
+    def test_array_errors(self):
+        with self.assertRaises(api.MethodError):
+            api.compress_array(self.A, nsb=4, method="bitchop")
+        with self.assertRaises(api.ParameterError):
+            api.compress_array(self.A)
+        with self.assertRaises(api.UnsupportedTypeError):
+            api.analyse_array(self.A.astype(np.float64))
+
+    def test_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "in.nc")
+            output = os.path.join(tmp, "out.nc")
+            create_file(path)
+            res = api.analyse_dataset(path, var="tas")
+            self.assertIn("tas", res.analysis["groups"]["/"]["vars"])
+            self.assertIn("/tas", res.timings)
+            out = api.compress_dataset(path, output, res.analysis,
+                                       {"verify" : True, "deflate" : 4})
+            self.assertIn("/tas", out.errors)
+            self.assertNotIn("/n", out.errors)
+            self.assertGreater(out.bytes_out, 0)
+            ds = Dataset(output)
+            self.assertIn("compression", ds["tas"].ncattrs())
+            self.assertTrue(np.array_equal(ds["n"][:], np.arange(64)))
+            ds.close()
+            est = api.estimate_dataset(path, res.analysis)
+            self.assertIn("/tas", est["vars"])
+
+    def test_memory(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "in.nc")
+            output = os.path.join(tmp, "out.nc")
+            create_file(path)
+            res = api.analyse_dataset(path, var="tas")
+            out = api.compress_dataset(path, output, res.analysis,
+                                       {"chunk_copy" : False})
+            mem = api.compress_dataset_to_memory(path, res.analysis,
+                                                 {"verify" : True})
+            self.assertIsNone(mem.output)
+            self.assertEqual(mem.bytes_out, len(mem.data))
+            self.assertIn("/tas", mem.errors)
+            self.assertEqual(sorted(os.listdir(tmp)), ["in.nc", "out.nc"])
+            ds = Dataset("mem.nc", memory=mem.data.tobytes())
+            ref = Dataset(output)
+            for v in ["tas", "n"]:
+                self.assertTrue(np.array_equal(ds[v][:], ref[v][:]))
+            ds.close()
+            ref.close()
+            # larger files are written to a temporary file
+            tmp_out = api.compress_dataset_to_memory(path, res.analysis,
+                                                     max_bytes=0)
+            self.assertIsNone(tmp_out.data)
+            self.assertEqual(tmp_out.bytes_out, os.path.getsize(output))
+            os.remove(tmp_out.output)
+            with self.assertRaises(api.ParameterError):
+                api.compress_dataset_to_memory(path, res.analysis,
+                                               {"workers" : 2})
+
+    def test_batch(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "in.nc")
+            create_file(path)
+            res = api.analyse_dataset(path, axis=1, batch="t")
+            Va = res.analysis["groups"]["/"]["vars"]["tas"]
+            self.assertEqual(Va["batch_dims"], ["t"])
+            self.assertEqual(np.array(Va["bitinfo_batch"]).shape, (8, 32))
+            self.assertEqual(Va["elements_batch"], [64] * 8)
+            # the same as analysing a single time
+            with Dataset(path) as ds:
+                Vt = api.analyse_array(ds["tas"][3], axis=0)
+            self.assertTrue(np.allclose(Va["bitinfo_batch"][3], Vt["bitinfo"]))
+            # n does not have the batch dimension
+            self.assertNotIn("bitinfo_batch",
+                             res.analysis["groups"]["/"]["vars"]["n"])
+            # the file can be written and read in both formats
+            for format in ["json", "npz"]:
+                out = os.path.join(tmp, f"a.{format}")
+                res.write(out, format)
+                Vb = api.load_analysis(out)["groups"]["/"]["vars"]["tas"]
+                self.assertTrue(np.allclose(Vb["bitinfo_batch"],
+                                            Va["bitinfo_batch"]))
+
+    def test_dataset_errors(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "in.nc")
+            create_file(path)
+            with self.assertRaises(api.InputFileError):
+                api.analyse_dataset(os.path.join(tmp, "missing.nc"))
+            with self.assertRaises(api.NotFoundError):
+                api.analyse_dataset(path, var="pr")
+            analysis = api.analyse_dataset(path, var="tas").analysis
+            output = os.path.join(tmp, "out.nc")
+            with self.assertRaises(api.MethodError):
+                api.compress_dataset(path, output, analysis,
+                                     {"method" : "bitchop"})
+            with self.assertRaises(api.ParameterError):
+                api.compress_dataset(path, output, analysis, {"level" : 1})
+            with self.assertRaises(api.OutputFileError):
+                api.compress_dataset(path, path, analysis)
+            # the analysis is for a different file
+            other = os.path.join(tmp, "other.nc")
+            create_file(other)
+            with self.assertRaises(api.AnalysisMismatchError):
+                api.compress_dataset(other, output, analysis)
+            # all of the errors derive from CICError
+            with self.assertRaises(api.CICError):
+                api.compress_dataset(path, output, os.path.join(tmp, "x.cic"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -81,6 +81,19 @@ class bitpaircountTest(unittest.TestCase):
         assert((C[3,man:sig] == DIM_LEN-1).all())
         assert((C[sig:] == DIM_LEN-1).all())
 
+    def test_batch(self):
+        rng = np.random.default_rng(1)
+        zdist = rng.integers(0, 2**16, size=(3, 5, DIM_LEN), dtype=np.uint16)
+        A = zdist[..., :-1]
+        B = zdist[..., 1:]
+        C = bitpaircount(A, B, batch_axes=(0, 1))
+        self.assertEqual(C.shape, (3, 5, 2, 2, 16))
+        # each batch is counted as if it were alone, and every pair is
+        # counted once
+        self.assertTrue((C[2, 4] == bitpaircount(A[2, 4], B[2, 4])).all())
+        self.assertTrue((C.sum(axis=(2, 3)) == DIM_LEN-1).all())
+        self.assertTrue((C.sum(axis=(0, 1)) == bitpaircount(A, B)).all())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -52,5 +52,50 @@ class bitinformationTest(unittest.TestCase):
         C = bitinformation(zdist)
         assert(int(C) == 0.5 * DIM_LEN)
 
+    def test_batch(self):
+        # a random walk, with a different scale for each level
+        rng = np.random.default_rng(3)
+        zdist = np.cumsum(rng.normal(size=(4, 6, DIM_LEN)), axis=2)
+        zdist = (zdist * np.arange(1, 5)[:, None, None]).astype(np.float32)
+        zdist = np.ma.masked_array(zdist, mask=rng.random(zdist.shape) < 0.1)
+        C = bitinformation(zdist, axis=2, batch_axes=0)
+        self.assertEqual(C.shape, (4, 32))
+        # each level is the same as analysing it alone
+        for l in range(0, 4):
+            self.assertTrue(np.ma.allclose(C[l], bitinformation(zdist[l], 1)))
+        C = bitinformation(zdist, axis=2, batch_axes=(1, -3))
+        self.assertEqual(C.shape, (6, 4, 32))
+        self.assertTrue(np.ma.allclose(C[2, 1], bitinformation(zdist[1, 2])))
+        with self.assertRaises(ValueError):
+            bitinformation(zdist, axis=2, batch_axes=2)
+
+    def test_masked(self):
+        # a land / sea mask: the rows that are masked do not change the
+        # information of the rest
+        rng = np.random.default_rng(6)
+        zdist = np.cumsum(rng.normal(size=(16, DIM_LEN)), axis=1)
+        zdist = zdist.astype(np.float32)
+        land = np.zeros(zdist.shape, dtype=bool)
+        land[::2] = True
+        C = bitinformation(np.ma.masked_array(zdist, mask=land), axis=1)
+        self.assertTrue(np.ma.allclose(C, bitinformation(zdist[1::2], 1)))
+        # NaN and an unmasked fill value are the same as masked values
+        fill = np.float32(1e20)
+        for v in [np.nan, fill]:
+            ndist = np.where(land, v, zdist)
+            self.assertTrue(np.ma.allclose(
+                bitinformation(ndist, axis=1, fill_value=fill), C
+            ))
+
+    def test_masked_noise(self):
+        # the pairs with one masked element are not counted, so the
+        # information of uniform noise is still close to zero, as the
+        # probabilities of the pairs sum to one
+        rng = np.random.default_rng(7)
+        zdist = rng.uniform(1.0, 2.0, (64, DIM_LEN)).astype(np.float32)
+        zdist = np.ma.masked_array(zdist, mask=rng.random(zdist.shape) < 0.5)
+        C = bitinformation(zdist, axis=1)
+        self.assertLess(np.max(C[:23]), 0.01)
+
 if __name__ == '__main__':
     unittest.main()
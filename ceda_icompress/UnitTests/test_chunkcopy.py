@@ -0,0 +1,94 @@
+import unittest
+import os
+import tempfile
+from unittest import mock
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress import api
+from ceda_icompress.Core.analysis import analyse_var
+from ceda_icompress.IO.chunkcopy import (h5py, can_copy_chunks, copy_chunks,
+                                         target_filters)
+
+def create_file(path):
+    """Create a file with a float variable to bit manipulate, and integer
+    variables, with masked values, written with the same filters as
+    cic_compress (complevel 1 and shuffle) and with a different complevel"""
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("t", 32)
+    ds.createDimension("x", 64)
+    rng = np.random.default_rng(9)
+    tas = ds.createVariable("tas", "f4", ("t", "x"))
+    tas[:] = 280.0 + np.cumsum(rng.normal(size=(32, 64)), axis=1)
+    values = np.ma.masked_less(
+        np.arange(32*64, dtype="i4").reshape(32, 64), 100
+    )
+    grp = ds.createGroup("g")
+    for group, name, complevel in [(ds, "n", 1), (grp, "m", 1),
+                                   (ds, "k", 5)]:
+        v = group.createVariable(name, "i4", ("t", "x"),
+                                 compression="zlib", complevel=complevel,
+                                 shuffle=True, chunksizes=(8, 16),
+                                 fill_value=-1)
+        v[:] = values
+        v.units = "1"
+    ds.close()
+
+
+@unittest.skipIf(h5py is None, "h5py is not installed")
+class chunkcopyTest(unittest.TestCase):
+    """Test that the compressed chunks of the variables whose filters match
+    those of cic_compress are copied directly, and that the other variables
+    are copied in slabs."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "in.nc")
+        self.output = os.path.join(self.tmp.name, "out.nc")
+        create_file(self.path)
+        with Dataset(self.path) as ds:
+            self.analysis = {"file" : self.path, "groups" : {"/" : {
+                "vars" : {"tas" : analyse_var(ds["tas"], None, None, None, 1)}
+            }}}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_can_copy(self):
+        params = api.compression_params()
+        with Dataset(self.path) as ds:
+            for v in [ds["n"], ds["g"]["m"]]:
+                self.assertEqual(can_copy_chunks(v, v.dtype, params),
+                                 (True, ""))
+            self.assertEqual(can_copy_chunks(ds["k"], ds["k"].dtype, params),
+                             (False, "filter complevel differs"))
+            self.assertEqual(can_copy_chunks(ds["n"], np.dtype("i2"), params),
+                             (False, "type is converted"))
+            self.assertEqual(ds["n"].filters()["complevel"],
+                             target_filters(params)["complevel"])
+
+    def test_copy(self):
+        with mock.patch("ceda_icompress.Core.compression.copy_chunks",
+                        wraps=copy_chunks) as copy:
+            api.compress_dataset(self.path, self.output, self.analysis)
+        # only the variables with matching filters have their chunks copied
+        self.assertEqual(copy.call_count, 1)
+        self.assertEqual(copy.call_args[0][2], ["/n", "/g/m"])
+        with Dataset(self.path) as a, Dataset(self.output) as b:
+            for name in ["n", "g/m", "k"]:
+                va, vb = a[name], b[name]
+                self.assertEqual(vb.dtype, va.dtype, name)
+                self.assertEqual(vb.getncattr("_FillValue"), -1, name)
+                self.assertEqual(vb.units, "1", name)
+                self.assertTrue(np.array_equal(np.ma.getmaskarray(vb[:]),
+                                               np.ma.getmaskarray(va[:])),
+                                name)
+                self.assertTrue(np.ma.allequal(vb[:], va[:]), name)
+            # the chunks are copied with the chunking of the input
+            for name in ["n", "g/m"]:
+                self.assertEqual(b[name].chunking(), [8, 16], name)
+                self.assertEqual(b[name].filters(), a[name].filters(), name)
+            # the other variable is written with the filters of cic_compress
+            self.assertEqual(b["k"].filters()["complevel"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
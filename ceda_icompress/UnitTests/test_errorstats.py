@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+
+from ceda_icompress.InfoMeasures.errorstats import ErrorStats
+from ceda_icompress.BitManipulation.bitshave import BitShave
+
+class errorstatsTest(unittest.TestCase):
+    """Test that the error statistics merged over slabs match those calculated
+    over the whole array."""
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.A = rng.normal(280.0, 10.0, (40, 30)).astype(np.float32)
+        # keep 8 bits of the mantissa
+        self.B = BitShave(self.A, 23-8).process(self.A)
+
+    def test_slabs(self):
+        stats = ErrorStats()
+        for i in range(0, 40, 7):
+            stats.update(self.A[i:i+7], self.B[i:i+7])
+        res = stats.results()
+        a = self.A.astype(np.float64)
+        d = self.B.astype(np.float64) - a
+        self.assertEqual(res["elements"], self.A.size)
+        self.assertAlmostEqual(res["max_abs_error"], np.max(np.abs(d)))
+        self.assertAlmostEqual(res["max_rel_error"],
+                               np.max(np.abs(d) / np.abs(a)))
+        self.assertAlmostEqual(res["mean_bias"], np.mean(d))
+        self.assertAlmostEqual(res["rmse"], np.sqrt(np.mean(d*d)))
+        self.assertAlmostEqual(
+            res["correlation"],
+            np.corrcoef(a.ravel(), self.B.ravel().astype(np.float64))[0,1]
+        )
+
+    def test_masked(self):
+        A = np.ma.masked_greater(self.A, 290.0)
+        B = self.B.copy()
+        # masked and non-finite values are ignored
+        B[A.mask] = np.nan
+        stats = ErrorStats()
+        stats.update(A, B)
+        self.assertEqual(stats.results()["elements"], A.count())
+        self.assertTrue(np.isfinite(stats.results()["rmse"]))
+
+    def test_info_retained(self):
+        bitinfo = np.zeros(32)
+        bitinfo[20:24] = 1.0
+        # keep the top 10 bits only: 22 and 23 of the informative bits
+        keep_mask = 0xFFC00000
+        stats = ErrorStats(bitinfo, keep_mask, 32)
+        self.assertAlmostEqual(stats.info_retained, 0.5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+import numpy as np
+
+from ceda_icompress.Estimate.explore import (trials, trial, frontier,
+    explore_blocks)
+
+class exploreTest(unittest.TestCase):
+    """Test the rate-distortion exploration of the bit manipulation."""
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        self.blocks = [rng.normal(280.0, 10.0, (10, 20)).astype(np.float32)
+                       for i in range(0, 3)]
+
+    def test_trials(self):
+        # every number of mantissa bits, 0 to 23, for each method
+        t = trials(np.float32, ["bitshave", "bitgroom"])
+        self.assertEqual(len(t), 48)
+        # bitmask needs the analysis
+        self.assertEqual(trials(np.float32, ["bitmask"]), [])
+
+    def test_trial(self):
+        # keeping every bit is lossless
+        res = trial("bitshave", 23, None, None, 1, self.blocks)
+        self.assertEqual(res["max_abs_error"], 0.0)
+        self.assertEqual(res["elements"], 600)
+        # keeping fewer bits gives a smaller, less accurate, result
+        res8 = trial("bitshave", 8, None, None, 1, self.blocks)
+        self.assertLess(res8["bytes"], res["bytes"])
+        self.assertGreater(res8["rmse"], 0.0)
+
+    def test_frontier(self):
+        results = [{"bytes" : 10, "rmse" : 1.0},
+                   {"bytes" : 20, "rmse" : 2.0},
+                   {"bytes" : 30, "rmse" : 0.5}]
+        frontier(results)
+        self.assertEqual([r["frontier"] for r in results],
+                         [True, False, True])
+
+    def test_explore(self):
+        results = explore_blocks(self.blocks, ["bitshave", "bitset"])
+        self.assertEqual(len(results), 48)
+        self.assertTrue(any(r["frontier"] for r in results))
+
+if __name__ == '__main__':
+    unittest.main()
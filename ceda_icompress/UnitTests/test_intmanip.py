@@ -0,0 +1,91 @@
+import unittest
+import numpy as np
+from numpy.random import default_rng
+
+from ceda_icompress.BitManipulation.intmanip import IntShave, IntRound
+from ceda_icompress.InfoMeasures.signedexponent import signed_magnitude
+from ceda_icompress.api import analyse_array, compress_array
+
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64,
+             np.uint8, np.uint16, np.uint32, np.uint64, ">i4", ">u2"]
+
+class intmanipTest(unittest.TestCase):
+    """Test the bit manipulation of integers with known answers."""
+    def test_shave(self):
+        A = np.array([-8, -7, -6, -5, -4, -1, 0, 1, 4, 5, 7, 8], dtype="i2")
+        # keep all but the last 2 bits of the magnitude
+        B = IntShave(A, NSB=13).process(A)
+        self.assertEqual(B.dtype, A.dtype)
+        self.assertEqual(B.tolist(), [-8, -4, -4, -4, -4, 0, 0, 0, 4, 4, 4, 8])
+
+    def test_round(self):
+        A = np.array([-8, -7, -6, -5, -2, 2, 3, 5, 6, 10], dtype="i2")
+        B = IntRound(A, NSB=13).process(A)
+        # ties (-6, -2, 2, 6, 10) round to even
+        self.assertEqual(B.tolist(), [-8, -8, -8, -4, 0, 0, 4, 4, 8, 8])
+
+    def test_limits(self):
+        for t in INT_TYPES:
+            info = np.iinfo(t)
+            A = np.array([info.min, info.min+1, info.max-1, info.max],
+                         dtype=t)
+            n_bits = np.dtype(t).itemsize*8
+            for cls in [IntShave, IntRound]:
+                B = cls(A, NSB=n_bits-4).process(A)
+                self.assertEqual(B.dtype, A.dtype)
+                # the values are within the range of the type, and the
+                # magnitude of the error is less than the dropped bits
+                err = np.abs(B.astype(float) - A.astype(float))
+                self.assertTrue((err < 16).all(), f"{cls.__name__} {t}")
+                self.assertEqual(int(B[0]), info.min)
+
+    def test_random(self):
+        rng = default_rng(100)
+        for t in INT_TYPES:
+            info = np.iinfo(t)
+            A = rng.integers(max(info.min, -100000), min(info.max, 100000),
+                             size=1000, dtype=np.dtype(t).newbyteorder("="))
+            A = A.astype(t)
+            for NSB in [0, 3, 7]:
+                S = IntShave(A, NSB=NSB).process(A).astype(np.float64)
+                R = IntRound(A, NSB=NSB).process(A).astype(np.float64)
+                a = A.astype(np.float64)
+                step = 2**IntShave(A, NSB=NSB).drop
+                # shaving rounds towards zero, and rounding to the nearest,
+                # unless that is beyond the range of the type
+                self.assertTrue((np.abs(S) <= np.abs(a)).all())
+                self.assertTrue((np.abs(S - a) < step).all())
+                near = np.abs(R - a) <= step / 2
+                self.assertTrue((near | (R == S)).all())
+                self.assertTrue(near[np.abs(a) + step < info.max].all())
+
+    def test_masked(self):
+        A = np.ma.masked_array(np.array([5, 6, 7], dtype="i4"),
+                               mask=[False, True, False])
+        B = IntRound(A, NSB=29).process(A)
+        self.assertEqual(B.mask.tolist(), [False, True, False])
+        self.assertEqual(B.compressed().tolist(), [4, 8])
+
+    def test_signed_magnitude(self):
+        A = np.ma.masked_array(np.array([-5, 5, -1, 0], dtype="i2"))
+        B = signed_magnitude(A)
+        self.assertEqual(B.tolist(), [0x8005, 5, 0x8001, 0])
+
+    def test_compress_array(self):
+        # an integer field is analysed, and compressed like a float field
+        rng = default_rng(10)
+        A = (np.cumsum(rng.normal(0, 30, (64, 256)), axis=1) * 100 +
+             rng.integers(-50, 50, (64, 256))).astype(np.int32)
+        analysis = analyse_array(A, axis=1)
+        self.assertEqual(analysis["type"], "int32")
+        for int_method in ["intround", "intshave"]:
+            res = compress_array(A, analysis, int_method=int_method,
+                                 verify=True)
+            self.assertEqual(res.method, int_method)
+            self.assertGreater(res.nsb, 0)
+            self.assertLess(res.nsb, 31)
+            self.assertEqual(res.data.dtype, A.dtype)
+            self.assertGreater(res.errors["correlation"], 0.99)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,208 @@
+import unittest
+import os
+import re
+import tempfile
+from unittest import mock
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress import api
+from ceda_icompress.IO.analysisfile import write_analysis, load_analysis
+from ceda_icompress.IO.journal import (Journal, journal_path, slab_checksum,
+                                       array_checksum, stored_values)
+
+class Interrupted(Exception):
+    pass
+
+
+def create_file(path):
+    """Create a file with a variable that is split into many slabs, a
+    variable that is copied and a variable in a group"""
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("t", 32)
+    ds.createDimension("x", 256)
+    rng = np.random.default_rng(6)
+    tas = ds.createVariable("tas", "f4", ("t", "x"), fill_value=-999.0)
+    tas[:] = np.ma.masked_greater(
+        280.0 + np.cumsum(rng.normal(size=(32, 256)), axis=1), 290.0
+    )
+    tas.history = "created"
+    n = ds.createVariable("n", "i4", ("t",))
+    n[:] = np.arange(32)
+    grp = ds.createGroup("g")
+    pr = grp.createVariable("pr", "f4", ("t", "x"))
+    pr[:] = np.abs(np.cumsum(rng.normal(size=(32, 256)), axis=1))
+    ds.close()
+
+
+def read_file(path):
+    """Read the variables, and their attributes (apart from the verification,
+    and the times in the history), of a file"""
+    ds = Dataset(path)
+    contents = {}
+    for v in [ds["tas"], ds["n"], ds["g"]["pr"]]:
+        atts = {a : str(v.getncattr(a)) for a in v.ncattrs()
+                if not a.startswith("compression_")}
+        if "history" in atts:
+            atts["history"] = re.sub(r"\S+ altered", "altered",
+                                     atts["history"])
+        v.set_auto_maskandscale(False)
+        contents[v.name] = (v[:], v.dtype, atts)
+    ds.close()
+    return contents
+
+
+class journalTest(unittest.TestCase):
+    """Test that an interrupted compression is resumed from the journal, and
+    gives the same output as an uninterrupted compression."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "in.nc")
+        self.output = os.path.join(self.tmp.name, "out.nc")
+        create_file(self.path)
+        self.analysis = api.analyse_dataset(self.path, axis=1).analysis
+        # 16 slabs of tas and of pr
+        self.params = {"slab_bytes" : 2048, "verify" : True,
+                       "chunk_copy" : False}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def compress(self, params, interrupt=None):
+        """Compress the file, interrupting it after a number of slabs"""
+        params = dict(self.params, **params)
+        if interrupt is None:
+            return api.compress_dataset(self.path, self.output,
+                                        self.analysis, params)
+        write_slab = Journal.write_slab
+        def interrupted(journal, *args):
+            if sum(len(s) for s in journal.slabs.values()) == interrupt:
+                raise Interrupted()
+            write_slab(journal, *args)
+        with mock.patch.object(Journal, "write_slab", interrupted):
+            with self.assertRaises(Interrupted):
+                api.compress_dataset(self.path, self.output, self.analysis,
+                                     params)
+
+    def assertSame(self, ref):
+        out = read_file(self.output)
+        for name in ref:
+            self.assertTrue(np.array_equal(out[name][0], ref[name][0]), name)
+            self.assertEqual(out[name][1], ref[name][1], name)
+            self.assertEqual(out[name][2], ref[name][2], name)
+
+    def count_slabs(self, params):
+        """Compress the file, returning the result and the number of slabs
+        written"""
+        with mock.patch.object(Journal, "write_slab", autospec=True,
+                               side_effect=Journal.write_slab) as write_slab:
+            out = self.compress(params)
+        return out, write_slab.call_count
+
+    def test_resume(self):
+        for method in ["bitshave", "bitgroom", "pack"]:
+            params = {"method" : method, "narrow" : True}
+            ref_out, n_slabs = self.count_slabs(dict(params, resume=True))
+            ref = read_file(self.output)
+            for interrupt in [0, 5, 16, 17, 30]:
+                self.compress(dict(params, resume=True), interrupt)
+                self.assertTrue(os.path.exists(journal_path(self.output)))
+                out, n = self.count_slabs(dict(params, resume=True))
+                # the checksums of the slabs written before the interruption
+                # match the values read back, so they are not written again
+                self.assertEqual(n, n_slabs - interrupt)
+                self.assertFalse(os.path.exists(journal_path(self.output)))
+                self.assertSame(ref)
+                # the errors include the slabs written before the interruption
+                self.assertEqual(out.errors, ref_out.errors)
+
+    def test_checksum(self):
+        self.compress({})
+        ref = read_file(self.output)
+        self.compress({"resume" : True}, 10)
+        # corrupt a slab of tas that has been written
+        ds = Dataset(self.output, "a")
+        ds["tas"][3, :] = 0.0
+        ds.close()
+        with mock.patch("ceda_icompress.IO.journal.slab_checksum",
+                        wraps=slab_checksum) as checksum:
+            self.compress({"resume" : True})
+        self.assertSame(ref)
+        self.assertGreater(checksum.call_count, 0)
+
+    def test_stored(self):
+        # the checksum of the values written matches the checksum of the
+        # values read back from the file
+        rng = np.random.default_rng(7)
+        data = np.ma.masked_greater(rng.normal(size=(4, 8)) * 10.0, 5.0)
+        ds = Dataset(os.path.join(self.tmp.name, "stored.nc"), "w")
+        ds.createDimension("x", 8)
+        ds.createDimension("t", None)
+        cases = [("f4", {}), ("f8", {"fill_value" : 1e20}),
+                 ("i2", {}), (">f4", {"endian" : "big"})]
+        atts = [{}, {"scale_factor" : 0.01, "add_offset" : 1.5},
+                {"missing_value" : -1}]
+        n = 0
+        for dtype, kwargs in cases:
+            for a in atts:
+                for scale in [True, False]:
+                    v = ds.createVariable(f"v{n}", dtype, ("t", "x"),
+                                          **kwargs)
+                    n += 1
+                    v.setncatts(a)
+                    v.set_auto_scale(scale)
+                    for i, d in enumerate([data, data.filled(0.0)]):
+                        s = (slice(2*i, 2*i+2), slice(None))
+                        v[s] = d[s]
+                        self.assertEqual(
+                            array_checksum(stored_values(v, d[s])),
+                            slab_checksum(v, s), (v.name, v.__dict__, scale)
+                        )
+        ds.close()
+
+    def test_mismatch(self):
+        self.compress({"resume" : True}, 5)
+        with self.assertRaises(api.OutputFileError):
+            self.compress({"resume" : True, "deflate" : 5})
+        # the journal is kept, and the compression can still be resumed
+        self.assertTrue(os.path.exists(journal_path(self.output)))
+        self.compress({"resume" : True})
+        self.assertFalse(os.path.exists(journal_path(self.output)))
+
+    def test_npz(self):
+        # the journal matches an npz analysis file loaded again, and not one
+        # with different contents
+        path = os.path.join(self.tmp.name, "analysis.npz")
+        write_analysis(self.analysis, path, "npz")
+        n_slabs = self.count_slabs({"resume" : True})[1]
+        ref = read_file(self.output)
+        with load_analysis(path) as A1, load_analysis(path) as A2:
+            self.analysis = A1
+            self.compress({"resume" : True}, 10)
+            self.analysis = A2
+            self.assertEqual(self.count_slabs({"resume" : True})[1],
+                             n_slabs - 10)
+        self.assertSame(ref)
+        self.analysis = load_analysis(path).to_dict()
+        self.compress({"resume" : True}, 10)
+        self.analysis["groups"]["/"]["vars"]["tas"]["bitinfo"][0] += 0.5
+        with self.assertRaises(api.OutputFileError):
+            self.compress({"resume" : True})
+
+    def test_truncated(self):
+        n_slabs = self.count_slabs({"resume" : True})[1]
+        ref = read_file(self.output)
+        self.compress({"resume" : True}, 10)
+        # the last record was cut short
+        with open(journal_path(self.output), "a") as fh:
+            fh.write('{"var" : "/tas", "sl')
+        # the records written after the one cut short are read when the
+        # compression is resumed again, so their slabs are not written again
+        self.compress({"resume" : True}, 20)
+        self.assertEqual(self.count_slabs({"resume" : True})[1], n_slabs - 20)
+        out = read_file(self.output)
+        for name in ref:
+            self.assertTrue(np.array_equal(out[name][0], ref[name][0]))
+
+if __name__ == '__main__':
+    unittest.main()
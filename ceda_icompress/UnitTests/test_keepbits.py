@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
 
-from ceda_icompress.InfoMeasures.keepbits import keepbits
+from ceda_icompress.InfoMeasures.keepbits import (keepbits, norm_ppf,
+    binom_confidence, keepbits_curve, bitmask_curve)
 from ceda_icompress.InfoMeasures.bitinformation import bitinformation
 from ceda_icompress.InfoMeasures.getsigmanexp import getsigmanexp
 from test_types import get_test_types
@@ -23,5 +24,32 @@ class keepbitsTest(unittest.TestCase):
             C = bitinformation(zdist)
             x = keepbits(C, man, shape, 0.95)
 
+    def test_norm_ppf(self):
+        # known quantiles of the standard normal distribution
+        self.assertAlmostEqual(norm_ppf(0.5), 0.0)
+        self.assertAlmostEqual(norm_ppf(0.975), 1.959963984540054)
+        self.assertAlmostEqual(norm_ppf(0.995), 2.5758293035489)
+        self.assertAlmostEqual(norm_ppf(0.001), -3.090232306167813)
+
+    def test_binom_confidence(self):
+        # analytic, so the same every time, and the shape can be given
+        p = binom_confidence(10**6, 0.99)
+        self.assertAlmostEqual(p, 2.5758293035489 / 2000 + 0.5)
+        self.assertEqual(p, binom_confidence((1000, 1000), 0.99))
+
+    def test_curve(self):
+        # the curve should match keepbits for each confidence interval
+        bi = np.zeros(32)
+        bi[10:23] = np.linspace(0.0, 0.5, 13)
+        bi[23:31] = 1.0
+        manbit = [0, 23]
+        cis = np.array([0.5, 0.9, 0.99, 0.999, 0.99999])
+        curve = keepbits_curve(bi, manbit, 1000, cis)
+        for c, k in zip(cis, curve):
+            self.assertEqual(k, keepbits(bi.copy(), manbit, 1000, c))
+        # the bitmask retains fewer bits as the threshold rises
+        masks = bitmask_curve(bi, manbit, 1000, cis)
+        self.assertTrue(np.all(np.diff(masks) <= 0))
+
 if __name__ == '__main__':
     unittest.main()
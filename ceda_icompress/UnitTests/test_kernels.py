@@ -0,0 +1,192 @@
+import unittest
+import os
+import sys
+import subprocess
+import numpy as np
+
+from ceda_icompress.Kernels.registry import (get_kernel, set_kernel_backend,
+    get_kernel_backend, available_kernel_backends, set_kernel_threads,
+    get_kernel_threads, share_kernel_threads, cpu_count, KERNELS)
+from ceda_icompress.Kernels.threads import blocks, MIN_BLOCK
+from ceda_icompress.Core.errors import ParameterError
+from ceda_icompress.InfoMeasures.whichUint import whichUint
+from ceda_icompress.InfoMeasures.bitinformation import bitinformation
+from ceda_icompress.InfoMeasures.bitentropy import bitentropy
+from ceda_icompress.BitManipulation.bitshave import BitShave
+from ceda_icompress.BitManipulation.bitgroom import BitGroom
+from ceda_icompress.BitManipulation.bitset import BitSet
+
+def kernel_arrays():
+    """Arrays of each type with special values, as the uint type"""
+    rng = np.random.default_rng(5)
+    arrays = []
+    for t in [np.float16, np.float32, np.float64]:
+        A = rng.normal(0.0, 1000.0, (7, 300)).astype(t)
+        A[0, :6] = [0.0, -0.0, np.inf, -np.inf, np.nan, np.finfo(t).tiny]
+        arrays.append(A)
+    for t in [np.int8, np.int16, np.int32, np.int64]:
+        info = np.iinfo(t)
+        A = rng.integers(info.min, info.max, (7, 300), dtype=t)
+        A[0, :3] = [info.min, info.max, 0]
+        arrays.append(A)
+    return arrays
+
+
+class kernelsTest(unittest.TestCase):
+    """Test that the kernels of every backend give exactly the same results as
+    the numpy kernels."""
+    def setUp(self):
+        self.backend = get_kernel_backend()
+        self.threads = get_kernel_threads()
+
+    def tearDown(self):
+        set_kernel_backend(self.backend)
+        set_kernel_threads(self.threads)
+
+    def compare(self, name, *args):
+        # the reference is the numpy kernel in a single thread
+        ref = get_kernel(name, "numpy", 1)(*args)
+        for b in available_kernel_backends():
+            for threads in [1, 3]:
+                res = get_kernel(name, b, threads)(*args)
+                self.assertEqual(res.dtype, ref.dtype, f"{name} {b}")
+                self.assertTrue(np.array_equal(res, ref),
+                                f"{name} {b} {threads}")
+
+    def test_registry(self):
+        self.assertIn("numpy", available_kernel_backends())
+        self.assertEqual(set_kernel_backend("numpy"), "numpy")
+        self.assertEqual(get_kernel_backend(), "numpy")
+        self.assertIn(set_kernel_backend("auto"), available_kernel_backends())
+        # numba falls back to numpy if it is not installed
+        self.assertIn(set_kernel_backend("numba"), available_kernel_backends())
+        with self.assertRaises(ParameterError):
+            set_kernel_backend("fortran")
+        for b in available_kernel_backends():
+            for k in KERNELS:
+                self.assertTrue(callable(get_kernel(k, b)))
+
+    def test_threads(self):
+        self.assertEqual(set_kernel_threads(), cpu_count())
+        self.assertEqual(set_kernel_threads(2), 2)
+        self.assertEqual(get_kernel_threads(), 2)
+        with self.assertRaises(ParameterError):
+            set_kernel_threads(0)
+        self.assertGreaterEqual(share_kernel_threads(cpu_count() * 2), 1)
+        # the blocks cover every element once
+        for m in [0, 1, MIN_BLOCK, 5 * MIN_BLOCK + 7]:
+            for n in [1, 2, 4]:
+                b = blocks(m, n)
+                self.assertLessEqual(len(b), n)
+                self.assertEqual(
+                    np.concatenate([np.arange(m)[s] for s in b]).tolist(),
+                    list(range(0, m))
+                )
+        # arrays large enough to be split into blocks, with pairs across the
+        # boundaries of the blocks
+        A = np.random.default_rng(4).normal(size=(3, 3 * MIN_BLOCK + 5))
+        Av = A.astype(np.float32).view(np.uint32)
+        valid = np.random.default_rng(1).random(Av[:, 1:].shape) < 0.8
+        self.assertEqual(len(blocks(Av.shape[1], 3)), 3)
+        self.compare("bitcount", Av.ravel())
+        self.compare("bitpaircount", Av[:, :-1], Av[:, 1:])
+        self.compare("bitpaircount", Av[:, :-1], Av[:, 1:], valid)
+        self.compare("signed_exponent", Av, np.uint32(0x807fffff),
+                     np.uint32(0x7f800000), np.uint32(0x40000000), 23, 127)
+        self.compare("signed_magnitude", Av)
+        self.compare("bitmanipulate", Av, np.uint32(0xffff0000), 0)
+
+    def test_environment(self):
+        code = ("from ceda_icompress.Kernels.registry import "
+                "get_kernel_backend; print(get_kernel_backend())")
+        env = dict(os.environ, CIC_KERNELS="numpy")
+        out = subprocess.run([sys.executable, "-c", code], env=env,
+                             capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "numpy")
+        code = ("from ceda_icompress.Kernels.registry import "
+                "get_kernel_threads; print(get_kernel_threads())")
+        env = dict(os.environ, CIC_THREADS="3")
+        out = subprocess.run([sys.executable, "-c", code], env=env,
+                             capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "3")
+
+    def test_bitcount(self):
+        for A in kernel_arrays():
+            self.compare("bitcount", A.view(whichUint(A.dtype)).ravel())
+
+    def test_bitpaircount(self):
+        for A in kernel_arrays():
+            Av = A.view(whichUint(A.dtype))
+            valid = np.random.default_rng(1).random(Av[:, 1:].shape) < 0.8
+            self.compare("bitpaircount", Av[:, :-1], Av[:, 1:])
+            self.compare("bitpaircount", Av[:, :-1], Av[:, 1:], valid)
+            # counted with shifts and masks, one pair at a time
+            ref = get_kernel("bitpaircount", "numpy")(Av[:1, :5], Av[:1, 1:6])
+            for b in range(0, A.itemsize*8):
+                pairs = [2*((int(a) >> b) & 1) + ((int(c) >> b) & 1)
+                         for a, c in zip(Av[0, :5], Av[0, 1:6])]
+                for m in range(0, 4):
+                    self.assertEqual(ref[0, m, b], pairs.count(m))
+
+    def test_run_lengths(self):
+        for A in kernel_arrays():
+            Sv = np.sort(A.view(whichUint(A.dtype)).ravel() % 17)
+            self.compare("run_lengths", Sv)
+            self.assertEqual(
+                get_kernel("run_lengths", "numpy")(Sv).sum(), Sv.size
+            )
+        self.compare("run_lengths", np.zeros((0,), dtype=np.uint32))
+
+    def test_signed(self):
+        for A in kernel_arrays():
+            Av = A.view(whichUint(A.dtype))
+            if A.dtype.kind == "i":
+                self.compare("signed_magnitude", Av)
+                # the magnitude is in the bits below the sign bit
+                B = get_kernel("signed_magnitude", "numpy")(Av[:, 1:])
+                sign = B >> B.dtype.type(A.itemsize*8 - 1)
+                self.assertTrue((sign == (A[:, 1:] < 0)).all())
+            else:
+                t_uint = whichUint(A.dtype)
+                nbits = A.itemsize*8
+                mbits = {2 : 10, 4 : 23, 8 : 52}[A.itemsize]
+                bias = {2 : 15, 4 : 127, 8 : 1023}[A.itemsize]
+                smask = t_uint(1) << t_uint(nbits - 1)
+                mmask = (t_uint(1) << t_uint(mbits)) - t_uint(1)
+                emask = ~(smask | mmask)
+                self.compare("signed_exponent", Av, smask | mmask, emask,
+                             smask >> t_uint(1), mbits, bias)
+
+    def test_bitmanipulate(self):
+        for A in kernel_arrays():
+            Av = A.view(whichUint(A.dtype))
+            t_uint = Av.dtype.type
+            self.compare("bitmanipulate", Av, t_uint(0xf0), 0)
+            self.compare("bitmanipulate", Av, np.iinfo(t_uint).max,
+                         t_uint(0x0f))
+            self.compare("bitmanipulate", Av[:, ::3], t_uint(0xf0),
+                         t_uint(0x05))
+
+    def test_functions(self):
+        # the functions that use the kernels give the same results with every
+        # backend
+        A = np.cumsum(np.random.default_rng(3).normal(size=(5, 400)), axis=1)
+        A = np.ma.masked_less(A.astype(np.float32), -2.0)
+        results = {}
+        for b in available_kernel_backends():
+            set_kernel_backend(b)
+            res = [np.ma.filled(bitinformation(A, 1), -1.0),
+                   np.ma.filled(bitinformation(A, 1, batch_axes=0), -1.0),
+                   np.array(bitentropy(A))]
+            for cls in [BitShave, BitGroom, BitSet]:
+                R = cls(A, 7).process(A)
+                self.assertTrue((np.ma.getmaskarray(R) ==
+                                 np.ma.getmaskarray(A)).all())
+                res.append(np.ma.filled(R, 0.0))
+            results[b] = res
+        for b in results:
+            for r, ref in zip(results[b], results["numpy"]):
+                self.assertTrue(np.array_equal(r, ref), b)
+
+if __name__ == '__main__':
+    unittest.main()
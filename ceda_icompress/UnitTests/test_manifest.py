@@ -0,0 +1,52 @@
+import unittest
+import os
+import json
+import tempfile
+
+from ceda_icompress.Batch.manifest import read_manifest, Ledger, ManifestError
+
+class manifestTest(unittest.TestCase):
+    """Test reading the manifest and the ledger for cic_batch."""
+    def test_csv(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "manifest.csv")
+            with open(path, "w") as fh:
+                fh.write("input,analysis,output,var,axis\n"
+                         "a.nc,a.cic,a_comp.nc,tas,2\n"
+                         "b.nc,a.cic,,,\n")
+            entries = read_manifest(path)
+            self.assertEqual(len(entries), 2)
+            self.assertEqual(entries[0]["var"], ["tas"])
+            self.assertEqual(entries[0]["axis"], 2)
+            self.assertEqual(entries[1]["output"], None)
+            self.assertEqual(entries[1]["axis"], None)
+
+    def test_json(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "manifest.json")
+            with open(path, "w") as fh:
+                json.dump([{"input" : "a.nc", "output" : "a_comp.nc"}], fh)
+            # no analysis key
+            with self.assertRaises(ManifestError):
+                read_manifest(path)
+
+    def test_ledger(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "ledger")
+            out = os.path.join(tmp, "out.nc")
+            open(out, "w").close()
+            ledger = Ledger(path)
+            ledger.record("compress", out, "ok")
+            ledger.record("compress", "missing.nc", "ok")
+            ledger.record("analyse", "a.cic", "failed", error="error")
+            ledger.close()
+            # re-open the ledger, only completed stages whose file exists
+            # are done
+            ledger = Ledger(path)
+            self.assertTrue(ledger.done("compress", out))
+            self.assertFalse(ledger.done("compress", "missing.nc"))
+            self.assertFalse(ledger.done("analyse", "a.cic"))
+            ledger.close()
+
+if __name__ == '__main__':
+    unittest.main()
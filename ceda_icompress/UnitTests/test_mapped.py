@@ -0,0 +1,136 @@
+import unittest
+import os
+import tempfile
+import struct
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress.IO.mapped import (MappedVariable, MapError, var_reader,
+                                      read_nc3_header, NC_VARIABLE)
+from ceda_icompress.IO.chunkcopy import h5py
+
+def create_file(path, format):
+    """Create a file with record and fixed variables, some masked values and
+    a scalar"""
+    ds = Dataset(path, "w", format=format)
+    ds.createDimension("t", None)
+    ds.createDimension("y", 7)
+    ds.createDimension("x", 5)
+    ds.title = "test file"
+    rng = np.random.default_rng(0)
+    a = ds.createVariable("a", "f4", ("t", "y", "x"), fill_value=-999.0)
+    a.units = "K"
+    a[0:4] = rng.normal(size=(4, 7, 5)).astype(np.float32)
+    a[1, 2, 3] = np.ma.masked
+    b = ds.createVariable("b", "i2", ("t", "x"))
+    b[0:4] = np.arange(20).reshape(4, 5)
+    f = ds.createVariable("f", "f8", ("y", "x"))
+    f[:] = rng.normal(size=(7, 5))
+    s = ds.createVariable("s", "f4", ())
+    s.assignValue(3.5)
+    p = ds.createVariable("p", "i2", ("x",))
+    p.scale_factor = 0.5
+    p[:] = np.arange(5)
+    ds.close()
+
+
+def create_hdf5_file(path):
+    """Create a netCDF4 file with contiguous variables, some masked values, a
+    big endian variable and a variable in a group, and chunked variables"""
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("y", 7)
+    ds.createDimension("x", 5)
+    rng = np.random.default_rng(1)
+    a = ds.createVariable("a", "f4", ("y", "x"), contiguous=True,
+                          fill_value=-999.0)
+    a[:] = rng.normal(size=(7, 5)).astype(np.float32)
+    a[2, 3] = np.ma.masked
+    b = ds.createVariable("b", ">i4", ("y", "x"), contiguous=True,
+                          endian="big")
+    b[:] = np.arange(35).reshape(7, 5)
+    grp = ds.createGroup("g")
+    f = grp.createVariable("f", "f8", ("y", "x"), contiguous=True)
+    f[:] = rng.normal(size=(7, 5))
+    c = ds.createVariable("c", "f4", ("y", "x"), chunksizes=(7, 1))
+    c[:] = rng.normal(size=(7, 5))
+    z = ds.createVariable("z", "f4", ("y", "x"), compression="zlib")
+    z[:] = rng.normal(size=(7, 5))
+    ds.close()
+
+
+class mappedTest(unittest.TestCase):
+    """Test that the mapped variables match those read by netCDF4."""
+    def check_file(self, format):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.nc")
+            create_file(path, format)
+            ds = Dataset(path)
+            for v in ["a", "b", "f", "s"]:
+                var = ds.variables[v]
+                m = MappedVariable(var)
+                full = tuple(slice(None) for d in var.shape)
+                A = m[full]
+                B = var[full]
+                self.assertEqual(A.dtype, B.dtype.newbyteorder("="))
+                self.assertTrue(np.array_equal(np.ma.getmaskarray(A),
+                                               np.ma.getmaskarray(B)))
+                self.assertTrue(np.array_equal(A.filled(0), B.filled(0)))
+                if var.ndim > 1:
+                    s = (slice(1, 3), slice(2, 5))
+                    self.assertTrue(np.array_equal(m[s], var[s]))
+            # packed variables are read through netCDF4
+            with self.assertRaises(MapError):
+                MappedVariable(ds.variables["p"])
+            self.assertIs(var_reader(ds.variables["p"]), ds.variables["p"])
+            ds.close()
+
+    @unittest.skipIf(h5py is None, "h5py is not installed")
+    def test_netcdf4(self):
+        # contiguous variables are mapped from the HDF5 file
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.nc")
+            create_hdf5_file(path)
+            ds = Dataset(path)
+            for var in [ds["a"], ds["b"], ds["g"]["f"]]:
+                m = MappedVariable(var)
+                full = (slice(None), slice(None))
+                A = m[full]
+                B = var[full]
+                self.assertEqual(A.dtype, B.dtype.newbyteorder("="))
+                self.assertTrue(np.array_equal(np.ma.getmaskarray(A),
+                                               np.ma.getmaskarray(B)))
+                self.assertTrue(np.array_equal(A.filled(0), B.filled(0)))
+                s = (slice(1, 3), slice(2, 5))
+                self.assertTrue(np.array_equal(m[s], var[s]))
+            self.assertTrue(np.ma.is_masked(MappedVariable(ds["a"])[2, 3]))
+            # chunked variables are read through netCDF4
+            for v in ["c", "z"]:
+                with self.assertRaises(MapError):
+                    MappedVariable(ds[v])
+                self.assertIs(var_reader(ds[v]), ds[v])
+            ds.close()
+
+    def test_corrupt(self):
+        # a header with the wrong tag on a list is not mapped
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "test.nc")
+            create_file(path, "NETCDF3_CLASSIC")
+            self.assertEqual(read_nc3_header(path)["nrecvars"], 2)
+            # the tag of the dimension list follows the magic and numrecs
+            with open(path, "r+b") as fh:
+                fh.seek(8)
+                fh.write(struct.pack(">i", NC_VARIABLE))
+            with self.assertRaises(MapError):
+                read_nc3_header(path)
+
+    def test_classic(self):
+        self.check_file("NETCDF3_CLASSIC")
+
+    def test_64bit_offset(self):
+        self.check_file("NETCDF3_64BIT_OFFSET")
+
+    def test_64bit_data(self):
+        self.check_file("NETCDF3_64BIT_DATA")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+import numpy as np
+
+from ceda_icompress.Conversion.narrowing import (TypeScan, narrowest_type,
+    checked_type)
+
+def scan_array(A, n_slabs=3):
+    """Scan an array in a number of slabs"""
+    scan = TypeScan(A.dtype)
+    for a in np.array_split(A, n_slabs):
+        scan.update(a)
+    return scan
+
+class narrowingTest(unittest.TestCase):
+    """Test the narrowing planner chooses the smallest exact type."""
+    def test_ints(self):
+        A = np.arange(-100, 100, dtype=np.int64)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.int8)
+        A = np.arange(0, 40000, dtype=np.int64)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.int32)
+        A = np.arange(0, 200, dtype=np.uint32)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.uint8)
+
+    def test_fill_value(self):
+        # the fill value must fit in the narrowed type
+        A = np.arange(-100, 100, dtype=np.int32)
+        t, _ = narrowest_type(scan_array(A), fill_value=-32767)
+        self.assertEqual(t, np.int16)
+
+    def test_whole_floats(self):
+        A = np.arange(0, 1000, dtype=np.float64)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.int16)
+        # NaNs cannot be stored in an integer, but can in a float32
+        A[10] = np.nan
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.float32)
+
+    def test_negative_zero(self):
+        # the sign of -0.0 would be lost in an integer
+        A = np.array([-0.0, 1.0, 2.0], dtype=np.float32)
+        t, _ = narrowest_type(scan_array(A, 1))
+        self.assertEqual(t, np.float32)
+        A = np.array([0.0, 1.0, 2.0], dtype=np.float32)
+        t, _ = narrowest_type(scan_array(A, 1))
+        self.assertEqual(t, np.int8)
+
+    def test_float32_exact(self):
+        A = np.linspace(0, 1, 1000, dtype=np.float32).astype(np.float64)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.float32)
+        A = np.linspace(0, 1, 1000, dtype=np.float64)
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.float64)
+
+    def test_masked(self):
+        # masked values should not be scanned
+        A = np.ma.masked_array(np.arange(0, 100, dtype=np.float64) + 0.5)
+        A[1:] = np.ma.masked
+        A.data[0] = 1.0
+        t, _ = narrowest_type(scan_array(A))
+        self.assertEqual(t, np.int8)
+
+    def test_checked(self):
+        A = np.array([0, 2**40], dtype=np.int64)
+        t, _ = checked_type(scan_array(A, 1), np.int32)
+        self.assertEqual(t, np.int64)
+        A = np.array([0, 1e300], dtype=np.float64)
+        t, _ = checked_type(scan_array(A, 1), np.float32)
+        self.assertEqual(t, np.float64)
+        A = np.array([0, 0.1], dtype=np.float64)
+        t, _ = checked_type(scan_array(A, 1), np.float32)
+        self.assertEqual(t, np.float32)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress.BitManipulation.pack import Pack
+from ceda_icompress import api
+
+def create_file(path):
+    """Create a file with a masked float variable, with a NaN"""
+    rng = np.random.default_rng(4)
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("t", 16)
+    ds.createDimension("x", 128)
+    x = np.linspace(0.0, 2*np.pi, 128)
+    tas = ds.createVariable("tas", "f4", ("t", "x"), fill_value=1e20)
+    tas.valid_range = np.array([200.0, 350.0], dtype=np.float32)
+    data = 280.0 + 10.0 * np.sin(x[None,:] + np.arange(16)[:,None])
+    data = np.ma.masked_array(data, mask=rng.random(data.shape) < 0.1)
+    data[0, 0] = np.nan
+    tas[:] = data
+    ds.close()
+
+
+class packTest(unittest.TestCase):
+    """Test packing into a smaller integer type."""
+    def test_type(self):
+        A = np.linspace(270.0, 290.0, 1000, dtype=np.float32)
+        # the step of the largest value (256 <= 290 < 512) is 2**(8-NSB)
+        # and the range is 20, so needs 20 * 2**(NSB-8) + 1 values
+        for NSB, t in [(0, np.int8), (11, np.int8), (12, np.int16),
+                       (19, np.int16), (20, np.int32)]:
+            man = Pack(A, NSB)
+            man.set_range(A.min(), A.max())
+            self.assertEqual(man.packed_type, np.dtype(t), NSB)
+            P = man.process(A)
+            self.assertEqual(P.dtype, np.dtype(t))
+            # rounded to the nearest step, so half of the bitshave error
+            err = np.abs(man.unpack(P) - A)
+            self.assertTrue((err <= 2.0**(8-NSB) / 2).all(), NSB)
+
+    def test_fill(self):
+        A = np.ma.masked_array(np.array([1.0, 2.0, np.nan, 4.0, np.inf],
+                                        dtype=np.float32),
+                               mask=[False, True, False, False, False])
+        man = Pack(A, 4)
+        man.set_range(1.0, 4.0)
+        P = man.process(A)
+        self.assertEqual(P.mask.tolist(), [False, True, True, False, True])
+        self.assertEqual(np.ma.filled(P)[1], man.fill_value)
+        # the fill value is never a packed value
+        self.assertTrue((P.compressed() > man.fill_value).all())
+        # constant and empty arrays
+        for vmin, vmax in [(5.0, 5.0), (None, None)]:
+            man.set_range(vmin, vmax)
+            self.assertEqual(man.packed_type, np.dtype(np.int8))
+
+    def test_compress_array(self):
+        A = np.random.default_rng(2).normal(280.0, 10.0, (50, 40))
+        res = api.compress_array(A.astype(np.float32), method="pack", nsb=6,
+                                 verify=True)
+        self.assertEqual(res.data.dtype, np.dtype(np.int8))
+        self.assertEqual(res.method, "pack")
+        self.assertLessEqual(res.errors["max_abs_error"], 2.0**(8-6) / 2)
+        unpacked = res.data * res.scale_factor + res.add_offset
+        self.assertTrue(np.allclose(unpacked, A, atol=2.0**(8-6) / 2))
+
+    def test_dataset(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "in.nc")
+            output = os.path.join(tmp, "out.nc")
+            create_file(path)
+            analysis = {"file" : path, "groups" : {"/" : {"vars" : {
+                "tas" : {"retainbits" : 12}}}}}
+            api.compress_dataset(path, output, analysis, {"method" : "pack"})
+            with Dataset(path) as ds_in, Dataset(output) as ds_out:
+                v = ds_out["tas"]
+                self.assertEqual(v.dtype, np.dtype(np.int16))
+                self.assertEqual(v._FillValue, -32768)
+                self.assertEqual(v.scale_factor.dtype, np.float32)
+                self.assertEqual(v.valid_range.dtype, np.int16)
+                A = ds_in["tas"][:]
+                B = v[:]
+                # masked values, and the NaN, are the _FillValue
+                mask = np.ma.getmaskarray(A) | np.isnan(np.ma.getdata(A))
+                self.assertTrue((np.ma.getmaskarray(B) == mask).all())
+                self.assertLessEqual(np.max(np.abs(B - A)), 2.0**(8-12) / 2)
+            # packing into a type no smaller than float32 uses bitshave
+            analysis["groups"]["/"]["vars"]["tas"]["retainbits"] = 20
+            api.compress_dataset(path, output, analysis, {"method" : "pack"},
+                                 force=True)
+            with Dataset(output) as ds_out:
+                self.assertEqual(ds_out["tas"].dtype, np.dtype(np.float32))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+import zlib
+import numpy as np
+
+from ceda_icompress.Estimate.predictor import (shuffle_bytes, compressed_size,
+    sample_blocks, SizeEstimate)
+
+class predictorTest(unittest.TestCase):
+    """Test the sampling and the estimate of the compressed size."""
+    def test_shuffle(self):
+        A = np.array([0x01020304, 0x05060708], dtype="<u4")
+        self.assertEqual(shuffle_bytes(A), bytes([4, 8, 3, 7, 2, 6, 1, 5]))
+        self.assertEqual(compressed_size(A, 0), A.nbytes)
+        self.assertEqual(compressed_size(A, 1),
+                         len(zlib.compress(shuffle_bytes(A), 1)))
+
+    def test_sample(self):
+        blocks, n = sample_blocks((100, 10), 4, None, 5, 400)
+        self.assertEqual(n, 10)
+        self.assertEqual(len(blocks), 5)
+        # the same seed gives the same sample
+        again, n = sample_blocks((100, 10), 4, None, 5, 400)
+        self.assertEqual(blocks, again)
+        # every block is sampled if there are fewer than the samples
+        blocks, n = sample_blocks((100, 10), 4, None, 20, 400)
+        self.assertEqual(len(blocks), n)
+
+    def test_estimate(self):
+        est = SizeEstimate()
+        for c in [10, 20, 30, 40]:
+            est.update(100, c, 0.5)
+        # all the blocks are sampled, so the estimate is exact
+        res = est.results(400, 4)
+        self.assertEqual(res["bytes"], 100)
+        self.assertEqual(res["bytes_low"], res["bytes_high"])
+        self.assertAlmostEqual(res["seconds"], 2.0)
+        # scaled up, with an interval around the estimate
+        res = est.results(4000, 40)
+        self.assertEqual(res["bytes"], 1000)
+        self.assertLess(res["bytes_low"], 1000)
+        self.assertGreater(res["bytes_high"], 1000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import unittest
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress import api
+from ceda_icompress.Server.client import submit, ServerError
+from ceda_icompress.Server.daemon import CompressionServer
+
+def create_file(path):
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.createDimension("t", 8)
+    ds.createDimension("x", 64)
+    x = np.linspace(0.0, 2*np.pi, 64)
+    tas = ds.createVariable("tas", "f4", ("t", "x"))
+    tas[:] = (280.0 + 10.0 * np.sin(x[None,:] + np.arange(8)[:,None]))
+    ds.close()
+
+
+class serverTest(unittest.TestCase):
+    """Test that jobs submitted to the server give the same output as the
+    library, and that errors are returned rather than stopping the server."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sock = os.path.join(self.tmp.name, "s.sock")
+        self.server = CompressionServer(self.sock, workers=1)
+        self.thread = threading.Thread(
+            target=lambda: asyncio.run(self.server.run())
+        )
+        self.thread.start()
+        # wait for the server to start listening
+        for i in range(0, 100):
+            try:
+                submit({"op" : "ping"}, self.sock)
+                break
+            except ServerError:
+                time.sleep(0.1)
+
+    def tearDown(self):
+        submit({"op" : "stop"}, self.sock)
+        self.thread.join()
+        self.assertFalse(os.path.exists(self.sock))
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def test_compress(self):
+        create_file(self.path("in.nc"))
+        res = submit({"op" : "analyse", "file" : self.path("in.nc"),
+                      "output" : self.path("in.cic")}, self.sock)
+        self.assertEqual(res["status"], "ok")
+        # compress twice, the second time with the cached analysis
+        for out in ["out1.nc", "out2.nc"]:
+            res = submit({"op" : "compress", "file" : self.path("in.nc"),
+                          "output" : self.path(out),
+                          "analysis" : self.path("in.cic"),
+                          "params" : {"verify" : True}}, self.sock)
+            self.assertEqual(res["status"], "ok")
+            self.assertIn("/tas", res["result"]["errors"])
+        api.compress_dataset(self.path("in.nc"), self.path("ref.nc"),
+                             self.path("in.cic"))
+        for out in ["out1.nc", "out2.nc"]:
+            with Dataset(self.path(out)) as a, \
+                 Dataset(self.path("ref.nc")) as b:
+                self.assertTrue(np.array_equal(a["tas"][:], b["tas"][:]))
+        res = submit({"op" : "status"}, self.sock)
+        self.assertEqual(res["result"]["jobs"]["ok"], 3)
+
+    def test_errors(self):
+        res = submit({"op" : "compress", "file" : self.path("missing.nc"),
+                      "output" : self.path("out.nc"),
+                      "analysis" : self.path("missing.cic")}, self.sock)
+        self.assertEqual(res["status"], "error")
+        self.assertEqual(res["type"], "AnalysisFileError")
+        res = submit({"op" : "compress"}, self.sock)
+        self.assertEqual(res["type"], "ParameterError")
+        res = submit({"op" : "unknown"}, self.sock)
+        self.assertEqual(res["type"], "ParameterError")
+        # the server is still running
+        self.assertEqual(submit({"op" : "ping"}, self.sock)["status"], "ok")
+        # a second server cannot use the same socket
+        with self.assertRaises(ServerError):
+            asyncio.run(CompressionServer(self.sock).run())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress import api
+from ceda_icompress.Core.analysis import analyse_var
+from ceda_icompress.IO.chunkcopy import h5py
+from ceda_icompress.IO.analysisfile import write_analysis
+from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+
+def create_file(path):
+    """Create a file with float variables to bit manipulate, a chunked and
+    compressed integer variable whose chunks are copied, a string variable, a
+    scalar and a variable in a group that uses a dimension of the root
+    group"""
+    ds = Dataset(path, "w", format="NETCDF4")
+    ds.title = "shards"
+    ds.createDimension("t", 32)
+    ds.createDimension("x", 64)
+    rng = np.random.default_rng(8)
+    for i in range(0, 3):
+        v = ds.createVariable(f"tas{i}", "f4", ("t", "x"), fill_value=-1.0)
+        v[:] = np.ma.masked_greater(
+            280.0 + np.cumsum(rng.normal(size=(32, 64)), axis=1), 285.0
+        )
+        v.units = "K"
+    n = ds.createVariable("n", "i4", ("t",), compression="zlib",
+                          complevel=1, chunksizes=(8,))
+    n[:] = np.arange(32)
+    s = ds.createVariable("s", str, ("t",))
+    s[:] = np.array([f"s{i}" for i in range(32)], dtype=object)
+    c = ds.createVariable("c", "f8", ())
+    c[...] = 2.5
+    grp = ds.createGroup("g")
+    grp.createDimension("y", 16)
+    pr = grp.createVariable("pr", "f4", ("t", "y"))
+    pr[:] = np.abs(np.cumsum(rng.normal(size=(32, 16)), axis=1))
+    ds.close()
+
+
+@unittest.skipIf(h5py is None, "h5py is not installed")
+class shardsTest(unittest.TestCase):
+    """Test that compressing the variables in parallel, into shards that are
+    stitched together, gives the same output as compressing them one after
+    another."""
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "in.nc")
+        create_file(self.path)
+        # the variables to bit manipulate in each group
+        names = {"/" : ["tas0", "tas1", "tas2"], "g" : ["pr"]}
+        self.analysis = {"file" : self.path, "groups" : {}}
+        with Dataset(self.path) as ds:
+            for g in names:
+                grp = ds if g == "/" else ds.groups[g]
+                self.analysis["groups"][g] = {"vars" : {
+                    v : analyse_var(grp[v], None, None, None, 1)
+                    for v in names[g]
+                }}
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assertSameGroup(self, a, b):
+        self.assertEqual(a.__dict__, b.__dict__)
+        self.assertEqual(list(a.dimensions), list(b.dimensions))
+        self.assertEqual(list(a.variables), list(b.variables))
+        for name in a.variables:
+            va, vb = a[name], b[name]
+            atts = [{k : str(x) for k, x in v.__dict__.items()
+                     if k != "history"} for v in [va, vb]]
+            self.assertEqual(atts[0], atts[1], name)
+            self.assertEqual(va.dtype, vb.dtype, name)
+            self.assertEqual(va.chunking(), vb.chunking(), name)
+            self.assertEqual(va.filters(), vb.filters(), name)
+            va.set_auto_maskandscale(False)
+            vb.set_auto_maskandscale(False)
+            self.assertTrue(
+                np.array_equal(np.asarray(va[...]), np.asarray(vb[...])), name
+            )
+        self.assertEqual(list(a.groups), list(b.groups))
+        for name in a.groups:
+            self.assertSameGroup(a.groups[name], b.groups[name])
+
+    def test_shards(self):
+        for method in ["bitshave", "pack"]:
+            results = []
+            for workers in [1, 3]:
+                output = os.path.join(self.tmp.name, f"out{workers}.nc")
+                params = {"method" : method, "verify" : True,
+                          "workers" : workers}
+                results.append(api.compress_dataset(
+                    self.path, output, self.analysis, params))
+            self.assertEqual(results[0].errors, results[1].errors)
+            self.assertEqual(list(results[0].timings),
+                             list(results[1].timings))
+            with Dataset(results[0].output) as a:
+                with Dataset(results[1].output) as b:
+                    self.assertSameGroup(a, b)
+            # the shards are removed
+            self.assertEqual(sorted(os.listdir(self.tmp.name)),
+                             ["in.nc", "out1.nc", "out3.nc"])
+
+    def test_npz(self):
+        # an analysis file, read lazily, is sent to the workers
+        output = os.path.join(self.tmp.name, "out.nc")
+        results = []
+        for fmt in ["json", "npz"]:
+            path = os.path.join(self.tmp.name, f"analysis.{fmt}")
+            write_analysis(dict(self.analysis,
+                                version=CIC_FILE_FORMAT_VERSION), path, fmt)
+            results.append(api.compress_dataset(
+                self.path, output, path, {"verify" : True, "workers" : 2}
+            ))
+            os.remove(path)
+        self.assertEqual(results[0].errors, results[1].errors)
+
+    def test_errors(self):
+        output = os.path.join(self.tmp.name, "out.nc")
+        with self.assertRaises(api.ParameterError):
+            api.compress_dataset(self.path, output, self.analysis,
+                                 {"workers" : 0})
+        with self.assertRaises(api.ParameterError):
+            api.compress_dataset(self.path, output, self.analysis,
+                                 {"workers" : 2, "resume" : True})
+        # errors in the workers are raised
+        analysis = dict(self.analysis)
+        analysis["groups"] = {"g" : {"vars" : {"pr" : {"bitinfo" : [0.0]}}}}
+        with self.assertRaises(api.CICError):
+            api.compress_dataset(self.path, output, analysis,
+                                 {"workers" : 2})
+        self.assertEqual(os.listdir(self.tmp.name), ["in.nc"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+
+from ceda_icompress.IO.slabs import SlabIterator, slab_shape
+
+class slabsTest(unittest.TestCase):
+    """Test the slab iterator covers the whole variable within the budget."""
+    def test_cover(self):
+        # every element should be visited exactly once
+        shape = (7, 13, 5, 11)
+        for max_bytes in [1, 4, 100, 1000, 4*7*13*5*11, 10**9]:
+            count = np.zeros(shape, dtype=np.int32)
+            slabs = SlabIterator(shape, 4, max_bytes)
+            n = 0
+            for s in slabs:
+                count[s] += 1
+                self.assertTrue(count[s].size * 4 <= max(max_bytes, 4))
+                n += 1
+            self.assertTrue((count == 1).all())
+            self.assertEqual(n, len(slabs))
+
+    def test_chunks(self):
+        # the split dimension should be a multiple of the chunk size
+        S = slab_shape((100, 10, 10), 4, 4*10*10*25, chunks=(8, 10, 10))
+        self.assertEqual(S, (24, 10, 10))
+        # unless the chunk is larger than the slab
+        S = slab_shape((100, 10, 10), 4, 4*10*10*5, chunks=(8, 10, 10))
+        self.assertEqual(S, (5, 10, 10))
+
+    def test_scalar(self):
+        slabs = SlabIterator((), 4)
+        self.assertEqual(list(slabs), [()])
+        self.assertEqual(len(slabs), 1)
+
+    def test_empty(self):
+        slabs = SlabIterator((0, 10), 4)
+        self.assertEqual(list(slabs), [])
+        self.assertEqual(len(slabs), 0)
+
+if __name__ == '__main__':
+    unittest.main()
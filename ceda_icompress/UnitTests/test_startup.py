@@ -0,0 +1,114 @@
+import unittest
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+from ceda_icompress.CLI.cic import cic, SUBCOMMANDS
+
+# the modules that are slow to import, and should only be imported when a
+# command does some work
+HEAVY_MODULES = ["numpy", "netCDF4", "h5py", "cftime"]
+# set this environment variable to compare the import times, which depend
+# on the load of the machine, in the tests
+BENCHMARK_ENV = "CIC_BENCHMARK"
+
+def imported_heavy_modules(args):
+    """Run cic with the arguments in a new interpreter, and get the heavy
+    modules that were imported"""
+    code = (
+        "import sys, json\n"
+        "from ceda_icompress.CLI.cic import cic\n"
+        f"try:\n    cic({args!r})\n"
+        "except SystemExit:\n    pass\n"
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} "
+        "if m in sys.modules]))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                         text=True, check=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def import_times(modules):
+    """Import the modules, in order, in a new interpreter and get the time
+    taken to import each (including the modules it imports first), in
+    seconds, from python -X importtime"""
+    code = "; ".join(f"import {m}" for m in modules)
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                         capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in err.splitlines():
+        # import time: self [us] | cumulative | imported package
+        fields = line.split("|")
+        if len(fields) == 3 and fields[2].strip() in modules:
+            times[fields[2].strip()] = int(fields[1]) * 1e-6
+    return times
+
+
+def benchmark(repeat=5):
+    """Time the import of cic and each subcommand module, which is most of
+    the start up time of --help, against importing numpy"""
+    cic_module = "ceda_icompress.CLI.cic"
+    times = {"numpy" : None, "cic" : None}
+    for sub, (module, command, short_help) in SUBCOMMANDS.items():
+        for i in range(0, repeat):
+            t = import_times([cic_module, module, "numpy"])
+            # the fastest of the repeats is the least disturbed
+            for k, m in [("numpy", "numpy"), ("cic", cic_module),
+                         (f"cic {sub}", module)]:
+                if times.get(k) is None or t[m] < times[k]:
+                    times[k] = t[m]
+    return times
+
+
+class startupTest(unittest.TestCase):
+    """Check that the start up of the cic command does not import numpy and
+    netCDF4 until it does some work, and benchmark it."""
+    def test_help_imports(self):
+        self.assertEqual(imported_heavy_modules(["--help"]), [])
+        for sub in SUBCOMMANDS:
+            self.assertEqual(imported_heavy_modules([sub, "--help"]), [],
+                             f"cic {sub} --help")
+
+    def test_display_imports(self):
+        # a JSON analysis file is displayed without numpy
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "a.cic")
+            bitinfo = [0.0] * 16 + [0.5] * 8 + [0.0] * 8
+            analysis = {"Analysis" : "BitInformation", "file" : "a.nc",
+                        "version" : 0.1, "groups" : {"/" : {"vars" : {
+                            "tas" : {"type" : "float32", "itemsize" : 4,
+                                     "signbit" : 31, "manbit" : [0, 23],
+                                     "expbit" : [23, 31], "elements" : 100,
+                                     "bitinfo" : bitinfo}}}}}
+            with open(path, "w") as fh:
+                json.dump(analysis, fh)
+            self.assertEqual(
+                imported_heavy_modules(["display", "-i", path]), []
+            )
+
+    def test_short_help(self):
+        # the short help of each subcommand matches the start of its help
+        for sub, (module, command, short_help) in SUBCOMMANDS.items():
+            cmd = cic.get_command(None, sub)
+            self.assertTrue(
+                " ".join(cmd.help.split()).startswith(short_help[:40]), sub
+            )
+
+    @unittest.skipUnless(os.environ.get(BENCHMARK_ENV),
+                         f"{BENCHMARK_ENV} is not set")
+    def test_benchmark(self):
+        # importing each subcommand should be much quicker than importing
+        # numpy
+        times = benchmark(repeat=3)
+        for k in times:
+            if k.startswith("cic"):
+                self.assertLess(times[k], times["numpy"] / 2, k)
+
+if __name__ == '__main__':
+    if "--benchmark" in sys.argv:
+        for k, t in benchmark().items():
+            print(f"import {k:<20}{t*1000:>8.1f} ms")
+    else:
+        unittest.main()
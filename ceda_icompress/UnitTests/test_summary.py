@@ -0,0 +1,77 @@
+import unittest
+import os
+import json
+import tempfile
+import numpy as np
+
+from ceda_icompress.IO.analysisfile import write_analysis
+from ceda_icompress.InfoMeasures.keepbits import keepbits
+from ceda_icompress.InfoMeasures.summary import (analysis_files,
+    summarise_variable, summarise_file, summarise_files)
+from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+
+def make_analysis(seed):
+    """Make an analysis dictionary like the output of cic_analyse"""
+    rng = np.random.default_rng(seed)
+    analysis = {"Analysis" : "BitInformation",
+                "file" : f"/tmp/test{seed}.nc",
+                "groups" : {"/" : {"vars" : {}}},
+                "version" : CIC_FILE_FORMAT_VERSION}
+    for v in ["tas", "pr"]:
+        analysis["groups"]["/"]["vars"][v] = {
+            "type" : "float32", "itemsize" : 4, "signbit" : 31,
+            "manbit" : [0, 23], "expbit" : [23, 31], "elements" : 1000,
+            "bitinfo" : rng.random(32).tolist(),
+        }
+    return analysis
+
+class summaryTest(unittest.TestCase):
+    """Test the summary of many analysis files."""
+    def test_variable(self):
+        variable = make_analysis(1)["groups"]["/"]["vars"]["tas"]
+        bi = variable["bitinfo"]
+        row = summarise_variable(variable, [0.99, 0.9999])
+        for ci in [0.99, 0.9999]:
+            self.assertEqual(
+                row[f"keepbits_{ci}"],
+                keepbits(np.array(bi), [0, 23], 1000, ci)
+            )
+        self.assertAlmostEqual(row["info_sign"], bi[31])
+        self.assertAlmostEqual(row["info_exponent"], sum(bi[23:31]))
+        self.assertAlmostEqual(row["info_mantissa"], sum(bi[0:23]))
+        self.assertEqual(row["elements"], 1000)
+
+    def test_files(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.mkdir(os.path.join(tmp, "sub"))
+            paths = []
+            for i in range(0, 6):
+                fmt = "json" if i % 2 else "npz"
+                path = os.path.join(tmp, "sub" if i > 2 else "",
+                                    f"a{i}.{fmt if fmt == 'npz' else 'cic'}")
+                write_analysis(make_analysis(i), path, fmt)
+                paths.append(path)
+            # a file that cannot be read
+            bad = os.path.join(tmp, "bad.cic")
+            with open(bad, "w") as fh:
+                fh.write("not json")
+            # a directory is searched recursively, in order
+            found = list(analysis_files([tmp]))
+            self.assertEqual(len(found), 7)
+            self.assertEqual(
+                list(analysis_files([os.path.join(tmp, "sub", "*.npz")])),
+                [p for p in paths[3:] if p.endswith(".npz")]
+            )
+            serial = list(summarise_files(found, [0.99], workers=1))
+            parallel = list(summarise_files(found, [0.99], workers=3))
+            self.assertEqual(serial, parallel)
+            self.assertEqual(len(serial), 13)
+            errors = [r for r in serial if "error" in r]
+            self.assertEqual([r["file"] for r in errors], [bad])
+            # only one variable
+            rows = summarise_file(paths[0], [0.99], var="pr")
+            self.assertEqual([r["var"] for r in rows], ["pr"])
+            json.dumps(serial)
+
+if __name__ == '__main__':
+    unittest.main()
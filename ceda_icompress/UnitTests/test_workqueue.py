@@ -0,0 +1,138 @@
+import unittest
+import os
+import tempfile
+import time
+import asyncio
+import threading
+from multiprocessing import Pool
+import numpy as np
+from netCDF4 import Dataset
+
+from ceda_icompress.Batch.workqueue import WorkQueue
+from ceda_icompress.Batch.runner import BatchRunner
+
+def claim_all(path):
+    """Claim as many stages as possible from another process"""
+    queue = WorkQueue(path)
+    return [n for n in range(0, 50) if queue.claim("compress", f"f{n}.nc")]
+
+class workqueueTest(unittest.TestCase):
+    """Test the claims and results of the shared work queue."""
+    def test_claim(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            q1 = WorkQueue(tmp)
+            q2 = WorkQueue(tmp)
+            self.assertTrue(q1.claim("compress", "a.nc"))
+            self.assertFalse(q2.claim("compress", "a.nc"))
+            # finished stages cannot be claimed
+            q1.record("compress", "a.nc", "ok", time=1.0, bytes_in=10,
+                      bytes_out=5)
+            self.assertTrue(q2.done("compress", "a.nc"))
+            self.assertFalse(q2.claim("compress", "a.nc"))
+            s = q2.summary()
+            self.assertEqual(s["compress"]["ok"], 1)
+            self.assertEqual(s["compress"]["bytes_out"], 5)
+
+    def test_failed(self):
+        # failed stages can be claimed again
+        with tempfile.TemporaryDirectory() as tmp:
+            q1 = WorkQueue(tmp)
+            q2 = WorkQueue(tmp)
+            self.assertTrue(q1.claim("compress", "a.nc"))
+            q1.record("compress", "a.nc", "failed", error="error")
+            self.assertFalse(q2.done("compress", "a.nc"))
+            self.assertTrue(q2.claim("compress", "a.nc"))
+
+    def test_retry(self):
+        # a stage that failed is tried again when the batch is run again
+        with tempfile.TemporaryDirectory() as tmp:
+            input = os.path.join(tmp, "in.nc")
+            entries = [{"input" : input,
+                        "analysis" : os.path.join(tmp, "in.cic"),
+                        "output" : os.path.join(tmp, "out.nc"),
+                        "var" : None, "group" : None, "axis" : None}]
+            queue = WorkQueue(os.path.join(tmp, "queue"), poll=0.1)
+            # the input does not exist yet, so the analysis fails
+            counts = asyncio.run(BatchRunner(entries, queue, {}).run())
+            self.assertEqual(counts, {"ok" : 0, "skipped" : 0, "failed" : 2})
+            self.assertEqual(queue.result("analyse", entries[0]["analysis"])
+                             ["status"], "failed")
+            ds = Dataset(input, "w")
+            ds.createDimension("x", 64)
+            v = ds.createVariable("tas", "f4", ("x",))
+            v[:] = np.linspace(270.0, 290.0, 64)
+            ds.close()
+            counts = asyncio.run(BatchRunner(entries, queue, {}).run())
+            self.assertEqual(counts, {"ok" : 2, "skipped" : 0, "failed" : 0})
+            self.assertTrue(queue.done("analyse", entries[0]["analysis"]))
+            self.assertTrue(queue.done("compress", entries[0]["output"]))
+            self.assertTrue(os.path.exists(entries[0]["output"]))
+
+    def test_shared(self):
+        # two runners on the same queue each run some of the entries, as a
+        # runner only claims the stages it has a free slot for
+        with tempfile.TemporaryDirectory() as tmp:
+            entries = []
+            for n in range(0, 6):
+                input = os.path.join(tmp, f"in{n}.nc")
+                ds = Dataset(input, "w")
+                ds.createDimension("x", 64)
+                v = ds.createVariable("tas", "f4", ("x",))
+                v[:] = np.linspace(270.0, 290.0 + n, 64)
+                ds.close()
+                entries.append({"input" : input,
+                                "analysis" : os.path.join(tmp, f"in{n}.cic"),
+                                "output" : os.path.join(tmp, f"out{n}.nc"),
+                                "var" : None, "group" : None, "axis" : None})
+            queue_dir = os.path.join(tmp, "queue")
+            counts = [None, None]
+            def run(i):
+                queue = WorkQueue(queue_dir, poll=0.05)
+                counts[i] = asyncio.run(BatchRunner(entries, queue, {}).run())
+            threads = [threading.Thread(target=run, args=(i,))
+                       for i in range(0, 2)]
+            # start the second runner once the first has claimed a stage,
+            # counting the claims held while they run
+            threads[0].start()
+            claims_dir = os.path.join(queue_dir, "claims")
+            claims = [0]
+            while threads[0].is_alive():
+                if os.path.isdir(claims_dir):
+                    claims.append(len(os.listdir(claims_dir)))
+                if threads[1].ident is None and max(claims) > 0:
+                    threads[1].start()
+                time.sleep(0.01)
+            if threads[1].ident is None:
+                threads[1].start()
+            for t in threads:
+                t.join()
+            # each runner claims one analysis and one compression at once
+            self.assertLessEqual(max(claims), 4)
+            for c in counts:
+                self.assertEqual(c["failed"], 0)
+                self.assertGreater(c["ok"], 0)
+            self.assertEqual(counts[0]["ok"] + counts[1]["ok"], 12)
+            for e in entries:
+                self.assertTrue(os.path.exists(e["output"]))
+
+    def test_stale(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            q1 = WorkQueue(tmp, stale_timeout=60)
+            q2 = WorkQueue(tmp, stale_timeout=60)
+            self.assertTrue(q1.claim("analyse", "a.cic"))
+            # the claim is requeued once it has not been touched for longer
+            # than the stale timeout
+            os.utime(q1._claim_path("analyse", "a.cic"), (0, 0))
+            self.assertTrue(q2.claim("analyse", "a.cic"))
+            self.assertFalse(q1.claim("analyse", "a.cic"))
+
+    def test_processes(self):
+        # each stage should be claimed by exactly one process
+        with tempfile.TemporaryDirectory() as tmp:
+            with Pool(4) as pool:
+                claimed = pool.map(claim_all, [tmp] * 4)
+            all_claimed = sorted(n for c in claimed for n in c)
+            self.assertEqual(all_claimed, list(range(0, 50)))
+
+if __name__ == '__main__':
+    unittest.main()
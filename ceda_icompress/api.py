@@ -0,0 +1,514 @@
+"""The library interface to ceda-icompress, for programs that analyse and
+compress many files without starting a new process for each one.
+
+The functions here do not print (unless debug is set) or exit.  Errors raise
+an exception derived from CICError, and the results are returned as objects
+containing the analysis or the statistics of the compression.  The command
+line interfaces (cic_analyse, cic_compress) are wrappers around them.
+
+    from ceda_icompress import api
+    res = api.analyse_dataset("tas.nc", var=["tas"])
+    out = api.compress_dataset("tas.nc", "tas_c.nc", res.analysis,
+                               {"conf_int" : 0.99, "deflate" : 4})
+    print(out.ratio, out.timings)
+"""
+
+import os
+import time
+import tempfile
+from contextlib import nullcontext
+from datetime import datetime
+from netCDF4 import Dataset
+
+from ceda_icompress.CLI import CIC_FILE_FORMAT_VERSION
+from ceda_icompress.Core.errors import (CICError, InputFileError,
+    OutputFileError, NotFoundError, AnalysisMismatchError, MethodError,
+    UnsupportedTypeError, ParameterError)
+from ceda_icompress.Core.analysis import (load_dataset, get_groups, get_vars,
+    analyse_var, analyse_array)
+from ceda_icompress.Core.compression import (process, check_analysis,
+    estimate_groups, get_method, MethodCache, METHODS, INT_METHODS)
+from ceda_icompress.Core.shards import process_shards
+from ceda_icompress.IO.analysisfile import (load_analysis, write_analysis,
+    AnalysisFileError)
+from ceda_icompress.IO import chunkcopy
+from ceda_icompress.IO.chunkcopy import var_path
+from ceda_icompress.IO.journal import Journal, journal_path, journal_header
+from ceda_icompress.IO.slabs import DEFAULT_SLAB_BYTES
+from ceda_icompress.Estimate.predictor import DEFAULT_SAMPLES
+from ceda_icompress.Core.defaults import DEFAULT_MEMORY_BYTES
+from ceda_icompress.InfoMeasures.errorstats import ErrorStats
+from ceda_icompress.BitManipulation.pack import Pack
+from ceda_icompress.Conversion.narrowing import TypeScan
+from ceda_icompress.Kernels.registry import (set_kernel_backend,
+    set_kernel_threads)
+
+# the initial size of an output file compressed in memory, which grows as it is
+# written
+MEMORY_INITIAL_BYTES = 1024 * 1024
+# the parameters of the compression, and their defaults
+DEFAULT_PARAMS = {"conf_int"   : 0.99,
+                  "deflate"    : 1,
+                  "method"     : "bitshave",
+                  "int_method" : "intround",
+                  "conv_int"   : False,
+                  "conv_float" : False,
+                  "narrow"     : False,
+                  "chunk_copy" : True,
+                  "verify"     : False,
+                  "samples"    : DEFAULT_SAMPLES,
+                  "debug"      : False,
+                  "slab_bytes" : DEFAULT_SLAB_BYTES,
+                  "resume"     : False,
+                  "workers"    : 1}
+
+def compression_params(params=None):
+    """Get the parameters of the compression, with the defaults filled in.
+
+    Args:
+        params (dict|None) : the parameters to set, see DEFAULT_PARAMS
+
+    Returns:
+        dict: all of the parameters
+    Raises:
+        ParameterError: if a parameter is not known
+    """
+    full = dict(DEFAULT_PARAMS)
+    if params is not None:
+        for p in params:
+            if p not in DEFAULT_PARAMS:
+                raise ParameterError(f"Unknown compression parameter: {p}")
+        full.update(params)
+    return full
+
+
+def _open_analysis(analysis):
+    """The analysis can be given as a dictionary or the name of a file.  Use
+    as a context manager, which closes the file once the analysis is no
+    longer needed."""
+    if isinstance(analysis, (str, os.PathLike)):
+        return load_analysis(analysis)
+    return nullcontext(analysis)
+
+
+def _as_list(names):
+    """Names of variables or groups can be given as a string or a list"""
+    if isinstance(names, str):
+        return names.split(",")
+    return names
+
+
+class AnalysisResult:
+    """The result of analysing a dataset"""
+
+    def __init__(self, analysis, timings, elapsed):
+        """
+        Args:
+            analysis (dict) : the analysis, which can be written to a file
+                              with write_analysis or passed to
+                              compress_dataset
+            timings (dict)  : the time taken to analyse each variable, keyed
+                              by the path of the variable
+            elapsed (float) : the total time taken
+        """
+        self.analysis = analysis
+        self.timings = timings
+        self.elapsed = elapsed
+
+    def write(self, path, format="json"):
+        """Write the analysis to a file, see write_analysis"""
+        write_analysis(self.analysis, path, format)
+
+
+class CompressionResult:
+    """The result of compressing a dataset"""
+
+    def __init__(self, file, output, errors, timings, elapsed, data=None):
+        """
+        Args:
+            file (str)         : the input file
+            output (str|None)  : the output file, None if it is in memory
+            errors (dict)      : the error statistics of each bit manipulated
+                                 variable, if params["verify"] was set
+            timings (dict)     : the time taken to process each variable
+            elapsed (float)    : the total time taken
+            data (memoryview)  : the contents of the output file, if it was
+                                 written in memory
+        Side effects:
+            self.bytes_in (int)  : size of the input file
+            self.bytes_out (int) : size of the output file
+        """
+        self.file = file
+        self.output = output
+        self.errors = errors
+        self.timings = timings
+        self.elapsed = elapsed
+        self.data = data
+        self.bytes_in = os.path.getsize(file)
+        if data is not None:
+            self.bytes_out = data.nbytes
+        else:
+            self.bytes_out = os.path.getsize(output)
+
+    @property
+    def ratio(self):
+        """Size of the output file, as a fraction of the input file"""
+        return self.bytes_out / self.bytes_in if self.bytes_in else 1.0
+
+
+class ArrayCompressionResult:
+    """The result of compressing an array"""
+
+    def __init__(self, data, nsb, mask, method, errors=None, pack=None):
+        """
+        Args:
+            data (numpy array) : the bit manipulated (or packed) array
+            nsb (int)          : the number of significant bits retained
+            mask (int)         : the bit mask used by the method
+            method (str)       : the bit manipulation method
+            errors (dict|None) : the error statistics, if requested
+            pack (Pack|None)   : the packing, if the method is pack
+        Side effects:
+            self.scale_factor, self.add_offset, self.fill_value : to unpack
+                                 the data, if the method is pack, else None
+        """
+        self.data = data
+        self.nsb = nsb
+        self.mask = mask
+        self.method = method
+        self.errors = errors
+        self.scale_factor = None if pack is None else pack.scale_factor
+        self.add_offset = None if pack is None else pack.add_offset
+        self.fill_value = None if pack is None else pack.fill_value
+
+
+def analyse_dataset(file, var=None, group=None, tstart=None, tend=None,
+                    level=None, axis=0, debug=False, batch=None):
+    """Analyse the variables in the groups of a netCDF file.
+
+    Args:
+        file (str)                 : the netCDF file to analyse
+        var (str|list<str>|None)   : the variables to analyse, None for all
+        group (str|list<str>|None) : the groups to analyse, None for all
+        tstart, tend (int|None)    : the time steps to analyse
+        level (int|None)           : the level to analyse
+        axis (int)                 : the axis to analyse along
+        debug (bool)               : provide debug info
+        batch (str|list<str>|None) : the dimensions to also get the
+                                     bitinformation for each index of, e.g.
+                                     each level
+
+    Returns:
+        AnalysisResult: the analysis, and the time taken
+    Raises:
+        InputFileError: if the file cannot be opened
+        NotFoundError: if a variable or group is not in the file
+    """
+    st = time.time()
+    ds = load_dataset(file)
+    try:
+        grps = get_groups(ds, _as_list(group))
+        analysis = {"Analysis" : "BitInformation",
+                    "date" : datetime.now().isoformat(),
+                    "file" : os.path.abspath(file),
+                    "groups" : {},
+                    "version" : CIC_FILE_FORMAT_VERSION,
+                   }
+        timings = {}
+        for g in grps:
+            grp_dict = {"vars" : {}}
+            for v in get_vars(g, _as_list(var)):
+                vst = time.time()
+                var_dict = analyse_var(
+                    v, tstart, tend, level, axis, debug, _as_list(batch)
+                )
+                timings[var_path(v)] = time.time() - vst
+                if var_dict != {}:
+                    grp_dict["vars"][v.name] = var_dict
+            analysis["groups"][g.name] = grp_dict
+    finally:
+        ds.close()
+    return AnalysisResult(analysis, timings, time.time() - st)
+
+
+def compress_dataset(file, output, analysis, params=None, force=False,
+                     methods=None):
+    """Compress a netCDF file, using the analysis, writing to the output file.
+
+    Args:
+        file (str)          : the netCDF file to compress
+        output (str)        : the netCDF file to write
+        analysis (dict|str) : the analysis, or the name of an analysis file
+        params (dict|None)  : the parameters of the compression, see
+                              DEFAULT_PARAMS
+        force (bool)        : compress even if the file does not match the
+                              file named in the analysis
+        methods (MethodCache) : a cache of the bit manipulations, to reuse
+                                over many calls (default: None), not used
+                                if params["workers"] is more than one
+
+    Returns:
+        CompressionResult: the sizes, timings and error statistics
+    Raises:
+        AnalysisFileError: if the analysis file cannot be read
+        AnalysisMismatchError: if the analysis does not match the file
+        MethodError: if the method is not known
+        InputFileError, OutputFileError: if the files cannot be opened
+        ParameterError: if the workers are invalid, or used with resume
+    """
+    with _open_analysis(analysis) as analysis:
+        return _compress_dataset(file, output, analysis, params, force,
+                                 methods)
+
+
+def compress_dataset_to_memory(file, analysis, params=None, force=False,
+                               methods=None, max_bytes=DEFAULT_MEMORY_BYTES):
+    """Compress a netCDF file, using the analysis, into memory rather than to
+    a file (using the diskless mode of netCDF4), so that the output can be
+    sent on, e.g. to a pipe or an upload, without writing it to disk and
+    reading it back.  As the size of the output is not known until it has
+    been written, the size of the input file is used to bound it: if the
+    input file is larger than max_bytes, the output is written to a temporary
+    file instead.  The chunks of variables are not copied directly (see
+    params["chunk_copy"]), as that needs a file.
+
+    Args:
+        file (str)          : the netCDF file to compress
+        analysis (dict|str) : the analysis, or the name of an analysis file
+        params (dict|None)  : the parameters of the compression, see
+                              DEFAULT_PARAMS
+        force (bool)        : compress even if the file does not match the
+                              file named in the analysis
+        methods (MethodCache) : a cache of the bit manipulations, to reuse
+                                over many calls (default: None)
+        max_bytes (int)     : the largest input file to compress in memory
+
+    Returns:
+        CompressionResult: the sizes, timings and error statistics, with the
+                           output file as a memoryview in data, or, if the
+                           input file is larger than max_bytes, the name of
+                           the temporary file in output, which the caller
+                           should remove
+    Raises:
+        as compress_dataset
+        ParameterError: if resume, or more than one worker, is requested
+    """
+    params = compression_params(params)
+    if params["resume"] or params["workers"] > 1:
+        raise ParameterError(
+            "A compression in memory cannot be resumed or use more than one "
+            "worker"
+        )
+    try:
+        in_memory = os.path.getsize(file) <= max_bytes
+    except OSError as e:
+        raise InputFileError(str(e))
+    with _open_analysis(analysis) as analysis:
+        if in_memory:
+            params["chunk_copy"] = False
+            return _compress_dataset(file, None, analysis, params, force,
+                                     methods)
+        fd, tmp = tempfile.mkstemp(suffix=".nc")
+        os.close(fd)
+        try:
+            return _compress_dataset(file, tmp, analysis, params, force,
+                                     methods)
+        except Exception:
+            os.remove(tmp)
+            raise
+
+
+def _compress_dataset(file, output, analysis, params, force, methods):
+    """Compress the file to the output file, or into memory if output is None,
+    see compress_dataset"""
+    st = time.time()
+    params = compression_params(params)
+    file = os.path.abspath(file)
+    if output is not None:
+        output = os.path.abspath(output)
+    check_analysis(file, analysis, params, force)
+
+    # check that we aren't going to overwrite the input with the output
+    if file == output:
+        raise OutputFileError("Input and output file are the same")
+    if params["workers"] < 1:
+        raise ParameterError(
+            f"The number of workers must be at least 1: {params['workers']}"
+        )
+    if params["workers"] > 1 and params["resume"]:
+        raise ParameterError(
+            "A compression with more than one worker cannot be resumed"
+        )
+
+    # open the input file first, so that a missing input does not leave an
+    # empty output file
+    input_ds = load_dataset(file)
+    if params["debug"]:
+        paramstr = ""
+        for p in params:
+            paramstr += f"    {p:<12}: {params[p]}\n"
+        print(f"Processing compression on file: \n"
+              f"    {file}\n"
+              f"with parameters: \n"
+              f"{paramstr[:-1]}")
+    # each variable is compressed into a shard by one of the workers, and the
+    # shards stitched into the output, which needs h5py
+    if params["workers"] > 1 and chunkcopy.h5py is not None:
+        try:
+            report = process_shards(input_ds, output, analysis, params,
+                                    params["workers"])
+        finally:
+            input_ds.close()
+        return _compression_result(file, output, report, params, st)
+    if params["workers"] > 1 and params["debug"]:
+        print("Not compressing the variables in parallel: h5py is not "
+              "installed")
+    # the journal records the progress, so that an interrupted compression
+    # can be resumed by appending to the partial output
+    journal = None
+    mode = "w"
+    if params["resume"]:
+        jpath = journal_path(output)
+        resume = os.path.exists(jpath) and os.path.exists(output)
+        try:
+            journal = Journal(jpath, journal_header(file, analysis, params),
+                              resume)
+        except OutputFileError:
+            input_ds.close()
+            raise
+        if resume:
+            mode = "a"
+            if params["debug"]:
+                print(f"Resuming compression from journal: {jpath}")
+    # open the output file - do this before the processing so an error in
+    # created before the (long) processing time
+    try:
+        if output is None:
+            # the name is not used by the diskless mode, but has to be given
+            output_ds = Dataset(os.path.basename(file), "w",
+                                format="NETCDF4", memory=MEMORY_INITIAL_BYTES)
+        else:
+            output_ds = Dataset(output, mode, format="NETCDF4")
+    except Exception as e:
+        input_ds.close()
+        if journal is not None:
+            journal.close()
+        raise OutputFileError(
+            f"Could not open output file {str(output)}, reason: {e}"
+        )
+
+    data = None
+    try:
+        report = process(input_ds, output_ds, analysis, params, methods,
+                         journal)
+        # closing a dataset in memory returns its contents
+        if output_ds.isopen():
+            data = output_ds.close()
+    finally:
+        if output_ds.isopen():
+            output_ds.close()
+        input_ds.close()
+        if journal is not None:
+            journal.close()
+    # the output is complete, so there is nothing to resume
+    if journal is not None:
+        journal.remove()
+    return _compression_result(file, output, report, params, st, data)
+
+
+def _compression_result(file, output, report, params, st, data=None):
+    """Split the report of process into the timings and errors"""
+    timings = {p : report[p].pop("seconds") for p in report}
+    errors = {}
+    if params["verify"]:
+        errors = {p : report[p] for p in report if report[p] != {}}
+    return CompressionResult(file, output, errors, timings, time.time() - st,
+                             data)
+
+
+def estimate_dataset(file, analysis, params=None, force=False):
+    """Estimate the size of the compressed file, and the time taken to
+    compress it, without writing anything.
+
+    Args:
+        file (str)          : the netCDF file to compress
+        analysis (dict|str) : the analysis, or the name of an analysis file
+        params (dict|None)  : the parameters of the compression
+        force (bool)        : estimate even if the file does not match the
+                              file named in the analysis
+
+    Returns:
+        dict: the estimate of each variable, and the total
+    """
+    params = compression_params(params)
+    file = os.path.abspath(file)
+    estimate = {}
+    with _open_analysis(analysis) as analysis:
+        check_analysis(file, analysis, params, force)
+        input_ds = load_dataset(file)
+        try:
+            estimate_groups(input_ds, analysis, params, estimate)
+        finally:
+            input_ds.close()
+    # the bounds of the total are the sums of the bounds of the variables,
+    # which is conservative
+    total = {}
+    for k in ["uncompressed_bytes", "bytes", "bytes_low", "bytes_high",
+              "seconds"]:
+        total[k] = sum(e.get(k, 0) for e in estimate.values())
+    return {"vars" : estimate, "total" : total}
+
+
+def compress_array(A, analysis=None, method="bitshave", ci=0.99, nsb=None,
+                   verify=False, int_method="intround"):
+    """Apply the bit manipulation to an array.
+
+    Args:
+        A (numpy array)      : the (possibly masked) array to compress
+        analysis (dict|None) : the analysis of the array, from analyse_array
+        method (str)         : the bit manipulation method
+        ci (float)           : the confidence interval - how much information
+                               to retain
+        nsb (int|None)       : the number of significant bits to retain,
+                               rather than deriving them from the analysis
+        verify (bool)        : calculate the error statistics
+        int_method (str)     : the bit manipulation method, if the array is
+                               an integer type
+
+    Returns:
+        ArrayCompressionResult: the bit manipulated array
+    Raises:
+        MethodError: if the method is not known
+        ParameterError: if neither the analysis or nsb are given
+        UnsupportedTypeError: if the array is not floating point or integer
+    """
+    if method not in METHODS:
+        raise MethodError(f"Unknown bit manipulation method: {method}")
+    if int_method not in INT_METHODS:
+        raise MethodError(
+            f"Unknown integer bit manipulation method: {int_method}"
+        )
+    if analysis is None and (nsb is None or method == "bitmask"):
+        raise ParameterError(f"The {method} method needs the analysis, "
+                             "or the number of significant bits")
+    Va = dict(analysis) if analysis is not None else {}
+    if nsb is not None:
+        Va["retainbits"] = nsb
+    man = get_method(A, Va, {"method" : method, "conf_int" : ci,
+                             "int_method" : int_method})
+    pack = None
+    if isinstance(man, Pack):
+        # pack into the range of the array
+        pack = man
+        scan = TypeScan(A.dtype)
+        scan.update(A)
+        pack.set_range(scan.vmin, scan.vmax)
+    B = man.process(A)
+    errors = None
+    if verify:
+        stats = ErrorStats(Va.get("bitinfo"), man.keep_mask,
+                           A.dtype.itemsize*8)
+        stats.update(A, B if pack is None else pack.unpack(B))
+        errors = stats.results()
+    return ArrayCompressionResult(B, int(man.NSB), man.mask, man.method,
+                                  errors, pack)
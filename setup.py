@@ -41,9 +41,14 @@ setup(
     ],
     entry_points = {
         'console_scripts': [
+            'cic=ceda_icompress.CLI.cic:main',
             'cic_analyse=ceda_icompress.CLI.cic_analyse:main',
             'cic_compress=ceda_icompress.CLI.cic_compress:main',
-            'cic_display=ceda_icompress.CLI.cic_display:main'
+            'cic_display=ceda_icompress.CLI.cic_display:main',
+            'cic_batch=ceda_icompress.CLI.cic_batch:main',
+            'cic_explore=ceda_icompress.CLI.cic_explore:main',
+            'cic_server=ceda_icompress.CLI.cic_server:main',
+            'cic_submit=ceda_icompress.CLI.cic_submit:main'
         ]
     }
 )